@@ -0,0 +1 @@
+"""Shared LaTeX compile engine used by the resume, letter and report APIs."""
@@ -0,0 +1,69 @@
+import re
+from typing import Dict, Optional
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import FileResponse
+
+from engine.pdf_cache import pdf_cache
+from engine.store import find_blob, touch_output
+
+ARTIFACT_ID_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """True if the request's If-None-Match already names this ETag."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [value.strip() for value in header.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def not_modified(request: Request, headers: Dict[str, str]) -> Response:
+    """
+    The answer to a matching If-None-Match: 304 for GET and HEAD. Any other
+    method (a POST that builds the document) fails the precondition with 412,
+    as RFC 9110 requires.
+    """
+    return Response(status_code=304 if request.method in ("GET", "HEAD") else 412, headers=headers)
+
+
+def artifact_file(artifact_id: str) -> str:
+    """
+    The PDF behind an artifact id: its PDF cache entry or, once the cache has
+    evicted it, the output store's copy. 404 if neither has it.
+    """
+    path: Optional[str] = pdf_cache.get(artifact_id) or find_blob(artifact_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    return path
+
+
+def pdf_response(request: Request, path: str, etag: str, filename: str,
+                 immutable: bool = False) -> Response:
+    """
+    Sends a PDF straight from disk. FileResponse streams the file without
+    loading it into memory (zero-copy where the server supports pathsend) and
+    answers Range requests; a matching If-None-Match gets an empty 304 (412 on a POST).
+    """
+    headers = {"ETag": etag}
+    if immutable:
+        # Artifact ids are content hashes, so a given URL never changes
+        headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    if etag_matches(request, etag):
+        return not_modified(request, headers)
+    return FileResponse(path, media_type="application/pdf", filename=filename, headers=headers)
+
+
+artifact_router = APIRouter()
+
+
+@artifact_router.get("/artifacts/{artifact_id}")
+async def get_artifact(artifact_id: str, request: Request):
+    """Downloads a generated PDF by the artifact_id returned from a generate call."""
+    if not ARTIFACT_ID_RE.match(artifact_id):
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    path = artifact_file(artifact_id)
+    # Keeps its published copies from looking unused to the output store
+    await touch_output(artifact_id=artifact_id)
+    return pdf_response(request, path, f'"{artifact_id}"', f"{artifact_id[:16]}.pdf", immutable=True)
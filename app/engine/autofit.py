@@ -0,0 +1,161 @@
+import asyncio
+import os
+import re
+import zlib
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from engine.compile_pool import MAX_CONCURRENT_COMPILES
+from engine.pdf_cache import pdf_cache
+from engine.render import insert_before_document
+
+# Candidate layouts compiled at the same time while searching for one that fits
+AUTOFIT_PARALLEL = int(os.environ.get("LATEX_AUTOFIT_PARALLEL", str(MAX_CONCURRENT_COMPILES)))
+
+PAGES_COUNT_RE = re.compile(rb"/Type\s*/Pages\b[^>]*?/Count\s+(\d+)|/Count\s+(\d+)[^>]*?/Type\s*/Pages\b")
+# A stream with its dictionary (which has no nested dictionaries in the streams we look at)
+STREAM_RE = re.compile(rb"<<([^<>]*)>>\s*stream\r?\n(.*?)endstream", re.S)
+
+
+def _counts(data: bytes) -> List[int]:
+    return [int(a or b) for a, b in PAGES_COUNT_RE.findall(data)]
+
+
+def page_count(pdf_path: str) -> int:
+    """
+    Number of pages in a PDF, read from its page tree's /Count. pdfTeX usually
+    puts the page tree in a compressed object stream; only those are inflated
+    (never the page contents or fonts), and only if the tree isn't in plain
+    sight. Reads the whole file, so call it off the event loop.
+    """
+    with open(pdf_path, "rb") as f:
+        data = f.read()
+    counts = _counts(data)
+    if not counts:
+        for match in STREAM_RE.finditer(data):
+            if b"/ObjStm" not in match.group(1):
+                continue
+            try:
+                counts += _counts(zlib.decompress(match.group(2).rstrip(b"\r\n")))
+            except zlib.error:
+                continue
+    return max(counts) if counts else 0
+
+
+class Layout:
+    """
+    One setting of the layout knobs. The defaults leave the template as it is;
+    everything is set up just before \\begin{document}, so it works with the
+    template's cached format.
+    """
+
+    def __init__(self, font_size: Optional[float] = None, margin: float = 0.0,
+                 vspace_scale: float = 1.0, item_sep: Optional[float] = None):
+        self.font_size = font_size        # \normalsize in pt (\small is 1pt less)
+        self.margin = margin              # inches taken off each page margin
+        self.vspace_scale = vspace_scale  # factor on every \vspace (the template's are negative)
+        self.item_sep = item_sep          # itemsep of lists in pt, if enumitem is loaded
+
+    def latex(self) -> str:
+        lines = ["\\makeatletter"]
+        if self.font_size is not None:
+            size, small = self.font_size, self.font_size - 1
+            lines += [
+                "\\let\\autofit@normalsize\\normalsize",
+                f"\\renewcommand{{\\normalsize}}{{\\autofit@normalsize\\fontsize{{{size:g}}}{{{size * 1.2:g}}}\\selectfont}}",
+                "\\let\\autofit@small\\small",
+                f"\\renewcommand{{\\small}}{{\\autofit@small\\fontsize{{{small:g}}}{{{small * 1.2:g}}}\\selectfont}}",
+                "\\AtBeginDocument{\\normalsize}",
+            ]
+        if self.margin:
+            lines += [
+                f"\\addtolength{{\\textheight}}{{{2 * self.margin:g}in}}",
+                f"\\addtolength{{\\topmargin}}{{-{self.margin:g}in}}",
+                f"\\addtolength{{\\textwidth}}{{{2 * self.margin:g}in}}",
+                f"\\addtolength{{\\oddsidemargin}}{{-{self.margin:g}in}}",
+                f"\\addtolength{{\\evensidemargin}}{{-{self.margin:g}in}}",
+            ]
+        if self.vspace_scale != 1.0:
+            lines += [
+                "\\let\\autofit@vspace\\@vspace",
+                f"\\def\\@vspace#1{{\\autofit@vspace{{{self.vspace_scale:g}\\dimexpr#1\\relax}}}}",
+                "\\let\\autofit@vspacer\\@vspacer",
+                f"\\def\\@vspacer#1{{\\autofit@vspacer{{{self.vspace_scale:g}\\dimexpr#1\\relax}}}}",
+            ]
+        if self.item_sep is not None:
+            lines.append(f"\\@ifpackageloaded{{enumitem}}{{\\setlist{{itemsep={self.item_sep:g}pt,parsep=0pt}}}}{{}}")
+        lines.append("\\makeatother")
+        return "\n".join(lines) + "\n" if len(lines) > 2 else ""
+
+    def apply(self, latex_code: str) -> str:
+        setup = self.latex()
+        return insert_before_document(latex_code, setup) if setup else latex_code
+
+    def as_dict(self) -> Dict[str, Optional[float]]:
+        return {
+            "font_size": self.font_size,
+            "margin": self.margin,
+            "vspace_scale": self.vspace_scale,
+            "item_sep": self.item_sep,
+        }
+
+
+# From the template as designed to the tightest layout still worth reading
+LAYOUTS: List[Layout] = [
+    Layout(),
+    Layout(vspace_scale=1.5),
+    Layout(vspace_scale=1.5, item_sep=0),
+    Layout(vspace_scale=1.5, item_sep=0, margin=0.15),
+    Layout(font_size=10.5, vspace_scale=1.5, item_sep=0, margin=0.15),
+    Layout(font_size=10.5, vspace_scale=2, item_sep=0, margin=0.25),
+    Layout(font_size=10, vspace_scale=2, item_sep=0, margin=0.25),
+    Layout(font_size=9.5, vspace_scale=2, item_sep=0, margin=0.3),
+]
+
+
+async def autofit(build: Callable[[Layout], Awaitable[Dict]], max_pages: int = 1,
+                  parallel: int = AUTOFIT_PARALLEL, layouts: List[Layout] = LAYOUTS) -> Dict:
+    """
+    Finds the loosest layout whose PDF has at most max_pages pages.
+    build(layout) compiles one candidate and returns its result (with
+    "artifact_id"). Up to `parallel` candidates compile at once; as soon as one
+    fits, tighter candidates are cancelled and only looser ones still running
+    are waited for. Returns the winning result (or the tightest, if none fits)
+    with "pages", "fits", "layout" and "candidates" (how many were compiled).
+    """
+    async def attempt(index: int) -> Dict:
+        result = await build(layouts[index])
+        pdf_path = pdf_cache.get(result["artifact_id"]) or result["path"]
+        return {**result, "pages": await asyncio.get_running_loop().run_in_executor(None, page_count, pdf_path)}
+
+    results: Dict[int, Dict] = {}
+    running: Dict[int, asyncio.Task] = {}
+    next_index = 0
+    best: Optional[int] = None
+    try:
+        while True:
+            # Never start a candidate tighter than one that already fits
+            while len(running) < max(1, parallel) and next_index < len(layouts) and (best is None or next_index < best):
+                running[next_index] = asyncio.ensure_future(attempt(next_index))
+                next_index += 1
+            if not running:
+                break
+            done, _ = await asyncio.wait(running.values(), return_when=asyncio.FIRST_COMPLETED)
+            for index in sorted(i for i, task in running.items() if task in done):
+                if index not in running:
+                    continue  # cancelled just now by a better candidate
+                results[index] = running.pop(index).result()
+                if results[index]["pages"] <= max_pages and (best is None or index < best):
+                    best = index
+                    for tighter in [i for i in running if i > index]:
+                        running.pop(tighter).cancel()
+    finally:
+        for task in running.values():
+            task.cancel()
+
+    chosen = best if best is not None else max(results)
+    return {
+        **results[chosen],
+        "fits": best is not None,
+        "layout": layouts[chosen].as_dict(),
+        "candidates": len(results),
+    }
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import os
+import zipfile
+from typing import AsyncIterator, Awaitable, Dict, List, Tuple
+
+from fastapi import HTTPException
+
+from engine.artifacts import artifact_file
+
+
+class _ZipStream:
+    """
+    Write-only file object for zipfile. It has no tell()/seek(), so zipfile
+    writes in streaming mode (data descriptors), and we hand out whatever has
+    been written since the last read.
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _unique_name(name: str, used: set) -> str:
+    """Adds -2, -3, ... before the extension when a batch reuses an output filename."""
+    stem, dot, ext = name.rpartition(".")
+    if not dot:
+        stem, ext = name, ""
+    candidate = name
+    counter = 2
+    while candidate in used:
+        candidate = f"{stem}-{counter}{dot}{ext}"
+        counter += 1
+    used.add(candidate)
+    return candidate
+
+
+async def stream_zip(jobs: List[Tuple[str, Awaitable[Dict]]]) -> AsyncIterator[bytes]:
+    """
+    Runs every (output_filename, build) job concurrently and yields a ZIP
+    archive as the PDFs finish, in completion order. Each build must return a
+    dict with the "artifact_id" and published "path" (and optionally "cached"),
+    or raise. The archive ends with manifest.json giving the status of every item.
+    """
+
+    async def run(index: int, build: Awaitable[Dict]):
+        try:
+            return index, await build, None
+        except HTTPException as e:
+            return index, None, str(e.detail)
+        except Exception as e:
+            return index, None, str(e)
+
+    tasks = [asyncio.ensure_future(run(index, build)) for index, (_, build) in enumerate(jobs)]
+    manifest: List[Dict] = [{} for _ in jobs]
+    used_names: set = set()
+    stream = _ZipStream()
+    loop = asyncio.get_running_loop()
+    try:
+        with zipfile.ZipFile(stream, mode="w", compression=zipfile.ZIP_STORED) as archive:
+            for finished in asyncio.as_completed(tasks):
+                index, result, error = await finished
+                filename = jobs[index][0]
+                if error is not None:
+                    manifest[index] = {"index": index, "output_filename": filename,
+                                       "status": "error", "detail": error}
+                    continue
+                try:
+                    # The content-addressed copy; another build may replace the published one
+                    path = artifact_file(result["artifact_id"])
+                except HTTPException as e:
+                    manifest[index] = {"index": index, "output_filename": filename,
+                                       "status": "error", "detail": str(e.detail)}
+                    continue
+                entry_name = _unique_name(os.path.basename(result["path"]), used_names)
+                # PDFs are already compressed, so store them as-is; reading them happens off the loop
+                await loop.run_in_executor(None, archive.write, path, entry_name)
+                manifest[index] = {"index": index, "output_filename": filename, "status": "ok",
+                                   "file": entry_name, "cached": result.get("cached", False)}
+                yield stream.take()
+            archive.writestr("manifest.json", json.dumps({
+                "total": len(jobs),
+                "succeeded": sum(1 for item in manifest if item["status"] == "ok"),
+                "items": manifest,
+            }, indent=2))
+        yield stream.take()
+    finally:
+        # Client went away (or something failed): don't leave compiles running
+        for task in tasks:
+            task.cancel()
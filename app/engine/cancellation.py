@@ -0,0 +1,100 @@
+import asyncio
+from typing import Awaitable, Dict, Optional, TypeVar
+
+from fastapi import HTTPException, Request
+
+T = TypeVar("T")
+
+# Lets one-shot requests opt in to latest-wins (sessions use their session id)
+DOCUMENT_KEY_HEADER = "X-Document-Key"
+
+
+def document_key(request: Request, kind: str) -> Optional[str]:
+    """The client's key for the document being edited, if it sent one."""
+    key = request.headers.get(DOCUMENT_KEY_HEADER)
+    return f"{kind}:{key}" if key else None
+
+
+async def _client_gone(request: Request):
+    # The body has been read by now, so the next message is the disconnect
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+class LatestWins:
+    """
+    Keeps only the newest build per document key running. A newer request
+    for the same key cancels the older build, which kills its pdflatex
+    (see CompilePool). A build whose client disconnects is cancelled too.
+    """
+
+    def __init__(self):
+        self._generations: Dict[str, int] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self.superseded = 0
+        self.disconnected = 0
+
+    def claim(self, key: str) -> int:
+        """Marks a new request for key, cancelling the build of any older one."""
+        generation = self._generations.get(key, 0) + 1
+        self._generations[key] = generation
+        running = self._running.pop(key, None)
+        if running is not None and not running.done():
+            running.cancel()
+        return generation
+
+    def _superseded(self) -> HTTPException:
+        self.superseded += 1
+        return HTTPException(status_code=409, detail="Superseded by a newer request for this document")
+
+    async def run(self, request: Request, build: Awaitable[T], key: Optional[str] = None,
+                  generation: Optional[int] = None) -> T:
+        """
+        Awaits build unless it is overtaken. Raises 409 if a newer request for
+        the same key arrived, and 499 if the client went away first. Claim the
+        key up front (claim()) when the request waits on something else before
+        building, so it still cancels older builds straight away.
+        """
+        if key is not None:
+            if generation is None:
+                generation = self.claim(key)
+            if self._generations.get(key) != generation:
+                build.close()
+                raise self._superseded()
+
+        task = asyncio.ensure_future(build)
+        if key is not None:
+            self._running[key] = task
+        watcher = asyncio.ensure_future(_client_gone(request))
+        try:
+            await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if not task.done():
+                task.cancel()
+                self.disconnected += 1
+                raise HTTPException(status_code=499, detail="Client closed request")
+            if task.cancelled():
+                raise self._superseded()
+            return task.result()
+        except asyncio.CancelledError:
+            # This request itself was cancelled (e.g. server shutdown); take the build with it
+            task.cancel()
+            raise
+        finally:
+            watcher.cancel()
+            if key is not None:
+                if self._running.get(key) is task:
+                    del self._running[key]
+                if self._generations.get(key) == generation and task.done():
+                    del self._generations[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._running),
+            "superseded": self.superseded,
+            "disconnected": self.disconnected,
+        }
+
+
+latest_wins = LatestWins()
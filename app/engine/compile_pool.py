@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import os
+import subprocess
+import time
+from typing import Dict, List, Optional
+
+from engine.sandbox import (COMPILE_TIMEOUT_SECONDS, TERMINATION_REASONS, CompileTerminated, job_log, kill_group,
+                            limit_resources, log_tail, process_options, sandbox_env, termination_reason)
+
+logger = logging.getLogger(__name__)
+
+# Number of pdflatex processes allowed to run at once (defaults to one per core)
+MAX_CONCURRENT_COMPILES = int(os.environ.get("LATEX_MAX_CONCURRENCY", os.cpu_count() or 1))
+
+
+class CompileResult:
+    """Output of a single pdflatex run plus how long it queued and ran."""
+
+    def __init__(self, args: List[str], returncode: int, stdout: str, stderr: str,
+                 queue_wait: float, run_time: float):
+        self.args = args
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.queue_wait = queue_wait
+        self.run_time = run_time
+
+
+class CompilePool:
+    """
+    Runs LaTeX compiles as asyncio subprocesses so the event loop stays free.
+    At most `max_concurrency` compiles run at once; the rest wait in line.
+    Every run is sandboxed and time-bounded (see engine.sandbox).
+    """
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENT_COMPILES, timeout: float = COMPILE_TIMEOUT_SECONDS):
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_queue_wait = 0.0
+        self.total_run_time = 0.0
+        # Reason -> runs the sandbox stopped for it
+        self.terminations: Dict[str, int] = dict.fromkeys(TERMINATION_REASONS, 0)
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the loop uvicorn is actually running
+        # (a new one after a fork, since the loop that preloaded the app is gone)
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._semaphore
+
+    async def run(self, args: List[str], cwd: Optional[str] = None, check: bool = True,
+                  env: Optional[Dict[str, str]] = None) -> CompileResult:
+        """
+        Runs a compile command once a slot is free. `cwd` is the folder it
+        compiles in, and the only one it may read or write by absolute path.
+        Raises subprocess.CalledProcessError on a non-zero exit when check is True,
+        just like subprocess.run(..., check=True), and CompileTerminated
+        (whatever check is) when the sandbox stopped it.
+        """
+        async def start() -> asyncio.subprocess.Process:
+            process = await asyncio.create_subprocess_exec(
+                *args,
+                cwd=cwd,
+                env={**os.environ, **sandbox_env(cwd), **(env or {})},
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                **process_options(),
+            )
+            limit_resources(process)
+            return process
+        return await self._run(start, args, None, check, cwd)
+
+    async def run_process(self, process: asyncio.subprocess.Process, args: List[str],
+                          input: bytes, check: bool = True, cwd: Optional[str] = None) -> CompileResult:
+        """
+        Like run(), for a process that was started earlier and is waiting on its
+        stdin (see engine.warm). The input is sent once a slot is free, and the
+        timeout counts from then.
+        """
+        async def start() -> asyncio.subprocess.Process:
+            return process
+        return await self._run(start, args, input, check, cwd)
+
+    async def _run(self, start, args: List[str], input: Optional[bytes], check: bool,
+                   cwd: Optional[str]) -> CompileResult:
+        semaphore = self._get_semaphore()
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        started_at = time.perf_counter()
+        queue_wait = started_at - queued_at
+        self.running += 1
+        terminated = None
+        try:
+            process = await start()
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(input), self.timeout)
+            except asyncio.TimeoutError:
+                terminated = "timeout"
+                kill_group(process)
+                await process.wait()
+                stdout, stderr = b"", b""
+            except asyncio.CancelledError:
+                self.terminations["cancelled"] += 1
+                kill_group(process)
+                await process.wait()
+                raise
+        finally:
+            self.running -= 1
+            semaphore.release()
+
+        run_time = time.perf_counter() - started_at
+        self.total_queue_wait += queue_wait
+        self.total_run_time += run_time
+        result = CompileResult(
+            args=list(args),
+            returncode=process.returncode,
+            stdout=stdout.decode("utf-8", errors="replace"),
+            stderr=stderr.decode("utf-8", errors="replace"),
+            queue_wait=queue_wait,
+            run_time=run_time,
+        )
+        if result.returncode == 0:
+            self.completed += 1
+        else:
+            self.failed += 1
+            terminated = terminated or termination_reason(
+                result.returncode, result.stderr, log_tail(job_log(result.args, cwd))
+            )
+            if terminated is not None:
+                self.terminations[terminated] += 1
+                logger.warning("Stopped %s (%s) after %.1fs", os.path.basename(result.args[0]), terminated, run_time)
+                raise CompileTerminated(terminated, os.path.basename(result.args[0]))
+            if check:
+                raise subprocess.CalledProcessError(
+                    result.returncode, result.args, output=result.stdout, stderr=result.stderr
+                )
+        return result
+
+    def stats(self) -> Dict[str, float]:
+        """Current queue depth and cumulative timing counters."""
+        finished = self.completed + self.failed
+        return {
+            "max_concurrency": self.max_concurrency,
+            "waiting": self.waiting,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_queue_wait": self.total_queue_wait / finished if finished else 0.0,
+            "avg_run_time": self.total_run_time / finished if finished else 0.0,
+        }
+
+
+_engine_versions: Dict[str, str] = {}
+
+
+async def engine_version(engine: str = "pdflatex") -> str:
+    """Returns the first line of `<engine> --version`, looked up once per process."""
+    if engine not in _engine_versions:
+        try:
+            process = await asyncio.create_subprocess_exec(
+                engine, "--version",
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            stdout, _ = await process.communicate()
+            lines = stdout.decode("utf-8", errors="replace").splitlines()
+            _engine_versions[engine] = lines[0].strip() if lines else engine
+        except OSError:
+            # Engine not installed; the compile itself will report the error
+            return engine
+    return _engine_versions[engine]
+
+
+# One pool per service process, shared by every generate endpoint in it
+compile_pool = CompilePool()
@@ -0,0 +1,107 @@
+"""
+The TeX engines a document can be compiled with. A template picks one with
+the usual magic comment near its top,
+
+    % !TEX program = lualatex
+
+and otherwise gets LATEX_ENGINE (pdflatex unless set). Each engine knows its
+own command line: batch mode, stop at the first error, no shell escape, how
+to skip writing the PDF on intermediate passes, and whether it can load a
+dumped format (engine.formats, and with it engine.warm).
+"""
+import os
+import re
+import shutil
+from typing import Dict, List, Optional
+
+from engine.texlog import COMPILE_FLAGS
+
+DEFAULT_ENGINE = os.environ.get("LATEX_ENGINE", "pdflatex")
+
+MAGIC_COMMENT_RE = re.compile(r"^[ \t]*%[ \t]*!\s*TEX\s+(?:TS-)?program\s*=\s*([A-Za-z0-9_-]+)",
+                              re.MULTILINE | re.IGNORECASE)
+# Only the top of a template is searched, like editors do
+MAGIC_COMMENT_CHARS = 2048
+
+
+class TexEngine:
+    """How to run one engine. `reruns_itself` engines settle cross-references in a single call."""
+
+    def __init__(self, name: str, flags: List[str], draft_flags: Optional[List[str]] = None,
+                 formats: bool = False, reruns_itself: bool = False, command: Optional[str] = None):
+        self.name = name
+        self.command = command or name
+        self.flags = flags
+        self.draft_flags = draft_flags
+        self.formats = formats
+        self.reruns_itself = reruns_itself
+
+    @property
+    def installed(self) -> bool:
+        return shutil.which(self.command) is not None
+
+    def args(self, tex_path: str, output_folder: str, flags: Optional[List[str]] = None,
+             fmt_name: Optional[str] = None, jobname: Optional[str] = None) -> List[str]:
+        """The command that compiles tex_path into output_folder (against a format, if given)."""
+        flags = self.flags if flags is None else flags
+        fmt = [f"-fmt={fmt_name}", f"-jobname={jobname}"] if fmt_name is not None else []
+        return [self.command, *fmt, *flags, "-output-directory", output_folder, tex_path]
+
+    def format_args(self, build_name: str, output_folder: str, source_path: str) -> List[str]:
+        """The command that dumps source_path (a preamble ending in \\dump) as <build_name>.fmt."""
+        return [self.command, "-ini", "-interaction=batchmode", f"-jobname={build_name}",
+                "-output-directory", output_folder, f"&{self.command}", source_path]
+
+    def warm_args(self, fmt_name: str, output_folder: str) -> List[str]:
+        """A process that loads the format and then reads what to typeset from stdin (see engine.warm)."""
+        return [self.command, f"-fmt={fmt_name}", "-jobname=document", "-interaction=scrollmode",
+                *[flag for flag in self.flags if not flag.startswith("-interaction")],
+                "-output-directory", output_folder]
+
+    def draft(self, args: List[str]) -> List[str]:
+        """Same command for a pass that only collects .aux data and doesn't write the PDF."""
+        if not self.draft_flags:
+            return args
+        return [args[0], *self.draft_flags, *args[1:]]
+
+
+class Tectonic(TexEngine):
+    """
+    Tectonic: self-contained, fetches and caches its own TeX bundle, and
+    reruns (and runs BibTeX) by itself. Untrusted mode keeps shell escape off.
+    """
+
+    def __init__(self):
+        super().__init__("tectonic", ["--keep-logs", "--keep-intermediates", "--untrusted"], reruns_itself=True)
+
+    def args(self, tex_path: str, output_folder: str, flags: Optional[List[str]] = None,
+             fmt_name: Optional[str] = None, jobname: Optional[str] = None) -> List[str]:
+        flags = self.flags if flags is None else flags
+        return [self.command, "-X", "compile", *flags, "--outdir", output_folder, tex_path]
+
+
+SAFE_FLAGS = [*COMPILE_FLAGS, "-no-shell-escape"]
+
+ENGINES: Dict[str, TexEngine] = {
+    # pdfTeX dumps formats reliably, so only it gets preloaded preambles and warm processes
+    "pdflatex": TexEngine("pdflatex", SAFE_FLAGS, ["-draftmode"], formats=True),
+    "lualatex": TexEngine("lualatex", SAFE_FLAGS, ["-draftmode"]),
+    # XeTeX has no draft mode; -no-pdf stops at the .xdv, which is as cheap
+    "xelatex": TexEngine("xelatex", SAFE_FLAGS, ["-no-pdf"]),
+    "tectonic": Tectonic(),
+}
+
+
+def requested_engine(latex_code: str) -> str:
+    """The engine a template asks for in its magic comment, or the default."""
+    match = MAGIC_COMMENT_RE.search(latex_code, 0, MAGIC_COMMENT_CHARS)
+    return match.group(1).lower() if match is not None else DEFAULT_ENGINE
+
+
+def engine_for(latex_code: str) -> TexEngine:
+    """The engine to compile a template with (the default one if it names an unknown engine)."""
+    return ENGINES.get(requested_engine(latex_code)) or ENGINES.get(DEFAULT_ENGINE) or ENGINES["pdflatex"]
+
+
+def installed_engines() -> List[TexEngine]:
+    return [engine for engine in ENGINES.values() if engine.installed]
@@ -0,0 +1,161 @@
+"""
+User input made safe to put into LaTeX, before anything is compiled.
+
+Every string a request carries is escaped through one translation table, so
+a stray &, %, _ or # in a company name prints as itself instead of costing a
+failed pdflatex run. Fields the client lists in `raw_latex` are passed
+through as LaTeX; those get a quick check instead (balanced braces and math
+shifts, no file or catcode tricks) that turns a bad payload away in
+microseconds, with the field it came from.
+"""
+import re
+from typing import Any, Iterable, List, Optional, Tuple, TypeVar
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+# TeX's special characters, plus control characters (which TeX refuses as input)
+LATEX_ESCAPES = {
+    "\\": r"\textbackslash{}",
+    "&": r"\&",
+    "%": r"\%",
+    "$": r"\$",
+    "#": r"\#",
+    "_": r"\_",
+    "{": r"\{",
+    "}": r"\}",
+    "~": r"\textasciitilde{}",
+    "^": r"\textasciicircum{}",
+    **{chr(code): "" for code in range(32) if chr(code) not in "\t\n\r"},
+    "\x7f": "",
+}
+# Most text has none of them, and is returned as it is
+SPECIAL_RE = re.compile("[" + re.escape("".join(LATEX_ESCAPES)) + "]")
+
+# Request fields that aren't document text
+NOT_TEXT = {"template_name", "output_filename", "raw_latex"}
+
+# Commands that read or write files, redefine characters or restart the document, and
+# the ones that build a command name out of characters (\csname input\endcsname,
+# \scantokens, \expandafter chains), which would get around the rest. This only
+# keeps honest mistakes out: TeX has too many ways to spell a command for a
+# pattern to catch them all. The real boundary is the sandbox (kpathsea's
+# paranoid openin_any/openout_any and no shell escape, see engine.sandbox).
+FORBIDDEN_RE = re.compile(
+    r"\\(?:input|include|InputIfFileExists|endinput|openin|openout|read|readline|write|immediate"
+    r"|catcode|documentclass|usepackage|special|csname|expandafter|scantokens)(?![A-Za-z@])"
+    r"|\\(?:begin|end)\s*\{document\}"
+    r"|\^\^"
+)
+ESCAPED_CHAR_RE = re.compile(r"\\.", re.DOTALL)
+COMMENT_RE = re.compile(r"%[^\n]*")
+BRACE_RE = re.compile(r"[{}]")
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+def escape_latex(text: str) -> str:
+    """`text` as LaTeX that prints it literally."""
+    if SPECIAL_RE.search(text) is None:
+        return text
+    return SPECIAL_RE.sub(lambda match: LATEX_ESCAPES[match.group(0)], text)
+
+
+def check_latex(text: str) -> Optional[str]:
+    """What is wrong with a raw LaTeX fragment, or None if it looks safe to compile."""
+    forbidden = FORBIDDEN_RE.search(text)
+    if forbidden is not None:
+        return f"{forbidden.group(0)} is not allowed"
+    # Escaped characters and comments don't count towards balance
+    code = COMMENT_RE.sub("", ESCAPED_CHAR_RE.sub("", text))
+    depth = 0
+    for brace in BRACE_RE.finditer(code):
+        depth += 1 if brace.group(0) == "{" else -1
+        if depth < 0:
+            return "a } has no matching {"
+    if depth > 0:
+        return f"{depth} {{ {'is' if depth == 1 else 'are'} never closed"
+    if code.count("$") % 2:
+        return "a $ (math mode) is never closed"
+    return None
+
+
+def _is_raw(path: str, raw: Iterable[str]) -> bool:
+    return any(path == field or path.startswith(field + ".") for field in raw)
+
+
+def _escape(value: Any, path: str, raw: List[str], problems: List[Tuple[str, str]]) -> Any:
+    if isinstance(value, str):
+        if not _is_raw(path, raw):
+            return escape_latex(value)
+        problem = check_latex(value)
+        if problem is not None:
+            problems.append((path, problem))
+        return value
+    if isinstance(value, BaseModel):
+        return value.model_copy(update={
+            name: _escape(getattr(value, name), f"{path}.{name}", raw, problems) for name in type(value).model_fields
+        })
+    if isinstance(value, dict):
+        return {key: _escape(item, f"{path}.{key}", raw, problems) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_escape(item, f"{path}.{index}", raw, problems) for index, item in enumerate(value)]
+    return value
+
+
+def _check(value: Any, path: str, raw: List[str], problems: List[Tuple[str, str]]):
+    if isinstance(value, str):
+        if _is_raw(path, raw):
+            problem = check_latex(value)
+            if problem is not None:
+                problems.append((path, problem))
+    elif isinstance(value, BaseModel):
+        for name in type(value).model_fields:
+            _check(getattr(value, name), f"{path}.{name}", raw, problems)
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            _check(item, f"{path}.{key}", raw, problems)
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            _check(item, f"{path}.{index}", raw, problems)
+
+
+def _raise_for(problems: List[Tuple[str, str]]):
+    if problems:
+        raise HTTPException(
+            status_code=422,
+            detail="Invalid LaTeX in " + "; ".join(f"{path}: {problem}" for path, problem in problems)
+        )
+
+
+def check_input(data: BaseModel):
+    """
+    Raises the 422 escape_input would for a request's raw LaTeX fields,
+    without escaping anything (for requests that are built later, e.g. jobs).
+    """
+    raw = list(getattr(data, "raw_latex", None) or [])
+    if not raw:
+        return
+    problems: List[Tuple[str, str]] = []
+    for name in type(data).model_fields:
+        if name not in NOT_TEXT:
+            _check(getattr(data, name), name, raw, problems)
+    _raise_for(problems)
+
+
+def escape_input(data: ModelT) -> ModelT:
+    """
+    A copy of a request model with every text field escaped, except those
+    named in its `raw_latex` list (a field, a dict key such as
+    "basic_info.Place_Holder_Name", or a whole list such as
+    "experience_entries"), which are checked instead. Raises a 422 naming
+    the field if a raw one would not compile.
+    """
+    raw = list(getattr(data, "raw_latex", None) or [])
+    problems: List[Tuple[str, str]] = []
+    values = {
+        name: _escape(getattr(data, name), name, raw, problems)
+        for name in type(data).model_fields if name not in NOT_TEXT
+    }
+    _raise_for(problems)
+    return data.model_copy(update=values)
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import hashlib
+import os
+import re
+import tempfile
+from typing import Dict, List, Optional
+
+from engine.compile_pool import compile_pool, engine_version
+from engine.engines import TexEngine, engine_for
+from engine.sandbox import CompileTerminated
+
+logger = logging.getLogger(__name__)
+
+FORMAT_FOLDER = os.environ.get(
+    "LATEX_FORMAT_DIR", os.path.join(tempfile.gettempdir(), "writer2-formats")
+)
+
+# Anything matching this is filled in per request, so it can't go into a format
+PLACEHOLDER_RE = re.compile(r"PlaceHolder|Place_Holder")
+
+
+def static_preamble_end(latex_code: str) -> int:
+    """
+    Returns the offset where the static part of a template's preamble ends:
+    the start of \\begin{document}, or the start of the first preamble line
+    that contains a placeholder. Returns 0 if there is nothing worth dumping.
+    """
+    end = latex_code.find("\\begin{document}")
+    if end == -1:
+        return 0
+    placeholder = PLACEHOLDER_RE.search(latex_code, 0, end)
+    if placeholder is not None:
+        end = latex_code.rfind("\n", 0, placeholder.start()) + 1
+    if "\\documentclass" not in latex_code[:end]:
+        return 0
+    return end
+
+
+class PreparedCompile:
+    """
+    The command for one compile and the engine it runs, plus the format and
+    body file it uses (if any) and how many lines of the document the format
+    stands in for.
+    """
+
+    def __init__(self, args: List[str], env: Dict[str, str], fmt_name: Optional[str] = None,
+                 body_path: Optional[str] = None, line_offset: int = 0,
+                 engine: Optional[TexEngine] = None):
+        self.args = args
+        self.engine = engine or engine_for("")
+        self.env = env
+        self.fmt_name = fmt_name
+        self.body_path = body_path
+        self.line_offset = line_offset
+
+
+class FormatCache:
+    """
+    Dumps each template's static preamble into a precompiled .fmt so requests
+    only have to typeset the document body. Formats are named after a hash of
+    the preamble and engine version, so editing a template's preamble (or
+    upgrading TeX) builds a fresh format automatically. Only engines that
+    can dump formats get one (see engine.engines).
+    """
+
+    def __init__(self, folder: str = FORMAT_FOLDER):
+        self.folder = os.path.abspath(folder)
+        self._builds: Dict[str, asyncio.Task] = {}
+
+    @property
+    def env(self) -> Dict[str, str]:
+        # Let kpathsea find our formats before the system ones
+        return {"TEXFORMATS": self.folder + os.pathsep}
+
+    async def format_name(self, template_name: str, preamble: str, engine: TexEngine) -> str:
+        version = await engine_version(engine.command)
+        digest = hashlib.sha256((version + "\0" + preamble).encode("utf-8")).hexdigest()
+        stem = re.sub(r"[^A-Za-z0-9_-]", "_", os.path.splitext(template_name)[0])
+        return f"{stem}-{digest[:16]}"
+
+    async def name_for(self, template_name: str, latex_code: str) -> Optional[str]:
+        """The name of the template's format as it is now (built or not), or None if it can't have one."""
+        engine = engine_for(latex_code)
+        end = static_preamble_end(latex_code)
+        if end == 0 or not engine.formats:
+            return None
+        return await self.format_name(template_name, latex_code[:end], engine)
+
+    async def ensure(self, template_name: str, latex_code: str) -> Optional[str]:
+        """Builds the template's format if needed; returns its name, or None if unavailable."""
+        name = await self.name_for(template_name, latex_code)
+        if name is None:
+            return None
+        engine = engine_for(latex_code)
+        preamble = latex_code[:static_preamble_end(latex_code)]
+        if os.path.exists(os.path.join(self.folder, name + ".fmt")):
+            return name
+        build = self._builds.get(name)
+        if build is None or build.cancelled():
+            build = asyncio.ensure_future(self._build(name, preamble, engine))
+            self._builds[name] = build
+        return name if await asyncio.shield(build) else None
+
+    async def _build(self, name: str, preamble: str, engine: TexEngine) -> bool:
+        os.makedirs(self.folder, exist_ok=True)
+        build_name = f"{name}-build{os.getpid()}"
+        source_path = os.path.join(self.folder, build_name + ".tex")
+        with open(source_path, "w", encoding="utf-8", newline="\n") as f:
+            f.write(preamble)
+            f.write("\n\\dump\n")
+        try:
+            result = await compile_pool.run(engine.format_args(build_name, self.folder, source_path),
+                                            cwd=self.folder, check=False)
+            built = os.path.join(self.folder, build_name + ".fmt")
+            if result.returncode != 0 or not os.path.exists(built):
+                logger.warning("Could not build LaTeX format %s; falling back to full compiles", name)
+                return False
+            os.replace(built, os.path.join(self.folder, name + ".fmt"))
+            return True
+        except (OSError, CompileTerminated) as e:
+            logger.warning("Could not build LaTeX format %s: %s", name, getattr(e, "detail", e))
+            return False
+        finally:
+            for ext in (".tex", ".log", ".fmt"):
+                path = os.path.join(self.folder, build_name + ext)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def build_in_background(self, template):
+        """Template registry listener: starts building a (re)loaded template's format."""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        asyncio.ensure_future(self.ensure(template.name, template.code))
+
+    async def prepare_compile(self, template_name: str, template_code: str, modified_code: str,
+                              tex_path: str, output_folder: str,
+                              flags: Optional[List[str]] = None) -> PreparedCompile:
+        """
+        Writes the rendered document to tex_path and returns the command to
+        compile it. When the template has a format, a body-only file is also
+        written next to it and compiled against the format under the same jobname,
+        so the PDF still lands at <tex_path stem>.pdf.
+        The command runs the template's engine (engine.engines) with its own
+        flags unless others are given; they stop at the first error.
+        """
+        with open(tex_path, "w", encoding="utf-8", newline="\n") as f:
+            f.write(modified_code)
+        engine = engine_for(template_code)
+        jobname = os.path.splitext(os.path.basename(tex_path))[0]
+        # A reused folder (editing sessions) may still hold the previous PDF; a failed
+        # compile must not pass that off as its output. The .aux is kept on purpose.
+        previous_pdf = os.path.join(output_folder, jobname + ".pdf")
+        if os.path.exists(previous_pdf):
+            os.remove(previous_pdf)
+
+        fmt_name = await self.ensure(template_name, template_code)
+        end = static_preamble_end(template_code)
+        # The format is only valid if rendering left the static preamble untouched
+        if fmt_name is None or not modified_code.startswith(template_code[:end]):
+            return PreparedCompile(engine.args(tex_path, output_folder, flags), {}, engine=engine)
+
+        body_path = os.path.join(output_folder, jobname + ".body.tex")
+        with open(body_path, "w", encoding="utf-8", newline="\n") as f:
+            f.write(modified_code[end:])
+        args = engine.args(body_path, output_folder, flags, fmt_name, jobname)
+        return PreparedCompile(args, self.env, fmt_name, body_path, modified_code.count("\n", 0, end), engine)
+
+
+format_cache = FormatCache()
@@ -0,0 +1,231 @@
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+
+from engine.pdf_cache import pdf_cache
+from engine.store import find_blob, touch_output
+
+JOB_DB_PATH = os.environ.get(
+    "LATEX_JOB_DB", os.path.join(tempfile.gettempdir(), "writer2-jobs.sqlite3")
+)
+# A worker that stops heartbeating for this long is presumed dead and its job is retried
+JOB_LEASE_SECONDS = float(os.environ.get("LATEX_JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("LATEX_JOB_MAX_ATTEMPTS", "3"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    worker TEXT,
+    lease_until REAL,
+    result TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, priority DESC, created);
+"""
+
+
+class JobQueue:
+    """
+    Durable compile job queue stored in SQLite. Web processes submit jobs and
+    standalone workers (worker.py) claim them with a lease. Higher priority
+    runs first; a job whose worker dies is picked up again once its lease
+    expires, up to max_attempts times. Every call does its SQLite work in a
+    worker thread: a locked database can keep it waiting for up to 30 seconds.
+    """
+
+    def __init__(self, path: str = JOB_DB_PATH):
+        self.path = path
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit; _claim() opens its own write transaction
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        if not self._initialized:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            self._initialized = True
+        return connection
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        connection = self._connect()
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def _submit(self, kind: str, payload: Dict, priority: int, max_attempts: int) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, kind, payload, priority, status, max_attempts, created, updated)"
+                " VALUES (?, ?, ?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), priority, max_attempts, now, now),
+            )
+        return job_id
+
+    def _get(self, job_id: str) -> Optional[Dict]:
+        with self._connection() as connection:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def _claim(self, worker: str, lease_seconds: float) -> Optional[Dict]:
+        now = time.time()
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            # Jobs abandoned by dead workers that have used up their attempts
+            connection.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Worker crashed too many times', updated = ?"
+                " WHERE status = 'running' AND lease_until < ? AND attempts >= max_attempts",
+                (now, now),
+            )
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_until < ?)"
+                " ORDER BY priority DESC, created LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                connection.execute("COMMIT")
+                return None
+            connection.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, lease_until = ?,"
+                " attempts = attempts + 1, updated = ? WHERE id = ?",
+                (worker, now + lease_seconds, now, row["id"]),
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+        job = self._to_dict(row)
+        job["attempts"] += 1
+        return job
+
+    def _heartbeat(self, job_id: str, worker: str, lease_seconds: float):
+        with self._connection() as connection:
+            connection.execute(
+                "UPDATE jobs SET lease_until = ?, updated = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (time.time() + lease_seconds, time.time(), job_id, worker),
+            )
+
+    def _complete(self, job_id: str, worker: str, result: Dict):
+        with self._connection() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = 'done', result = ?, lease_until = NULL, updated = ?"
+                " WHERE id = ? AND worker = ?",
+                (json.dumps(result), time.time(), job_id, worker),
+            )
+
+    def _fail(self, job_id: str, worker: str, error: str):
+        with self._connection() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, lease_until = NULL, updated = ?"
+                " WHERE id = ? AND worker = ?",
+                (error, time.time(), job_id, worker),
+            )
+
+    def _depth(self) -> int:
+        with self._connection() as connection:
+            return connection.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    @staticmethod
+    async def _in_thread(function: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+    async def submit(self, kind: str, payload: Dict, priority: int = 0,
+                     max_attempts: int = JOB_MAX_ATTEMPTS) -> str:
+        return await self._in_thread(self._submit, kind, payload, priority, max_attempts)
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        return await self._in_thread(self._get, job_id)
+
+    async def claim(self, worker: str, lease_seconds: float = JOB_LEASE_SECONDS) -> Optional[Dict]:
+        """
+        Atomically takes the highest-priority runnable job: a queued one, or a
+        running one whose worker's lease has expired. Returns None if idle.
+        """
+        return await self._in_thread(self._claim, worker, lease_seconds)
+
+    async def heartbeat(self, job_id: str, worker: str, lease_seconds: float = JOB_LEASE_SECONDS):
+        """Extends a running job's lease; call periodically while working on it."""
+        await self._in_thread(self._heartbeat, job_id, worker, lease_seconds)
+
+    async def complete(self, job_id: str, worker: str, result: Dict):
+        await self._in_thread(self._complete, job_id, worker, result)
+
+    async def fail(self, job_id: str, worker: str, error: str):
+        await self._in_thread(self._fail, job_id, worker, error)
+
+    async def depth(self) -> int:
+        """Number of jobs waiting to be picked up."""
+        return await self._in_thread(self._depth)
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+
+job_queue = JobQueue()
+
+# Status and result endpoints, shared by every service that accepts jobs
+job_router = APIRouter()
+
+
+@job_router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Returns a job's status, and its result once done."""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        "id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "priority": job["priority"],
+        "attempts": job["attempts"],
+        "result": job["result"],
+        "error": job["error"],
+    }
+
+
+@job_router.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Downloads the PDF produced by a finished job."""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=job["error"])
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    published = job["result"]["path"]
+    # The content-addressed copy; a later build with the same output name may replace the published one
+    path = pdf_cache.get(job["result"]["artifact_id"]) or find_blob(job["result"]["artifact_id"])
+    if path is None:
+        raise HTTPException(status_code=410, detail="Job output no longer available")
+    await touch_output(published)
+    return FileResponse(path, media_type="application/pdf", filename=os.path.basename(published))
@@ -0,0 +1,259 @@
+"""
+Where the time of a request goes. Build functions mark their stages (template
+lookup, rendering, writing the .tex, queueing, each pdflatex pass, publishing,
+cleanup); each stage is observed in a Prometheus-style histogram and listed in
+the response's Server-Timing header. GET /metrics serves the histograms along
+with the compile queue, the caches, the job queue and readiness.
+
+Metrics are kept per process: with several workers (server.py --workers),
+each scrape sees the worker that answered it.
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from starlette.datastructures import MutableHeaders
+
+from engine.cancellation import latest_wins
+from engine.compile_pool import CompileResult, compile_pool
+from engine.jobs import job_queue
+from engine.pdf_cache import pdf_cache
+from engine.preview import preview_cache
+from engine.store import store_stats
+from engine.warm import warm_pool
+from engine.warmup import warmup
+
+# Seconds; from a template lookup up to a slow multi-pass compile
+STAGE_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """A Prometheus histogram with cumulative buckets, one series per label set."""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...], buckets: Tuple[float, ...] = STAGE_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # label values -> bucket counts + [sum, count]
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(str(labels[name]) for name in self.labels)
+        series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self._series.items()):
+            for bound, count in zip(self.buckets, series):
+                le = 'le="%g"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {count:g}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labels, key, inf)} {series[-1]:g}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {series[-1]:g}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = tuple(str(labels[name]) for name in self.labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, key)} {value:g}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("latex_stage_duration_seconds", "Time spent in each stage of a document build.",
+                          ("service", "stage"))
+REQUEST_SECONDS = Histogram("latex_request_duration_seconds", "Time to answer a document request.",
+                            ("service",))
+REQUESTS = Counter("latex_requests_total", "Document requests answered, by status code.", ("service", "status"))
+
+
+class StageTimings:
+    """The stages of one request, in the order they ran."""
+
+    def __init__(self, service: Optional[str] = None):
+        self.service = service
+        self.stages: List[Tuple[str, float]] = []
+
+    def header(self, total: Optional[float] = None) -> str:
+        """The Server-Timing value: one entry per stage name (durations in ms), repeats summed."""
+        merged: Dict[str, List[float]] = {}
+        for name, seconds in self.stages:
+            merged.setdefault(name, []).append(seconds)
+        entries = []
+        for name, runs in merged.items():
+            entry = f"{name};dur={sum(runs) * 1000:.1f}"
+            if len(runs) > 1:
+                entry += f';desc="{len(runs)} runs"'
+            entries.append(entry)
+        if total is not None:
+            entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current: ContextVar[Optional[StageTimings]] = ContextVar("stage_timings", default=None)
+
+
+def track(service: str) -> StageTimings:
+    """Marks the current request as a build of `service` (outside a request, starts a fresh record)."""
+    timings = _current.get()
+    if timings is None:
+        timings = StageTimings()
+        _current.set(timings)
+    timings.service = service
+    return timings
+
+
+def record(name: str, seconds: float):
+    timings = _current.get()
+    if timings is None:
+        timings = track("other")
+    timings.stages.append((name, seconds))
+    STAGE_SECONDS.observe(seconds, service=timings.service or "other", stage=name)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Times the body of the with-block as one stage of the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def record_compile(result: CompileResult):
+    """Records one TeX run: how long it queued for a slot and how long it ran (under the engine's name)."""
+    record("queue", result.queue_wait)
+    record(os.path.basename(result.args[0]), result.run_time)
+
+
+class ServerTimingMiddleware:
+    """
+    Gives each HTTP request its own stage record and, if a build ran, adds the
+    Server-Timing header and observes the request in the metrics.
+    """
+
+    def __init__(self, app, allowed_origins: Optional[List[str]] = None):
+        self.app = app
+        self.allowed_origins = allowed_origins or []
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = StageTimings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if timings.stages:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", timings.header(time.perf_counter() - started))
+                    if self.allowed_origins:
+                        # Lets the frontend's Resource Timing API see the entries too
+                        headers.append("Timing-Allow-Origin", ", ".join(self.allowed_origins))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            if timings.service is not None:
+                REQUEST_SECONDS.observe(time.perf_counter() - started, service=timings.service)
+                REQUESTS.inc(service=timings.service, status=str(status))
+
+
+def _gauge(name: str, help: str, values: Dict[str, float], label: Optional[str] = None,
+           kind: str = "gauge") -> List[str]:
+    """Lines for a metric read from a stats() dict: one value, or one per label value."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for key, value in values.items():
+        lines.append(f'{name}{{{label}="{key}"}} {value:g}' if label else f"{name} {value:g}")
+    return lines
+
+
+async def render_metrics() -> str:
+    pool = compile_pool.stats()
+    caches = {"pdf": pdf_cache.stats(), "preview": preview_cache.stats()}
+    warm = warm_pool.stats()
+    cancelled = latest_wins.stats()
+    outputs = await store_stats()
+    lines: List[str] = []
+    lines += STAGE_SECONDS.render()
+    lines += REQUEST_SECONDS.render()
+    lines += REQUESTS.render()
+    lines += _gauge("latex_compile_queue_waiting", "Compiles waiting for a slot.", {"": pool["waiting"]})
+    lines += _gauge("latex_compile_running", "Compiles running now.", {"": pool["running"]})
+    lines += _gauge("latex_compile_slots", "Compiles allowed to run at once.", {"": pool["max_concurrency"]})
+    lines += _gauge("latex_compiles_total", "pdflatex runs that finished.",
+                    {"": pool["completed"] + pool["failed"]}, kind="counter")
+    lines += _gauge("latex_compile_failures_total", "pdflatex runs that exited with an error.",
+                    {"": pool["failed"]}, kind="counter")
+    lines += _gauge("latex_compile_terminations_total", "Compiles the sandbox stopped, by reason.",
+                    compile_pool.terminations, "reason", "counter")
+    lines += _gauge("latex_job_queue_depth", "Background jobs waiting for a worker.", {"": await job_queue.depth()})
+    lines += _gauge("latex_cache_hits_total", "Cache lookups answered from the cache.",
+                    {name: stats["hits"] for name, stats in caches.items()}, "cache", "counter")
+    lines += _gauge("latex_cache_misses_total", "Cache lookups that had to build.",
+                    {name: stats["misses"] for name, stats in caches.items()}, "cache", "counter")
+    lines += _gauge("latex_cache_hit_ratio", "Share of cache lookups answered from the cache.",
+                    {name: stats["hit_ratio"] for name, stats in caches.items()}, "cache")
+    lines += _gauge("latex_warm_process_hits_total", "Compiles that found a warm pdflatex waiting.",
+                    {"": warm["hits"]}, kind="counter")
+    lines += _gauge("latex_warm_process_misses_total", "Compiles that had to start pdflatex cold.",
+                    {"": warm["misses"]}, kind="counter")
+    lines += _gauge("latex_warm_processes_idle", "Warm pdflatex processes waiting.", {"": warm["idle"]})
+    lines += _gauge("latex_builds_in_flight", "Builds running for a document key.", {"": cancelled["in_flight"]})
+    lines += _gauge("latex_builds_superseded_total", "Builds cancelled by a newer edit.",
+                    {"": cancelled["superseded"]}, kind="counter")
+    lines += _gauge("latex_builds_disconnected_total", "Builds cancelled because the client left.",
+                    {"": cancelled["disconnected"]}, kind="counter")
+    lines += _gauge("latex_output_bytes", "Bytes of published files kept in the output store.", {"": outputs["bytes"]})
+    lines += _gauge("latex_outputs_evicted_total", "Published files removed to stay under the size cap.",
+                    {"": outputs["evicted"]}, kind="counter")
+    lines += _gauge("latex_outputs_expired_total", "Published files removed after going unused past the TTL.",
+                    {"": outputs["expired"]}, kind="counter")
+    lines += _gauge("latex_ready", "1 once the startup warm-up has finished.", {"": int(warmup.ready)})
+    lines += _gauge("latex_warmup_failures", "Templates whose warm-up compile failed.", {"": len(warmup.failed())})
+    return "\n".join(lines) + "\n"
+
+
+metrics_router = APIRouter()
+
+
+@metrics_router.get("/metrics")
+async def get_metrics():
+    """Metrics in the Prometheus text format."""
+    return PlainTextResponse(await render_metrics(), media_type="text/plain; version=0.0.4")
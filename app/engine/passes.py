@@ -0,0 +1,70 @@
+import hashlib
+import os
+import re
+from typing import Optional
+
+from engine.engines import TexEngine
+
+# Most passes any document gets before we give up waiting for it to settle
+MAX_PASSES = int(os.environ.get("LATEX_MAX_PASSES", "4"))
+
+# What LaTeX and common packages print when the aux data changed under them
+RERUN_RE = re.compile(
+    r"Rerun to get|Label\(s\) may have changed|Rerun LaTeX|Please rerun LaTeX|"
+    r"Please \(re\)run|rerunfilecheck Warning"
+)
+
+# Commands whose output depends on data written to .aux/.toc by an earlier pass
+CROSS_REFERENCE_RE = re.compile(
+    r"\\(?:ref|pageref|eqref|autoref|[cC]ref|nameref|cite|tableofcontents|listoffigures|listoftables)\b"
+)
+
+
+def needs_cross_references(latex_code: str) -> bool:
+    """True if the document can't come out right in a single pass."""
+    return CROSS_REFERENCE_RE.search(latex_code) is not None
+
+
+def file_digest(path: str) -> Optional[str]:
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def needs_rerun(log_path: str, aux_path: str, aux_before: Optional[str]) -> bool:
+    """
+    After a pass: does another one need to run? Yes if the log asks for it, or
+    if the pass wrote different .aux data from what it read at the start.
+    A first pass (no .aux before it) only reruns when the log asks; documents
+    that rely on .aux data get a draft pass first instead.
+    """
+    try:
+        with open(log_path, "r", encoding="utf-8", errors="replace") as f:
+            if RERUN_RE.search(f.read()):
+                return True
+    except FileNotFoundError:
+        pass
+    if aux_before is None:
+        return False
+    return file_digest(aux_path) != aux_before
+
+
+
+def starts_with_draft(latex_code: str, aux_path: str, engine: TexEngine) -> bool:
+    """
+    Should the first pass only collect cross-reference data (in draft mode,
+    writing no PDF)? Only if the document has cross-references, no earlier
+    build left its .aux, and the engine has a draft mode and doesn't rerun
+    by itself.
+    """
+    return (needs_cross_references(latex_code) and not os.path.exists(aux_path)
+            and not engine.reruns_itself and bool(engine.draft_flags))
+
+
+def another_pass(engine: TexEngine, passes: int, log_path: str, aux_path: str, aux_before: Optional[str]) -> bool:
+    """After a full pass: run one more? Never past MAX_PASSES, nor for engines that rerun by themselves."""
+    if engine.reruns_itself or passes >= MAX_PASSES:
+        return False
+    return needs_rerun(log_path, aux_path, aux_before)
@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+# Bump when the way PDFs are produced changes, so old entries stop matching
+CACHE_FORMAT_VERSION = "1"
+
+PDF_CACHE_FOLDER = os.environ.get(
+    "LATEX_PDF_CACHE_DIR", os.path.join(tempfile.gettempdir(), "writer2-pdf-cache")
+)
+PDF_CACHE_MAX_BYTES = int(os.environ.get("LATEX_PDF_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+# pdfTeX takes CreationDate/ModDate and the trailer /ID from SOURCE_DATE_EPOCH,
+# so the same .tex always produces the same bytes.
+REPRODUCIBLE_ENV = {"SOURCE_DATE_EPOCH": "0"}
+
+
+class PdfCache:
+    """
+    On-disk PDF cache keyed by a hash of the rendered .tex, template and engine.
+    Entries are evicted least-recently-used first once the folder exceeds max_bytes.
+    Concurrent misses for the same key share a single compile.
+    """
+
+    def __init__(self, folder: str = PDF_CACHE_FOLDER, max_bytes: int = PDF_CACHE_MAX_BYTES,
+                 extension: str = ".pdf"):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.extension = extension
+        self.hits = 0
+        self.misses = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def key_for(latex_code: str, template_name: str, engine: str) -> str:
+        """Content hash identifying one rendered document."""
+        digest = hashlib.sha256()
+        for part in (CACHE_FORMAT_VERSION, engine, template_name, latex_code):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.folder, key + self.extension)
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the cached PDF path for key, or None."""
+        path = self._path(key)
+        try:
+            # Touch so LRU eviction sees this entry as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key: str, pdf_path: str) -> str:
+        """Copies a freshly compiled PDF into the cache and returns its cached path."""
+        os.makedirs(self.folder, exist_ok=True)
+        path = self._path(key)
+        # Copy to a temp name first so readers never see a half-written file
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        os.close(fd)
+        shutil.copyfile(pdf_path, tmp_path)
+        os.replace(tmp_path, path)
+        self._evict()
+        return path
+
+    def _evict(self):
+        """Removes least-recently-used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if not entry.name.endswith(self.extension):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    async def get_or_compile(self, key: str, compile_pdf: Callable[[], Awaitable[str]]) -> Tuple[str, bool]:
+        """
+        Returns (cached_pdf_path, cache_hit). On a miss, awaits compile_pdf(),
+        which must return the path of the PDF it produced. Requests that arrive
+        while the same key is compiling wait for that compile instead of starting
+        their own, and count as hits.
+        """
+        while True:
+            path = self.get(key)
+            if path is not None:
+                self.hits += 1
+                return path, True
+
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            try:
+                path = await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # The request we were waiting on was cancelled (superseded or its client
+                # left); unless we were cancelled ourselves, compile it here instead
+                if not inflight.cancelled():
+                    raise
+                continue
+            self.hits += 1
+            return path, True
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting on it; don't warn about an unretrieved exception
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            path = self.put(key, await compile_pdf())
+            future.set_result(path)
+            return path, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self._inflight[key]
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# Shared by the resume, letter and report endpoints (and across processes via the folder)
+pdf_cache = PdfCache()
@@ -0,0 +1,122 @@
+import asyncio
+import os
+import tempfile
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import FileResponse
+
+from engine.artifacts import ARTIFACT_ID_RE, artifact_file, etag_matches, not_modified
+from engine.compile_pool import compile_pool
+from engine.pdf_cache import PdfCache
+from engine.render import insert_before_document
+from engine.workspace import BuildWorkspace
+
+try:
+    from PIL import Image
+except ImportError:  # Only needed for WebP previews
+    Image = None
+
+PREVIEW_DPI = int(os.environ.get("LATEX_PREVIEW_DPI", "72"))
+MAX_PREVIEW_DPI = 300
+PREVIEW_CACHE_FOLDER = os.environ.get(
+    "LATEX_PREVIEW_CACHE_DIR", os.path.join(tempfile.gettempdir(), "writer2-previews")
+)
+PREVIEW_CACHE_MAX_BYTES = int(os.environ.get("LATEX_PREVIEW_CACHE_MAX_MB", "128")) * 1024 * 1024
+
+PREVIEW_FORMATS = {"png": "image/png", "webp": "image/webp"}
+
+# Rendered pages, kept apart from the PDFs so they are evicted on their own budget
+preview_cache = PdfCache(PREVIEW_CACHE_FOLDER, PREVIEW_CACHE_MAX_BYTES, extension=".preview")
+
+# Images become empty boxes and hyperref stops writing links and bookmarks
+DRAFT_SETUP = (
+    "\\makeatletter\n"
+    "\\@ifpackageloaded{graphicx}{\\setkeys{Gin}{draft}}{}\n"
+    "\\@ifpackageloaded{hyperref}{\\hypersetup{draft}}{}\n"
+    "\\makeatother\n"
+)
+
+
+def with_draft(latex_code: str) -> str:
+    """The document set up for a quick draft compile."""
+    return insert_before_document(latex_code, DRAFT_SETUP)
+
+
+def preview_key(artifact_id: str, page: int, dpi: int, image_format: str) -> str:
+    return f"{artifact_id}-p{page}-{dpi}dpi-{image_format}"
+
+
+async def _rasterize(pdf_path: str, page: int, dpi: int, image_format: str, workspace: BuildWorkspace) -> str:
+    prefix = workspace.file("page")
+    try:
+        result = await compile_pool.run(
+            ["pdftoppm", "-f", str(page), "-l", str(page), "-r", str(dpi), "-png", "-singlefile",
+             pdf_path, prefix],
+            cwd=workspace.path, check=False
+        )
+    except FileNotFoundError:
+        raise HTTPException(status_code=501, detail="Previews need pdftoppm (poppler-utils) installed")
+    png_path = prefix + ".png"
+    if result.returncode != 0 or not os.path.exists(png_path):
+        raise HTTPException(status_code=404, detail=f"Page {page} could not be rendered")
+    if image_format == "png":
+        return png_path
+
+    def to_webp() -> str:
+        webp_path = prefix + ".webp"
+        with Image.open(png_path) as image:
+            image.save(webp_path, "WEBP", quality=80)
+        return webp_path
+    return await asyncio.get_running_loop().run_in_executor(None, to_webp)
+
+
+async def render_preview(artifact_id: str, page: int = 1, dpi: int = PREVIEW_DPI,
+                         image_format: str = "png") -> str:
+    """
+    Renders one page of a generated PDF as an image and returns its path.
+    Images are cached by artifact id (a content hash), page, resolution and format.
+    """
+    if image_format not in PREVIEW_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported preview format: {image_format}")
+    if image_format == "webp" and Image is None:
+        raise HTTPException(status_code=400, detail="WebP previews need Pillow installed")
+    if page < 1 or not 1 <= dpi <= MAX_PREVIEW_DPI:
+        raise HTTPException(status_code=400, detail="Invalid page or dpi")
+    pdf_path = artifact_file(artifact_id)
+
+    workspace = BuildWorkspace()
+    try:
+        path, _ = await preview_cache.get_or_compile(
+            preview_key(artifact_id, page, dpi, image_format),
+            lambda: _rasterize(pdf_path, page, dpi, image_format, workspace)
+        )
+    finally:
+        workspace.discard()
+    return path
+
+
+async def preview_response(request: Request, artifact_id: str, page: int = 1, dpi: int = PREVIEW_DPI,
+                           image_format: str = "png", immutable: bool = False) -> Response:
+    """An image response for one page of a generated PDF, answering If-None-Match with 304 (412 on a POST)."""
+    etag = f'"{preview_key(artifact_id, page, dpi, image_format)}"'
+    headers = {"ETag": etag, "X-Artifact-Id": artifact_id}
+    if immutable:
+        headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    if etag_matches(request, etag):
+        # Still a 404 for an artifact that is gone
+        artifact_file(artifact_id)
+        return not_modified(request, headers)
+    path = await render_preview(artifact_id, page, dpi, image_format)
+    return FileResponse(path, media_type=PREVIEW_FORMATS[image_format], headers=headers)
+
+
+preview_router = APIRouter()
+
+
+@preview_router.get("/artifacts/{artifact_id}/preview")
+async def get_artifact_preview(artifact_id: str, request: Request, page: int = 1, dpi: int = PREVIEW_DPI,
+                               format: str = "png"):
+    """One page of a generated PDF as a low-resolution PNG (or WebP) image."""
+    if not ARTIFACT_ID_RE.match(artifact_id):
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    return await preview_response(request, artifact_id, page, dpi, format, immutable=True)
@@ -0,0 +1,125 @@
+import re
+from typing import Dict, List, Optional, Pattern, Tuple
+
+PLACEHOLDER_TOKEN_RE = re.compile(r"PlaceHolder\w+|Place_Holder_\w+")
+
+BEGIN_DOCUMENT_RE = re.compile(r"\\begin\s*\{document\}")
+
+
+def pattern_to_regex(pattern: str) -> Pattern:
+    """
+    Turns an exact section pattern into a regex that ignores how much
+    whitespace separates its pieces, so re-indenting a template (or an
+    editor changing line endings) doesn't stop the section from matching.
+    """
+    pieces = re.split(r"\s+", pattern.strip())
+    regex = r"\s+".join(re.escape(piece) for piece in pieces)
+    if pattern[:1].isspace():
+        # Keep swallowing the indentation in front of the block, like the exact pattern did
+        regex = r"[ \t]*" + regex
+    return re.compile(regex)
+
+
+class CompiledTemplate:
+    """
+    A template split once into literal segments and named slots.
+    Rendering is a single join over the pieces instead of one full-document
+    str.replace per placeholder. Slots without a value keep their original text.
+    """
+
+    def __init__(self, segments: List[str], slots: List[str], originals: List[str],
+                 missing: Optional[List[str]] = None):
+        # segments has exactly one more entry than slots: seg0 slot0 seg1 slot1 ... segN
+        self.segments = segments
+        self.slots = slots
+        self.originals = originals
+        # Section and block slots that were asked for but aren't in the template
+        self.missing = missing or []
+
+    @property
+    def slot_names(self) -> List[str]:
+        return list(dict.fromkeys(self.slots))
+
+    def render(self, values: Dict[str, str]) -> str:
+        parts = [self.segments[0]]
+        for slot, original, segment in zip(self.slots, self.originals, self.segments[1:]):
+            parts.append(values.get(slot, original))
+            parts.append(segment)
+        return "".join(parts)
+
+    def render_spans(self, values: Dict[str, str]) -> Tuple[str, List[Tuple[int, int, str]]]:
+        """Like render(), plus where each filled-in slot ended up: (start, end, slot name)."""
+        parts = [self.segments[0]]
+        spans: List[Tuple[int, int, str]] = []
+        position = len(self.segments[0])
+        for slot, original, segment in zip(self.slots, self.originals, self.segments[1:]):
+            value = values.get(slot)
+            if value is not None:
+                spans.append((position, position + len(value), slot))
+            else:
+                value = original
+            parts.append(value)
+            parts.append(segment)
+            position += len(value) + len(segment)
+        return "".join(parts), spans
+
+
+def compile_template(latex_code: str, sections: Optional[Dict[str, str]] = None,
+                     blocks: Optional[Dict[str, Optional[Tuple[int, int]]]] = None) -> CompiledTemplate:
+    """
+    Compiles a template into segments and slots. Every PlaceHolder*/Place_Holder_*
+    token becomes a slot named after itself; each entry in `sections` (slot name ->
+    exact block from the template) becomes one slot covering the whole block, and
+    so does each entry in `blocks` (slot name -> start and end offsets, found by
+    the template's analysis; an empty span inserts there).
+    Sections and blocks that can't be found are left out and listed in `missing`.
+    """
+    spans: List[Tuple[int, int, str]] = []
+    missing: List[str] = []
+    for name, pattern in (sections or {}).items():
+        match = pattern_to_regex(pattern).search(latex_code)
+        if match is not None:
+            spans.append((match.start(), match.end(), name))
+        else:
+            missing.append(name)
+    for name, span in (blocks or {}).items():
+        if span is not None:
+            spans.append((span[0], span[1], name))
+        else:
+            missing.append(name)
+    spans.sort()
+
+    # Placeholders outside section blocks become slots of their own
+    tokens: List[Tuple[int, int, str]] = []
+    position = 0
+    for start, end, _ in spans + [(len(latex_code), len(latex_code), "")]:
+        for match in PLACEHOLDER_TOKEN_RE.finditer(latex_code, position, start):
+            tokens.append((match.start(), match.end(), match.group()))
+        position = max(position, end)
+
+    segments: List[str] = []
+    slots: List[str] = []
+    originals: List[str] = []
+    position = 0
+    for start, end, name in sorted(spans + tokens):
+        if start < position:
+            # Overlapping section patterns; the first one wins
+            continue
+        segments.append(latex_code[position:start])
+        slots.append(name)
+        originals.append(latex_code[start:end])
+        position = end
+    segments.append(latex_code[position:])
+    return CompiledTemplate(segments, slots, originals, missing)
+
+
+def insert_before_document(latex_code: str, setup: str) -> str:
+    """
+    Adds setup code right before \\begin{document}: after the (format-cached)
+    preamble, so the result still compiles against the template's format.
+    Returns the code unchanged if it has no \\begin{document}.
+    """
+    match = BEGIN_DOCUMENT_RE.search(latex_code)
+    if match is None:
+        return latex_code
+    return latex_code[:match.start()] + setup + latex_code[match.start():]
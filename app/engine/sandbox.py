@@ -0,0 +1,155 @@
+"""
+The limits every compile runs under. A document that sends TeX into an
+endless loop or a runaway expansion must not pin a core (or fill the disk)
+for good, so each process gets:
+
+- a wall-clock timeout (LATEX_COMPILE_TIMEOUT seconds per run), after which
+  its whole process group is killed;
+- CPU, address-space and file-size rlimits (LATEX_COMPILE_CPU_SECONDS,
+  LATEX_COMPILE_MEMORY_MB, LATEX_COMPILE_FILE_MB);
+- kpathsea's paranoid file access: no shell escape, no dot files and no
+  absolute or ../ paths outside the folder it compiles in.
+
+The rlimits are set on the running process with prlimit(2) right after it
+starts, rather than in a preexec_fn: the services run thread pools, and
+Python code between fork and exec can deadlock there. That needs Linux;
+process groups need POSIX; elsewhere only the timeout applies. Each stopped
+compile is counted by reason (engine.compile_pool, /metrics).
+"""
+import os
+import re
+import signal
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+COMPILE_TIMEOUT_SECONDS = float(os.environ.get("LATEX_COMPILE_TIMEOUT", "60"))
+# Whole seconds, at least one (a zero RLIMIT_CPU would stop every process at once)
+COMPILE_CPU_SECONDS = max(1, int(float(os.environ.get("LATEX_COMPILE_CPU_SECONDS", COMPILE_TIMEOUT_SECONDS))))
+# Generous for lualatex; pdflatex stays well under 200 MB
+COMPILE_MEMORY_MB = int(os.environ.get("LATEX_COMPILE_MEMORY_MB", "2048"))
+COMPILE_FILE_MB = int(os.environ.get("LATEX_COMPILE_FILE_MB", "256"))
+
+# Why the sandbox stopped a compile (the label of latex_compile_terminations_total)
+TERMINATION_REASONS = ("timeout", "cpu", "memory", "file_size", "killed", "cancelled")
+
+TERMINATION_DETAILS = {
+    "timeout": f"took longer than {COMPILE_TIMEOUT_SECONDS:g}s",
+    "cpu": f"used more than {COMPILE_CPU_SECONDS}s of CPU time",
+    "memory": f"needed more than {COMPILE_MEMORY_MB} MB of memory",
+    "file_size": f"wrote a file larger than {COMPILE_FILE_MB} MB",
+    "killed": "was killed",
+}
+
+# kpathsea's xmalloc failing under the address-space limit (on stderr)
+KPATHSEA_MEMORY_RE = re.compile(r"^(?:\S+: )?fatal: memory exhausted \(x(?:m|re)alloc of \d+ bytes\)",
+                                re.MULTILINE)
+# TeX running out of its own memory arrays (the log's fatal error line)
+TEX_MEMORY_RE = re.compile(r"^! TeX capacity exceeded, sorry \[[^\]\n]*memory[^\]\n]*\]", re.MULTILINE)
+
+
+class CompileTerminated(HTTPException):
+    """A compile the sandbox stopped; almost always the document's doing (a loop or runaway macro)."""
+
+    def __init__(self, reason: str, command: str):
+        self.reason = reason
+        super().__init__(status_code=422, detail=f"LaTeX compilation stopped: {command} "
+                                                 f"{TERMINATION_DETAILS.get(reason, reason)}")
+
+
+def sandbox_env(folder: Optional[str]) -> Dict[str, str]:
+    """kpathsea settings that keep TeX's reads and writes inside `folder`."""
+    env = {"openin_any": "p", "openout_any": "p", "shell_escape": "f"}
+    if folder is not None:
+        # Paranoid mode still allows absolute paths under TEXMFOUTPUT
+        env["TEXMFOUTPUT"] = folder
+    return env
+
+
+def process_options() -> Dict:
+    """Extra create_subprocess_exec arguments: its own process group, so kill_group reaches everything."""
+    if os.name != "posix":
+        return {}
+    return {"start_new_session": True}
+
+
+def limit_resources(process):
+    """Applies the CPU, memory and file-size limits to a process that was just started."""
+    if resource is None or not hasattr(resource, "prlimit"):
+        return
+    try:
+        resource.prlimit(process.pid, resource.RLIMIT_CPU, (COMPILE_CPU_SECONDS, COMPILE_CPU_SECONDS + 1))
+        resource.prlimit(process.pid, resource.RLIMIT_AS, (COMPILE_MEMORY_MB << 20, COMPILE_MEMORY_MB << 20))
+        resource.prlimit(process.pid, resource.RLIMIT_FSIZE, (COMPILE_FILE_MB << 20, COMPILE_FILE_MB << 20))
+    except ProcessLookupError:
+        # Already finished
+        pass
+
+
+def kill_group(process):
+    """Kills the process and anything it started (its whole process group)."""
+    if process.returncode is not None:
+        return
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except ProcessLookupError:
+        pass
+
+
+def job_log(args: List[str], cwd: Optional[str]) -> Optional[str]:
+    """The .log a TeX command writes: <jobname>.log in its output directory (or cwd)."""
+    folder, jobname = cwd, None
+    for index, arg in enumerate(args):
+        if arg.startswith("-jobname="):
+            jobname = arg[len("-jobname="):]
+        elif arg in ("-output-directory", "--outdir") and index + 1 < len(args):
+            folder = args[index + 1]
+    if jobname is None and len(args) > 1 and args[-1].endswith(".tex"):
+        jobname = os.path.splitext(os.path.basename(args[-1]))[0]
+    if jobname is None or folder is None:
+        return None
+    return os.path.join(folder, jobname + ".log")
+
+
+def log_tail(path: Optional[str], size: int = 8192) -> str:
+    """The end of a log, where TeX writes its fatal errors ("" if there is none)."""
+    if path is None:
+        return ""
+    try:
+        with open(path, "rb") as f:
+            f.seek(max(0, os.path.getsize(path) - size))
+            return f.read().decode("utf-8", errors="replace")
+    except OSError:
+        return ""
+
+
+def termination_reason(returncode: int, stderr: str = "", log: str = "") -> Optional[str]:
+    """
+    Which limit stopped a process that exited by itself, or None for an
+    ordinary exit. `stderr` is what it printed there and `log` the tail of
+    its own .log; only TeX's and kpathsea's own fatal lines count, since the
+    terminal output and the log's error context echo the document's text.
+    """
+    if KPATHSEA_MEMORY_RE.search(stderr) or TEX_MEMORY_RE.search(log):
+        return "memory"
+    if returncode >= 0 or os.name != "posix":
+        return None
+    signum = -returncode
+    if signum == signal.SIGXCPU:
+        return "cpu"
+    if signum == signal.SIGXFSZ:
+        return "file_size"
+    if signum in (signal.SIGSEGV, signal.SIGABRT, signal.SIGBUS):
+        return "memory"
+    if signum == signal.SIGKILL:
+        # The hard CPU limit, or the kernel's OOM killer
+        return "killed"
+    return None
@@ -0,0 +1,79 @@
+"""
+The document services (resume, cover letter, report) and how to put them
+into an app. Each service module defines a `router`; the standalone apps
+serve one router at the root, server.py serves all of them side by side.
+"""
+import importlib.util
+import os
+from contextlib import asynccontextmanager
+from types import ModuleType
+from typing import Dict, List, Tuple
+
+from fastapi import APIRouter, FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+
+from engine.artifacts import artifact_router
+from engine.jobs import job_router
+from engine.metrics import ServerTimingMiddleware, metrics_router
+from engine.store import store_router
+from engine.preview import preview_router
+from engine.warm import warm_pool
+from engine.warmup import ready_router
+
+APP_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ALLOWED_ORIGINS = ["http://localhost:3000", "http://127.0.0.1:3000"]
+
+# Job kind -> (service module, build coroutine, request model, URL prefix in the combined app)
+SERVICES: Dict[str, Tuple[str, str, str, str]] = {
+    "resume": ("main.py", "build_pdf", "TemplateData", "/resume"),
+    "cover_letter": (os.path.join("letter", "main.py"), "build_cover_letter", "CoverLetterData", "/letter"),
+    "report": (os.path.join("report", "main.py"), "build_report_pdf", "ReportTemplateData", "/report"),
+}
+
+_loaded: Dict[str, ModuleType] = {}
+
+
+def load_service(kind: str) -> ModuleType:
+    """Imports a service module once (they are all called main.py, so load by path)."""
+    if kind not in _loaded:
+        path = SERVICES[kind][0]
+        spec = importlib.util.spec_from_file_location(f"{kind}_service", os.path.join(APP_FOLDER, path))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _loaded[kind] = module
+    return _loaded[kind]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Idle warm TeX processes would otherwise outlive the server
+    await warm_pool.close()
+
+
+def create_app(routers: List[Tuple[APIRouter, str]]) -> FastAPI:
+    """
+    An app serving the given (router, prefix) pairs plus the shared artifact,
+    preview, job, metrics and readiness routes. Each service router's lifespan
+    (loading its templates) runs inside the app's.
+    """
+    app = FastAPI(lifespan=lifespan)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=ALLOWED_ORIGINS,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["Server-Timing"],
+    )
+    app.add_middleware(ServerTimingMiddleware, allowed_origins=ALLOWED_ORIGINS)
+    for router, prefix in routers:
+        app.include_router(router, prefix=prefix)
+    app.include_router(artifact_router)
+    app.include_router(preview_router)
+    app.include_router(job_router)
+    app.include_router(metrics_router)
+    app.include_router(store_router)
+    app.include_router(ready_router)
+    return app
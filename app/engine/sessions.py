@@ -0,0 +1,175 @@
+import asyncio
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Type
+
+from fastapi import HTTPException
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+
+from engine.workspace import BUILD_ROOT, BuildWorkspace
+
+# Editing sessions live on the build root, so every worker process can pick them up
+SESSION_ROOT = os.environ.get("LATEX_SESSION_ROOT", os.path.join(BUILD_ROOT, "sessions"))
+# Sessions untouched for this long are deleted, and only this many are kept
+SESSION_TTL_SECONDS = float(os.environ.get("LATEX_SESSION_TTL_SECONDS", "1800"))
+MAX_SESSIONS = int(os.environ.get("LATEX_MAX_SESSIONS", "256"))
+
+SESSION_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+def merge_patch(target: Any, patch: Any) -> Any:
+    """
+    Applies a JSON merge patch (RFC 7396): objects are merged key by key,
+    null deletes a key, and anything else (including lists) replaces the old value.
+    """
+    if not isinstance(patch, dict):
+        return patch
+    merged = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            merged.pop(key, None)
+        else:
+            merged[key] = merge_patch(merged.get(key), value)
+    return merged
+
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    return str(value)
+
+
+class EditSession:
+    """
+    One document open in an editor. Keeps the last payload, the LaTeX of each
+    generated section (with the inputs it came from) and a workspace that
+    survives between compiles, so the previous .tex and .aux are still there.
+    """
+
+    def __init__(self, session_id: str, kind: str, payload: Dict[str, Any],
+                 sections: Optional[Dict[str, List[str]]] = None):
+        self.id = session_id
+        self.kind = kind
+        self.payload = payload
+        self.workspace = BuildWorkspace(path=os.path.join(SESSION_ROOT, session_id))
+        # Section name -> [inputs as JSON, rendered LaTeX]
+        self._sections: Dict[str, List[str]] = sections or {}
+        self.rerendered: List[str] = []
+
+    @property
+    def state_path(self) -> str:
+        return self.workspace.file("state.json")
+
+    def apply(self, patch: Dict[str, Any], model: Type[BaseModel]) -> BaseModel:
+        """Merges a patch into the payload; returns the validated request model."""
+        try:
+            data = model(**merge_patch(self.payload, patch))
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
+        self.payload = data.model_dump(mode="json")
+        return data
+
+    def section(self, name: str, inputs: Any, render: Callable[[], str]) -> str:
+        """The section's LaTeX, re-rendered only if its inputs changed since the last build."""
+        key = json.dumps(inputs, sort_keys=True, default=_jsonable)
+        cached = self._sections.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        latex = render()
+        self._sections[name] = [key, latex]
+        self.rerendered.append(name)
+        return latex
+
+    def save(self):
+        state = {"kind": self.kind, "payload": self.payload, "sections": self._sections}
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+
+class SessionStore:
+    """Creates, loads and expires editing sessions (one folder each under SESSION_ROOT)."""
+
+    def __init__(self, root: str = SESSION_ROOT, ttl: float = SESSION_TTL_SECONDS,
+                 max_sessions: int = MAX_SESSIONS):
+        self.root = root
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        # Serialises builds of the same session within this process
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def create(self, kind: str, payload: Dict[str, Any]) -> str:
+        self.sweep()
+        session_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self.root, session_id))
+        EditSession(session_id, kind, payload).save()
+        return session_id
+
+    def load(self, session_id: str, kind: str) -> Optional[EditSession]:
+        if not SESSION_ID_RE.match(session_id):
+            return None
+        try:
+            with open(os.path.join(self.root, session_id, "state.json"), "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get("kind") != kind:
+            return None
+        return EditSession(session_id, kind, state["payload"], state.get("sections"))
+
+    @asynccontextmanager
+    async def open(self, session_id: str, kind: str) -> AsyncIterator[EditSession]:
+        """Loads a session for one build and saves it afterwards; 404 if it does not exist."""
+        lock = self._locks.setdefault(session_id, asyncio.Lock())
+        async with lock:
+            session = self.load(session_id, kind)
+            if session is None:
+                raise HTTPException(status_code=404, detail="Session not found")
+            try:
+                yield session
+            except BaseException:
+                # A build that failed or was cancelled may have left a half-written .aux
+                aux_path = session.workspace.file("document.aux")
+                if os.path.exists(aux_path):
+                    os.remove(aux_path)
+                raise
+            finally:
+                if os.path.isdir(session.workspace.path):
+                    session.save()
+
+    def delete(self, session_id: str) -> bool:
+        if not SESSION_ID_RE.match(session_id):
+            return False
+        path = os.path.join(self.root, session_id)
+        if not os.path.isdir(path):
+            return False
+        shutil.rmtree(path, ignore_errors=True)
+        self._locks.pop(session_id, None)
+        return True
+
+    def sweep(self):
+        """Deletes expired sessions, then the least recently used ones beyond max_sessions."""
+        if not os.path.isdir(self.root):
+            return
+        sessions = []
+        with os.scandir(self.root) as it:
+            for entry in it:
+                try:
+                    sessions.append((os.stat(os.path.join(entry.path, "state.json")).st_mtime, entry.name))
+                except OSError:
+                    continue
+        sessions.sort(reverse=True)
+        cutoff = time.time() - self.ttl
+        for index, (mtime, session_id) in enumerate(sessions):
+            if mtime < cutoff or index >= self.max_sessions - 1:
+                self.delete(session_id)
+
+
+session_store = SessionStore()
@@ -0,0 +1,369 @@
+"""
+The output folder as a managed store. Published files go into one folder per
+owner, identical PDFs share a single hard-linked blob, and an SQLite index
+records owner, template, size, created and last access for every file, so
+listing and cleanup never have to walk the folder. A file counts as used
+when it is published, downloaded (as a job result) or fetched by artifact id.
+A background sweeper deletes files unused for longer than the TTL, then the
+least recently used ones while the store is over its size cap.
+
+The index keeps a running total of the bytes on disk, so a publish never
+re-adds the whole store, and every index write runs in a worker thread.
+
+Owners are advisory. The app has no accounts: the owner is whatever the
+X-Owner header says (LATEX_OWNER_HEADER names another header), so anyone
+can read a name's listing by sending that name, and every request without
+the header shares "anonymous". Where listings must stay private, run the
+services behind a proxy that authenticates users and sets the header
+itself, dropping any value the client sent.
+"""
+import asyncio
+import hmac
+import logging
+import os
+import re
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from fastapi import APIRouter, HTTPException, Request
+
+from engine.workspace import publish
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_TTL_SECONDS = float(os.environ.get("LATEX_OUTPUT_TTL_HOURS", "168")) * 3600
+OUTPUT_MAX_BYTES = int(os.environ.get("LATEX_OUTPUT_MAX_MB", "1024")) * 1024 * 1024
+OUTPUT_SWEEP_SECONDS = float(os.environ.get("LATEX_OUTPUT_SWEEP_SECONDS", "300"))
+
+# Who a published file belongs to; the app has no accounts, so clients (or a proxy in front) name them
+OWNER_HEADER = os.environ.get("LATEX_OWNER_HEADER", "X-Owner")
+DEFAULT_OWNER = "anonymous"
+OWNER_RE = re.compile(r"[^A-Za-z0-9_.-]")
+# Unset: nobody may list other owners' outputs
+ADMIN_TOKEN = os.environ.get("LATEX_ADMIN_TOKEN", "")
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+
+INDEX_NAME = ".index.sqlite3"
+BLOB_FOLDER = ".blobs"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    path TEXT PRIMARY KEY,
+    artifact_id TEXT,
+    owner TEXT NOT NULL,
+    template TEXT,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS artifacts_owner ON artifacts (owner, created);
+CREATE INDEX IF NOT EXISTS artifacts_lru ON artifacts (last_access);
+CREATE INDEX IF NOT EXISTS artifacts_blob ON artifacts (artifact_id);
+CREATE TABLE IF NOT EXISTS usage (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL);
+-- Each blob counted once, however many names link to it (only adds anything for an index from before the table)
+INSERT OR IGNORE INTO usage (id, bytes) SELECT 0, COALESCE(SUM(size), 0) FROM
+    (SELECT MAX(size) AS size FROM artifacts GROUP BY COALESCE(artifact_id, path));
+"""
+
+
+def request_owner(request: Request) -> str:
+    return request.headers.get(OWNER_HEADER) or DEFAULT_OWNER
+
+
+class ArtifactStore:
+    """
+    Published PDFs and logs under `root`/<owner>/<filename>. A PDF is stored
+    once per artifact id (its content hash) under .blobs/ and hard-linked to
+    every name it is published as; files are copied where links aren't possible.
+    """
+
+    def __init__(self, root: str, ttl: float = OUTPUT_TTL_SECONDS, max_bytes: int = OUTPUT_MAX_BYTES):
+        self.root = root
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.evicted = 0
+        self.expired = 0
+        self._initialized = False
+        self._sweeping: Dict[asyncio.AbstractEventLoop, asyncio.Task] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(os.path.join(self.root, INDEX_NAME), timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        if not self._initialized:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            self._initialized = True
+        return connection
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        os.makedirs(self.root, exist_ok=True)
+        connection = self._connect()
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def _destination(self, owner: str, filename: str) -> str:
+        owner_folder = OWNER_RE.sub("_", owner)[:64].strip(".") or DEFAULT_OWNER
+        # Only ever a plain name inside the owner's folder
+        return os.path.join(self.root, owner_folder, os.path.basename(filename.replace("\\", "/")))
+
+    def _blob(self, artifact_id: str) -> str:
+        return os.path.join(self.root, BLOB_FOLDER, artifact_id[:2], artifact_id + ".pdf")
+
+    @staticmethod
+    def _linked(connection: sqlite3.Connection, artifact_id: str) -> bool:
+        return connection.execute(
+            "SELECT 1 FROM artifacts WHERE artifact_id = ? LIMIT 1", (artifact_id,)
+        ).fetchone() is not None
+
+    def _record(self, path: str, artifact_id: Optional[str], owner: str, template: Optional[str], kind: str):
+        now = time.time()
+        size = os.path.getsize(path)
+        with self._connection() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                replaced = connection.execute("SELECT * FROM artifacts WHERE path = ?", (path,)).fetchone()
+                # A blob that is already linked somewhere takes no extra space
+                added = 0 if artifact_id is not None and self._linked(connection, artifact_id) else size
+                connection.execute(
+                    "INSERT OR REPLACE INTO artifacts (path, artifact_id, owner, template, kind, size, created,"
+                    " last_access) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (path, artifact_id, owner, template, kind, size, now, now),
+                )
+                freed = 0
+                if replaced is not None and replaced["artifact_id"] != artifact_id:
+                    freed = self._release(connection, replaced)
+                elif replaced is not None and artifact_id is None:
+                    # A plain file written over: the old copy is gone
+                    freed = replaced["size"]
+                connection.execute("UPDATE usage SET bytes = bytes + ? WHERE id = 0", (added - freed,))
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+    async def publish_pdf(self, source_path: str, filename: str, artifact_id: str, owner: str = DEFAULT_OWNER,
+                          template: Optional[str] = None, kind: str = "pdf") -> str:
+        """
+        Publishes a finished PDF as <owner>/<filename> and returns its path.
+        The file appears atomically, like engine.workspace.publish.
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self._publish_pdf, source_path, filename, artifact_id, owner, template, kind
+        )
+
+    def _publish_pdf(self, source_path: str, filename: str, artifact_id: str, owner: str,
+                     template: Optional[str], kind: str) -> str:
+        destination = self._destination(owner, filename)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        blob = self._blob(artifact_id)
+        try:
+            if not os.path.exists(blob):
+                publish(source_path, blob)
+            tmp_path = os.path.join(os.path.dirname(destination), f".publish-{uuid.uuid4().hex}.tmp")
+            try:
+                os.link(blob, tmp_path)
+                os.replace(tmp_path, destination)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        except OSError:
+            # No hard links here (some network and Windows file systems); store a copy
+            publish(source_path, destination)
+        self._record(destination, artifact_id, owner, template, kind)
+        self._enforce_cap()
+        return destination
+
+    async def publish_file(self, source_path: str, filename: str, owner: str = DEFAULT_OWNER,
+                           template: Optional[str] = None, kind: str = "log") -> str:
+        """Publishes a file that isn't worth deduplicating (e.g. an error log) and returns its path."""
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self._publish_file, source_path, filename, owner, template, kind
+        )
+
+    def _publish_file(self, source_path: str, filename: str, owner: str, template: Optional[str],
+                      kind: str) -> str:
+        destination = self._destination(owner, filename)
+        publish(source_path, destination)
+        self._record(destination, None, owner, template, kind)
+        self._enforce_cap()
+        return destination
+
+    def blob(self, artifact_id: str) -> Optional[str]:
+        """The stored copy of a published PDF, if the store has one."""
+        path = self._blob(artifact_id)
+        return path if os.path.exists(path) else None
+
+    def owns(self, path: str) -> bool:
+        return os.path.abspath(path).startswith(os.path.join(os.path.abspath(self.root), ""))
+
+    def touch(self, path: Optional[str] = None, artifact_id: Optional[str] = None):
+        """Marks a published file (or every name of an artifact) as just used, so eviction and the TTL spare it."""
+        if not os.path.isdir(self.root):
+            return
+        with self._connection() as connection:
+            if path is not None:
+                connection.execute("UPDATE artifacts SET last_access = ? WHERE path = ?", (time.time(), path))
+            if artifact_id is not None:
+                connection.execute("UPDATE artifacts SET last_access = ? WHERE artifact_id = ?",
+                                   (time.time(), artifact_id))
+
+    def list(self, owner: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        """Newest published files first, optionally only one owner's, straight from the index."""
+        if not os.path.isdir(self.root):
+            return []
+        query = "SELECT * FROM artifacts"
+        params: list = []
+        if owner is not None:
+            query += " WHERE owner = ?"
+            params.append(owner)
+        query += " ORDER BY created DESC LIMIT ?"
+        params.append(limit)
+        with self._connection() as connection:
+            return [dict(row) for row in connection.execute(query, params)]
+
+    def usage(self) -> int:
+        """Bytes on disk: each blob counted once, however many names link to it."""
+        with self._connection() as connection:
+            return connection.execute("SELECT bytes FROM usage WHERE id = 0").fetchone()[0]
+
+    def _release(self, connection: sqlite3.Connection, row: sqlite3.Row) -> int:
+        """Drops the blob behind a row that is gone, if nothing else links to it; returns the bytes freed."""
+        if row["artifact_id"] is None:
+            return row["size"]
+        if self._linked(connection, row["artifact_id"]):
+            return 0
+        try:
+            os.remove(self._blob(row["artifact_id"]))
+        except FileNotFoundError:
+            pass
+        return row["size"]
+
+    def _remove(self, connection: sqlite3.Connection, row: sqlite3.Row) -> int:
+        """Deletes one published file (and its blob, if nothing else links to it); returns the bytes freed."""
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("DELETE FROM artifacts WHERE path = ?", (row["path"],))
+            freed = self._release(connection, row)
+            connection.execute("UPDATE usage SET bytes = bytes - ? WHERE id = 0", (freed,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        try:
+            os.remove(row["path"])
+        except FileNotFoundError:
+            pass
+        return freed
+
+    def _enforce_cap(self):
+        """Removes least recently used files until the store fits in max_bytes."""
+        with self._connection() as connection:
+            usage = connection.execute("SELECT bytes FROM usage WHERE id = 0").fetchone()[0]
+            if usage <= self.max_bytes:
+                return
+            for row in connection.execute("SELECT * FROM artifacts ORDER BY last_access").fetchall():
+                if usage <= self.max_bytes:
+                    break
+                usage -= self._remove(connection, row)
+                self.evicted += 1
+
+    def sweep(self):
+        """Deletes files unused for longer than the TTL, then enforces the size cap."""
+        if not os.path.isdir(self.root):
+            return
+        cutoff = time.time() - self.ttl
+        with self._connection() as connection:
+            for row in connection.execute("SELECT * FROM artifacts WHERE last_access < ?", (cutoff,)).fetchall():
+                self._remove(connection, row)
+                self.expired += 1
+        self._enforce_cap()
+
+    async def _sweep_forever(self, interval: float):
+        while True:
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.sweep)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning("Output sweep failed: %s", e)
+            await asyncio.sleep(interval)
+
+    def start_sweeping(self, interval: float = OUTPUT_SWEEP_SECONDS):
+        """Starts the background sweeper on the running loop (once per loop)."""
+        loop = asyncio.get_running_loop()
+        if loop not in self._sweeping:
+            self._sweeping[loop] = loop.create_task(self._sweep_forever(interval))
+
+    def stats(self) -> Dict[str, float]:
+        usage = self.usage() if os.path.isdir(self.root) else 0
+        return {"bytes": usage, "evicted": self.evicted, "expired": self.expired}
+
+
+_stores: Dict[str, ArtifactStore] = {}
+
+
+def store_for(folder: str) -> ArtifactStore:
+    """The store for an output folder, shared by every service that publishes there."""
+    key = os.path.normcase(os.path.abspath(folder))
+    if key not in _stores:
+        _stores[key] = ArtifactStore(folder)
+    return _stores[key]
+
+
+async def store_stats() -> Dict[str, float]:
+    """stats() summed over every output folder in use (read from the index in a worker thread)."""
+    totals = {"bytes": 0, "evicted": 0, "expired": 0}
+    loop = asyncio.get_running_loop()
+    for store in list(_stores.values()):
+        for key, value in (await loop.run_in_executor(None, store.stats)).items():
+            totals[key] += value
+    return totals
+
+
+def find_blob(artifact_id: str) -> Optional[str]:
+    """A published PDF by artifact id, from whichever output folder has it."""
+    for store in _stores.values():
+        path = store.blob(artifact_id)
+        if path is not None:
+            return path
+    return None
+
+
+async def touch_output(path: Optional[str] = None, artifact_id: Optional[str] = None):
+    """Marks a published file, or every published copy of an artifact, as just used."""
+    loop = asyncio.get_running_loop()
+    for store in _stores.values():
+        if path is None or store.owns(path):
+            await loop.run_in_executor(None, store.touch, path, artifact_id)
+
+
+store_router = APIRouter()
+
+
+@store_router.get("/outputs")
+async def list_outputs(request: Request, all: bool = False, limit: int = 100):
+    """
+    The caller's published files, newest first. ?all=true lists every
+    owner's, and needs the X-Admin-Token header to match LATEX_ADMIN_TOKEN.
+    The caller is whoever the owner header names, which isn't proof of
+    anything (see the module docstring).
+    """
+    if all:
+        token = request.headers.get(ADMIN_TOKEN_HEADER)
+        if not ADMIN_TOKEN or token is None or not hmac.compare_digest(token, ADMIN_TOKEN):
+            raise HTTPException(status_code=403, detail="Listing every owner's outputs needs the admin token")
+    owner = None if all else request_owner(request)
+    limit = min(max(limit, 1), 1000)
+    loop = asyncio.get_running_loop()
+    listed = await asyncio.gather(*(loop.run_in_executor(None, store.list, owner, limit)
+                                    for store in _stores.values()))
+    outputs = [item for items in listed for item in items]
+    outputs.sort(key=lambda item: item["created"], reverse=True)
+    # File names only; server paths stay on the server
+    return {"outputs": [{"filename": os.path.basename(item.pop("path")), **item} for item in outputs[:limit]]}
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import os
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+from engine.engines import ENGINES, engine_for, requested_engine
+from engine.render import PLACEHOLDER_TOKEN_RE, CompiledTemplate, compile_template
+from engine.texscan import TemplateAnalysis
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks of the template folder for added, edited or removed files
+TEMPLATE_POLL_SECONDS = float(os.environ.get("LATEX_TEMPLATE_POLL_SECONDS", "2"))
+
+TEMPLATE_EXTENSIONS = (".txt", ".tex")
+
+SECTION_RE = re.compile(r"\\section\*?\{([^}]*)\}")
+
+
+class Template:
+    """A template file loaded into memory together with its placeholder index and analysis."""
+
+    def __init__(self, name: str, path: str, mtime: float, size: int, code: str):
+        self.name = name
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+        self.code = code
+        # Placeholder token -> offsets where it appears, in document order
+        self.placeholders: Dict[str, List[int]] = {}
+        for match in PLACEHOLDER_TOKEN_RE.finditer(code):
+            self.placeholders.setdefault(match.group(), []).append(match.start())
+        # Section title -> offset of its \section command
+        self.sections: Dict[str, int] = {
+            match.group(1): match.start() for match in SECTION_RE.finditer(code)
+        }
+        # Matched braces and environments, command offsets, and anything that won't compile
+        self.analysis = TemplateAnalysis(code)
+        # The TeX engine it asks for ("% !TEX program = ..."), or the default
+        self.engine = engine_for(code)
+        self._compiled: Dict[tuple, CompiledTemplate] = {}
+
+    @property
+    def problems(self) -> List[str]:
+        problems = list(self.analysis.problems)
+        if requested_engine(self.code) not in ENGINES:
+            problems.append(f"unknown TeX engine {requested_engine(self.code)} (known: {', '.join(ENGINES)})")
+        return problems
+
+    def compiled(self, sections: Optional[Dict[str, str]] = None,
+                 blocks: Optional[Dict[str, Optional[Tuple[int, int]]]] = None) -> CompiledTemplate:
+        """The template compiled for rendering, built once per set of section patterns and blocks."""
+        key = (tuple(sorted((sections or {}).items())), tuple(sorted((blocks or {}).items())))
+        if key not in self._compiled:
+            self._compiled[key] = compile_template(self.code, sections, blocks)
+        return self._compiled[key]
+
+
+class TemplateRegistry:
+    """
+    Keeps every template in the folder parsed in memory. The folder is polled
+    by mtime/size, changed files are re-read, and the new set of templates is
+    swapped in with a single assignment so readers never see a partial update.
+    A template whose analysis finds problems is refused (an edit that breaks
+    one keeps the previous version in service) and listed in `rejected`.
+    """
+
+    def __init__(self, folder: str, extensions: Tuple[str, ...] = TEMPLATE_EXTENSIONS):
+        self.folder = folder
+        self.extensions = extensions
+        self.folder_exists = False
+        self._templates: Dict[str, Template] = {}
+        # File name -> (mtime, size, problems) of the refused version
+        self.rejected: Dict[str, Tuple[float, int, List[str]]] = {}
+        self._listeners: List[Callable[[Template], None]] = []
+        self._change_listeners: List[Callable[["TemplateRegistry"], None]] = []
+        self._watcher: Optional[asyncio.Task] = None
+
+    def add_listener(self, callback: Callable[[Template], None]):
+        """Calls callback(template) whenever a template is loaded or reloaded."""
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    def add_change_listener(self, callback: Callable[["TemplateRegistry"], None]):
+        """Calls callback(registry) after a refresh that loaded, reloaded or dropped any template."""
+        if callback not in self._change_listeners:
+            self._change_listeners.append(callback)
+
+    def _changed(self):
+        for callback in self._change_listeners:
+            callback(self)
+
+    def get(self, name: str) -> Optional[Template]:
+        return self._templates.get(name)
+
+    def names(self, extensions: Optional[Tuple[str, ...]] = None) -> List[str]:
+        """Template file names, optionally limited to some extensions."""
+        extensions = extensions or self.extensions
+        return [name for name in self._templates if name.endswith(extensions)]
+
+    def refresh(self) -> bool:
+        """Rescans the folder; returns True if anything changed."""
+        if not os.path.isdir(self.folder):
+            changed = self.folder_exists or bool(self._templates)
+            self.folder_exists = False
+            self._templates = {}
+            self.rejected = {}
+            if changed:
+                self._changed()
+            return changed
+
+        current = self._templates
+        updated: Dict[str, Template] = {}
+        loaded: List[Template] = []
+        rejected: Dict[str, Tuple[float, int, List[str]]] = {}
+        with os.scandir(self.folder) as it:
+            entries = sorted((e for e in it if e.name.endswith(self.extensions)), key=lambda e: e.name)
+        for entry in entries:
+            try:
+                stat = entry.stat()
+                if not entry.is_file():
+                    continue
+                known = current.get(entry.name)
+                if known is not None and known.mtime == stat.st_mtime and known.size == stat.st_size:
+                    updated[entry.name] = known
+                    continue
+                refused = self.rejected.get(entry.name)
+                if refused is not None and refused[:2] == (stat.st_mtime, stat.st_size):
+                    rejected[entry.name] = refused
+                    if known is not None:
+                        updated[entry.name] = known
+                    continue
+                with open(entry.path, "r", encoding="utf-8") as f:
+                    code = f.read()
+            except (OSError, UnicodeDecodeError) as e:
+                logger.warning("Skipping template %s: %s", entry.name, e)
+                continue
+            template = Template(entry.name, entry.path, stat.st_mtime, stat.st_size, code)
+            if template.problems:
+                kept = " (keeping the previous version)" if known is not None else ""
+                logger.warning("Refusing template %s%s: %s", entry.name, kept, "; ".join(template.problems))
+                rejected[entry.name] = (stat.st_mtime, stat.st_size, template.problems)
+                if known is not None:
+                    updated[entry.name] = known
+                continue
+            updated[entry.name] = template
+            loaded.append(template)
+
+        changed = bool(loaded) or updated.keys() != current.keys() or not self.folder_exists
+        self.folder_exists = True
+        self._templates = updated
+        self.rejected = rejected
+        for template in loaded:
+            for callback in self._listeners:
+                callback(template)
+        if changed:
+            self._changed()
+        return changed
+
+    async def watch(self, interval: float = TEMPLATE_POLL_SECONDS):
+        """Polls the folder forever; run as a background task."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.refresh()
+            except OSError as e:
+                logger.warning("Template refresh failed: %s", e)
+
+    def start_watching(self):
+        """Starts watch() on the running loop unless it is already running there."""
+        if self._watcher is None or self._watcher.done() or self._watcher.get_loop() is not asyncio.get_running_loop():
+            self._watcher = asyncio.ensure_future(self.watch())
+
+
+_registries: Dict[str, TemplateRegistry] = {}
+
+
+def registry_for(folder: str) -> TemplateRegistry:
+    """One shared registry per template folder, so services in one process parse each template once."""
+    key = os.path.normcase(os.path.abspath(folder))
+    if key not in _registries:
+        _registries[key] = TemplateRegistry(folder)
+    return _registries[key]
+
+
+def group_placeholders(templates: List[Template], labels: Dict[str, Dict[str, str]],
+                       include_unlabelled: bool = False) -> Dict[str, Dict[str, str]]:
+    """
+    Builds a {group: {token: label}} listing from the tokens the templates
+    actually contain. `labels` supplies the groups and human-readable labels;
+    tokens without a label go under "other" when include_unlabelled is set.
+    """
+    found = set()
+    for template in templates:
+        found.update(template.placeholders)
+    grouped = {
+        group: {token: label for token, label in group_labels.items() if token in found}
+        for group, group_labels in labels.items()
+    }
+    if include_unlabelled:
+        labelled = set().union(*(group_labels.keys() for group_labels in labels.values()))
+        other = sorted(found - labelled)
+        if other:
+            grouped["other"] = {token: token for token in other}
+    return grouped
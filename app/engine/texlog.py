@@ -0,0 +1,225 @@
+"""
+What went wrong in a failed compile, in terms the user can act on.
+
+Compiles run with -halt-on-error in batch mode, so pdflatex stops at the
+first error and prints nothing to the terminal; its .log is then read in
+chunks by LogParser, which keeps only the first error and the line it was
+on. A SourceMap built from the rendered document points that line back at
+the input field it came from (e.g. "experience entry 3, item 2").
+"""
+import codecs
+import os
+import re
+from typing import Callable, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from engine.render import BEGIN_DOCUMENT_RE
+
+# Stop at the first error and report it as file:line: message
+COMPILE_FLAGS = ["-interaction=batchmode", "-halt-on-error", "-file-line-error"]
+
+LOG_CHUNK_BYTES = 64 * 1024
+# Longer log lines are cut; an error message never needs more
+MAX_LINE_CHARS = 4096
+# How far after the error message to look for TeX's "l.<n>" line
+CONTEXT_LINES = 20
+
+FILE_LINE_ERROR_RE = re.compile(r"^(.+?\.(?:tex|sty|cls|def|cfg|clo|fd|bbl|aux)):(\d+): (.*)$")
+TEX_ERROR_RE = re.compile(r"^! (.*)$")
+LINE_NUMBER_RE = re.compile(r"^l\.(\d+) ?(.*)$")
+
+# The files a build writes; errors anywhere else (a package, the class) aren't the user's
+DOCUMENT_FILES = ("document.tex", "document.body.tex")
+
+
+class LogError:
+    """The first error in a log: its message, and the file and line if TeX gave them."""
+
+    def __init__(self, message: str, file: Optional[str] = None, line: Optional[int] = None):
+        self.message = message
+        self.file = file
+        self.line = line
+        self.context = ""  # the source line up to where TeX stopped
+
+
+class LogParser:
+    """
+    Finds the first error in a TeX log fed to it piece by piece. Only the
+    current line and the error are kept, so memory stays bounded however long
+    the log is; `done` turns true once there is nothing more to learn.
+    """
+
+    def __init__(self):
+        self.error: Optional[LogError] = None
+        self.done = False
+        self._partial = ""
+        self._lines_after = 0
+
+    def feed(self, text: str):
+        if self.done:
+            return
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()[:MAX_LINE_CHARS]
+        for line in lines:
+            self._line(line[:MAX_LINE_CHARS].rstrip("\r"))
+            if self.done:
+                return
+
+    def close(self):
+        if self._partial and not self.done:
+            self._line(self._partial.rstrip("\r"))
+        self._partial = ""
+        self.done = True
+
+    def _line(self, line: str):
+        if self.error is None:
+            match = FILE_LINE_ERROR_RE.match(line)
+            if match is not None:
+                self.error = LogError(match.group(3), match.group(1), int(match.group(2)))
+                return
+            match = TEX_ERROR_RE.match(line)
+            if match is not None:
+                self.error = LogError(match.group(1))
+            return
+        self._lines_after += 1
+        match = LINE_NUMBER_RE.match(line)
+        if match is not None:
+            if self.error.line is None:
+                self.error.line = int(match.group(1))
+            self.error.context = match.group(2).strip()
+            self.done = True
+        elif self._lines_after >= CONTEXT_LINES:
+            self.done = True
+
+
+def parse_log(log_path: str) -> Optional[LogError]:
+    """The first error in a log file, read a chunk at a time and only as far as needed."""
+    parser = LogParser()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    try:
+        with open(log_path, "rb") as f:
+            while not parser.done:
+                chunk = f.read(LOG_CHUNK_BYTES)
+                if not chunk:
+                    break
+                parser.feed(decoder.decode(chunk))
+    except FileNotFoundError:
+        return None
+    parser.close()
+    return parser.error
+
+
+class SourceMap:
+    """
+    Which input field produced which part of a rendered document, as labelled
+    character spans of `latex_code`. Lookups take the document that was
+    actually compiled: setup code added right before \\begin{document} (drafts,
+    autofit layouts) is allowed and accounted for.
+    """
+
+    def __init__(self, latex_code: str, spans: Optional[List[Tuple[int, int, str]]] = None):
+        self.latex_code = latex_code
+        self.spans: List[Tuple[int, int, str]] = list(spans or [])
+
+    def add(self, start: int, end: int, label: str):
+        self.spans.append((start, end, label))
+
+    def add_entries(self, start: int, end: int, section: str, entry_marker: str,
+                    item_marker: Optional[str] = None):
+        """
+        Labels the entries (and their items) of a generated section by the
+        line each one starts with; continuation lines belong to the entry or
+        item above them.
+        """
+        entry = item = 0
+        entry_start = item_start = None
+        position = start
+        for line in self.latex_code[start:end].splitlines(keepends=True):
+            stripped = line.lstrip()
+            if stripped.startswith(entry_marker):
+                if item_start is not None:
+                    self.add(item_start, position, f"{section} entry {entry}, item {item}")
+                if entry_start is not None:
+                    self.add(entry_start, position, f"{section} entry {entry}")
+                entry, item = entry + 1, 0
+                entry_start, item_start = position, None
+            elif item_marker is not None and entry and stripped.startswith(item_marker):
+                if item_start is not None:
+                    self.add(item_start, position, f"{section} entry {entry}, item {item}")
+                item += 1
+                item_start = position
+            position += len(line)
+        if item_start is not None:
+            self.add(item_start, end, f"{section} entry {entry}, item {item}")
+        if entry_start is not None:
+            self.add(entry_start, end, f"{section} entry {entry}")
+
+    def replace(self, start: int, end: int, text: str, label: Optional[str] = None):
+        """Records latex_code[start:end] being replaced by `text` (labelled as a whole, if given)."""
+        delta = len(text) - (end - start)
+        spans = []
+        for span_start, span_end, span_label in self.spans:
+            if span_end <= start:
+                spans.append((span_start, span_end, span_label))
+            elif span_start >= end:
+                spans.append((span_start + delta, span_end + delta, span_label))
+            elif span_start <= start and span_end >= end:
+                spans.append((span_start, span_end + delta, span_label))
+        self.spans = spans
+        self.latex_code = self.latex_code[:start] + text + self.latex_code[end:]
+        if label is not None:
+            self.add(start, start + len(text), label)
+
+    def locate(self, compiled_code: str, line: int) -> Optional[str]:
+        """The most specific label covering `line` (1-based) of compiled_code, if any."""
+        line_start = 0
+        for _ in range(line - 1):
+            line_start = compiled_code.find("\n", line_start) + 1
+            if line_start == 0:
+                return None
+        line_end = compiled_code.find("\n", line_start)
+        line_end = len(compiled_code) if line_end == -1 else line_end
+
+        compiled_body = BEGIN_DOCUMENT_RE.search(compiled_code)
+        own_body = BEGIN_DOCUMENT_RE.search(self.latex_code)
+        if compiled_body is not None and own_body is not None and line_start >= compiled_body.start():
+            shift = own_body.start() - compiled_body.start()
+            line_start, line_end = line_start + shift, line_end + shift
+
+        best: Optional[Tuple[int, int, str]] = None
+        for span in self.spans:
+            if span[0] < max(line_end, line_start + 1) and span[1] > line_start:
+                if best is None or span[1] - span[0] < best[1] - best[0]:
+                    best = span
+        return best[2] if best is not None else None
+
+
+def compile_failure(log_path: str, compiled_code: str, line_offset: int = 0,
+                    source_map: Optional[Callable[[], SourceMap]] = None) -> HTTPException:
+    """
+    The error to answer a failed compile with. When the first error can be
+    traced to an input field it is the user's to fix (422); otherwise 500.
+    `line_offset` is how many lines of compiled_code came before the file
+    pdflatex compiled (the part baked into the template's format);
+    `source_map` is only built now that it is needed.
+    """
+    error = parse_log(log_path)
+    if error is None:
+        return HTTPException(status_code=500, detail="LaTeX compilation failed (no error found in the log)")
+    in_document = error.file is None or os.path.basename(error.file) in DOCUMENT_FILES
+    field = None
+    line = None
+    if error.line is not None and in_document:
+        line = error.line + line_offset
+        if source_map is not None:
+            field = source_map().locate(compiled_code, line)
+
+    detail = f"LaTeX error: {error.message}"
+    if field is not None:
+        detail += f" (in {field})"
+    if line is not None:
+        detail += f" at line {line}"
+    if error.context:
+        detail += f": {error.context}"
+    return HTTPException(status_code=422 if field is not None else 500, detail=detail)
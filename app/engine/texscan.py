@@ -0,0 +1,87 @@
+"""
+A LaTeX-aware scan of a template, done once when it loads. Tokens are found
+with one regex (control sequences, comments, braces), so escaped braces and
+commented-out code are skipped without walking the text a character at a
+time. The scan matches every brace and environment, records where each
+command appears, and lists what would keep the template from compiling; the
+registry refuses templates with problems.
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+
+TOKEN_RE = re.compile(r"\\(?:[A-Za-z@]+|.)|%[^\n]*|[{}]", re.DOTALL)
+ENVIRONMENT_NAME_RE = re.compile(r"\s*\{([^{}%]*)\}")
+WHITESPACE_RE = re.compile(r"\s*")
+
+
+class TemplateAnalysis:
+    """Matched braces and environments, command offsets and problems of one template."""
+
+    def __init__(self, code: str):
+        self.code = code
+        # Offset of each "{" -> offset just past its "}"
+        self.groups: Dict[int, int] = {}
+        # Command name (without the backslash) -> offsets of its backslash, in order
+        self.commands: Dict[str, List[int]] = {}
+        self.problems: List[str] = []
+        self._scan()
+
+    def line(self, offset: int) -> int:
+        return self.code.count("\n", 0, offset) + 1
+
+    def _scan(self):
+        braces: List[int] = []
+        environments: List[Tuple[str, int]] = []
+        for token in TOKEN_RE.finditer(self.code):
+            text = token.group()
+            if text == "{":
+                braces.append(token.start())
+            elif text == "}":
+                if not braces:
+                    self.problems.append(f"unmatched }} at line {self.line(token.start())}")
+                    continue
+                self.groups[braces.pop()] = token.end()
+            elif text[0] == "\\" and len(text) > 1 and (text[1].isalpha() or text[1] == "@"):
+                name = text[1:]
+                self.commands.setdefault(name, []).append(token.start())
+                if name in ("begin", "end"):
+                    environment = ENVIRONMENT_NAME_RE.match(self.code, token.end())
+                    if environment is None:
+                        continue
+                    if name == "begin":
+                        environments.append((environment.group(1), token.start()))
+                    elif not environments:
+                        self.problems.append(f"\\end{{{environment.group(1)}}} at line {self.line(token.start())} "
+                                             f"has no \\begin")
+                    else:
+                        opened, offset = environments.pop()
+                        if opened != environment.group(1):
+                            self.problems.append(f"\\end{{{environment.group(1)}}} at line {self.line(token.start())} "
+                                                 f"closes \\begin{{{opened}}} from line {self.line(offset)}")
+        for offset in braces:
+            self.problems.append(f"{{ at line {self.line(offset)} is never closed")
+        for opened, offset in environments:
+            self.problems.append(f"\\begin{{{opened}}} at line {self.line(offset)} is never closed")
+        if not self.problems and self.environment_start("document") is None:
+            self.problems.append("no \\begin{document}")
+
+    def position(self, command: str) -> Optional[int]:
+        """Offset of the first \\command, if the template uses it."""
+        offsets = self.commands.get(command)
+        return offsets[0] if offsets else None
+
+    def block(self, command: str) -> Optional[Tuple[int, int]]:
+        """Start and end of the first \\command{...} (the command and its brace-matched argument)."""
+        for offset in self.commands.get(command, []):
+            brace = WHITESPACE_RE.match(self.code, offset + 1 + len(command)).end()
+            if brace in self.groups:
+                return offset, self.groups[brace]
+        return None
+
+    def environment_start(self, name: str) -> Optional[int]:
+        """Offset of the first \\begin{name}."""
+        for offset in self.commands.get("begin", []):
+            environment = ENVIRONMENT_NAME_RE.match(self.code, offset + len("\\begin"))
+            if environment is not None and environment.group(1) == name:
+                return offset
+        return None
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import os
+import shutil
+from typing import Dict, List, Optional, Set
+
+from engine.compile_pool import CompileResult, compile_pool
+from engine.engines import TexEngine
+from engine.formats import PreparedCompile, format_cache
+from engine.sandbox import kill_group, limit_resources, process_options, sandbox_env
+from engine.templates import TemplateRegistry
+from engine.workspace import BuildWorkspace
+
+logger = logging.getLogger(__name__)
+
+# Idle TeX processes kept ready per template format (0 turns warm mode off)
+WARM_WORKERS_PER_FORMAT = int(os.environ.get("LATEX_WARM_WORKERS", "1"))
+
+
+class WarmProcess:
+    """
+    A TeX process that has already loaded a template's format and is
+    blocked reading its next line from stdin. It handles exactly one document
+    and then exits; the pool starts a fresh one to take its place.
+    """
+
+    def __init__(self, fmt_name: str, process: asyncio.subprocess.Process,
+                 workspace: BuildWorkspace, args: List[str]):
+        self.fmt_name = fmt_name
+        self.process = process
+        self.workspace = workspace
+        self.args = args
+
+    @property
+    def alive(self) -> bool:
+        return self.process.returncode is None
+
+
+class WarmPool:
+    """
+    Keeps pre-started TeX processes for each template format so a
+    request skips process start-up, format loading and the kpathsea
+    lookups for the preamble, and only pays for typesetting its body.
+    Processes for a format no watched template uses any more (its preamble
+    changed, or the template is gone) are killed when the registry changes,
+    and all of them on shutdown.
+    """
+
+    def __init__(self, size: int = WARM_WORKERS_PER_FORMAT):
+        self.size = size
+        self._idle: Dict[str, List[WarmProcess]] = {}
+        self._spawning: Dict[str, int] = {}
+        # Registry -> names of the formats its templates use now
+        self._current: Dict[int, Set[str]] = {}
+        # Bumped by close(), so processes that were still starting are retired too
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def _spawn(self, fmt_name: str, env: Dict[str, str], engine: TexEngine) -> WarmProcess:
+        workspace = BuildWorkspace()
+        args = engine.warm_args(fmt_name, workspace.path)
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            cwd=workspace.path,
+            env={**os.environ, **sandbox_env(workspace.path), **env},
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            **process_options(),
+        )
+        limit_resources(process)
+        # The first line makes TeX load the format; it then waits at the "*" prompt.
+        # (Scroll mode, because nonstop mode refuses to read from the terminal.)
+        process.stdin.write(b"\\relax\n")
+        await process.stdin.drain()
+        return WarmProcess(fmt_name, process, workspace, args)
+
+    def _wanted(self, fmt_name: str) -> bool:
+        return not self._current or fmt_name in set().union(*self._current.values())
+
+    async def _replenish(self, fmt_name: str, env: Dict[str, str], engine: TexEngine):
+        generation = self._generation
+        missing = self.size - len(self._idle.get(fmt_name, [])) - self._spawning.get(fmt_name, 0)
+        for _ in range(missing):
+            self._spawning[fmt_name] = self._spawning.get(fmt_name, 0) + 1
+            try:
+                warm = await self._spawn(fmt_name, env, engine)
+                # The format may have been retired (or the pool closed) while it started
+                if generation == self._generation and self._wanted(fmt_name):
+                    self._idle.setdefault(fmt_name, []).append(warm)
+                else:
+                    await self._retire(warm)
+            except OSError as e:
+                logger.warning("Could not start warm %s for %s: %s", engine.name, fmt_name, e)
+                return
+            finally:
+                self._spawning[fmt_name] -= 1
+
+    @staticmethod
+    async def _retire(warm: WarmProcess):
+        kill_group(warm.process)
+        await warm.process.wait()
+        warm.workspace.discard()
+
+    def watch(self, registry: TemplateRegistry):
+        """Reaps stale warm processes whenever the registry's templates change."""
+        registry.add_change_listener(self._schedule_reap)
+
+    def _schedule_reap(self, registry: TemplateRegistry):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        asyncio.ensure_future(self.reap(registry))
+
+    async def reap(self, registry: TemplateRegistry):
+        """Kills idle processes whose format none of the watched registries' templates use now."""
+        names = set()
+        for name in registry.names():
+            template = registry.get(name)
+            if template is not None:
+                names.add(await format_cache.name_for(template.name, template.code))
+        self._current[id(registry)] = names
+        stale = [fmt_name for fmt_name in self._idle if not self._wanted(fmt_name)]
+        for fmt_name in stale:
+            for warm in self._idle.pop(fmt_name):
+                await self._retire(warm)
+        if stale:
+            logger.info("Stopped warm processes for retired formats %s", ", ".join(stale))
+
+    async def close(self):
+        """Kills every idle process and discards its workspace (on shutdown)."""
+        self._generation += 1
+        idle, self._idle = self._idle, {}
+        await asyncio.gather(*(self._retire(warm) for processes in idle.values() for warm in processes))
+
+    def _take(self, fmt_name: str) -> Optional[WarmProcess]:
+        idle = self._idle.get(fmt_name, [])
+        while idle:
+            warm = idle.pop()
+            if warm.alive:
+                return warm
+            warm.workspace.discard()
+        return None
+
+    async def compile(self, prepared: PreparedCompile, env: Dict[str, str],
+                      workspace: BuildWorkspace, check: bool = True) -> Optional[CompileResult]:
+        """
+        Compiles a prepared body-only document on a warm process, moving its
+        outputs into `workspace` as document.pdf/.log/.aux. Returns None when no
+        warm process is ready (the caller should compile normally); either way
+        a replacement is started in the background.
+        """
+        if self.size <= 0 or prepared.fmt_name is None:
+            return None
+        warm = self._take(prepared.fmt_name)
+        asyncio.ensure_future(self._replenish(prepared.fmt_name, env, prepared.engine))
+        if warm is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        # Carry over the .aux of an earlier compile in this workspace (editing sessions),
+        # so cross-references resolve on the first pass like they would in place
+        previous_aux = workspace.file("document.aux")
+        if os.path.exists(previous_aux):
+            shutil.copyfile(previous_aux, warm.workspace.file("document.aux"))
+        # The sandbox only lets the process read inside its own folder, so the body goes there too
+        body_path = warm.workspace.file(os.path.basename(prepared.body_path))
+        shutil.copyfile(prepared.body_path, body_path)
+        try:
+            # Errors from here on must not wait for terminal input, so switch to batch mode
+            # (the log is read instead, see engine.texlog). communicate() closes stdin
+            # afterwards, so a stuck TeX sees EOF and exits.
+            command = f"\\batchmode\\input{{{body_path}}}\n".encode("utf-8")
+            result = await compile_pool.run_process(warm.process, warm.args + [body_path],
+                                                    command, check=check, cwd=warm.workspace.path)
+        finally:
+            for ext in (".pdf", ".log", ".aux"):
+                built = warm.workspace.file("document" + ext)
+                if os.path.exists(built):
+                    shutil.move(built, workspace.file("document" + ext))
+            warm.workspace.discard()
+        return result
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "idle": sum(len(idle) for idle in self._idle.values()),
+        }
+
+
+warm_pool = WarmPool()
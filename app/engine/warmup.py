@@ -0,0 +1,144 @@
+"""
+A throwaway compile of every template when a process starts, so the first
+real request doesn't pay for cold kpathsea databases, font maps and TFM
+files (or for building the template's format and starting its warm
+process). GET /ready answers 503 until the warm-up has finished, so a load
+balancer only sends traffic to warm instances.
+
+A template that fails its throwaway compile doesn't hold readiness back; it
+is listed in the /ready body instead. Set LATEX_WARMUP=0 to skip the
+warm-up (the process is then ready at once); LATEX_WARMUP_TIMEOUT caps how
+long it may take before the process reports ready anyway.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from engine.compile_pool import compile_pool
+from engine.escaping import escape_latex
+from engine.formats import format_cache
+from engine.pdf_cache import REPRODUCIBLE_ENV
+from engine.sandbox import CompileTerminated
+from engine.templates import Template, TemplateRegistry
+from engine.warm import warm_pool
+from engine.workspace import BuildWorkspace
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.environ.get("LATEX_WARMUP", "1") != "0"
+WARMUP_TIMEOUT_SECONDS = float(os.environ.get("LATEX_WARMUP_TIMEOUT", "300"))
+
+
+def throwaway_document(template: Template) -> str:
+    """The template with every placeholder filled with its own name, printed literally."""
+    return template.compiled().render({token: escape_latex(token) for token in template.placeholders})
+
+
+class Warmup:
+    """The startup warm-up of each template registry, and whether it has finished."""
+
+    def __init__(self, enabled: bool = WARMUP_ENABLED, timeout: float = WARMUP_TIMEOUT_SECONDS):
+        self.enabled = enabled
+        self.timeout = timeout
+        # (loop, registry) -> its warm-up; services sharing a registry warm it once
+        self._tasks: Dict[tuple, asyncio.Task] = {}
+        # Template name -> how its throwaway compile went
+        self.results: Dict[str, Dict] = {}
+        self.timed_out = False
+        self.started_at: Optional[float] = None
+        self.seconds: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        if not self.enabled:
+            return True
+        return bool(self._tasks) and all(task.done() for task in self._tasks.values())
+
+    def start(self, registry: TemplateRegistry, warm_processes: bool = True):
+        """
+        Starts warming the registry's templates on the running loop (once per
+        loop and registry). warm_processes=False for services that don't
+        compile through the warm pool, so none is started for them.
+        """
+        if not self.enabled:
+            return
+        loop = asyncio.get_running_loop()
+        key = (loop, id(registry))
+        if key not in self._tasks:
+            if self.started_at is None:
+                self.started_at = time.perf_counter()
+            self._tasks[key] = loop.create_task(self._run(registry, warm_processes))
+
+    async def _run(self, registry: TemplateRegistry, warm_processes: bool):
+        templates = [registry.get(name) for name in registry.names()]
+        try:
+            await asyncio.wait_for(asyncio.gather(*(self.warm(t, warm_processes) for t in templates if t is not None)),
+                                   self.timeout)
+        except asyncio.TimeoutError:
+            self.timed_out = True
+            logger.warning("Warm-up still running after %gs; reporting ready anyway", self.timeout)
+        self.seconds = time.perf_counter() - self.started_at
+        failed = self.failed()
+        logger.info("Warmed up %d templates in %.1fs%s", len(templates), self.seconds,
+                    f" ({', '.join(failed)} failed)" if failed else "")
+
+    async def warm(self, template: Template, warm_processes: bool = True) -> Dict:
+        """Compiles the template once, the way a request would, and throws the result away."""
+        started = time.perf_counter()
+        workspace = BuildWorkspace()
+        result: Dict = {"ok": False}
+        try:
+            prepared = await format_cache.prepare_compile(
+                template.name, template.code, throwaway_document(template),
+                workspace.file("document.tex"), workspace.path
+            )
+            env = {**REPRODUCIBLE_ENV, **prepared.env}
+            # Takes no warm process yet, but leaves one started for the first request
+            compiled = await warm_pool.compile(prepared, env, workspace, check=False) if warm_processes else None
+            if compiled is None:
+                compiled = await compile_pool.run(prepared.args, cwd=workspace.path, env=env, check=False)
+            result["ok"] = compiled.returncode == 0
+            if not result["ok"]:
+                result["error"] = f"{prepared.engine.name} exited with {compiled.returncode}"
+        except OSError as e:
+            # Usually the engine isn't installed
+            result["error"] = str(e)
+        except CompileTerminated as e:
+            result["error"] = e.detail
+        except Exception as e:
+            # Anything else would end the whole warm-up; record it against this template
+            logger.exception("Warm-up of %s failed", template.name)
+            result["error"] = f"{type(e).__name__}: {e}"
+        finally:
+            workspace.discard()
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        self.results[template.name] = result
+        return result
+
+    def status(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "enabled": self.enabled,
+            "seconds": round(self.seconds, 3) if self.seconds is not None else None,
+            "timed_out": self.timed_out,
+            "templates": self.results,
+        }
+
+    def failed(self) -> List[str]:
+        return [name for name, result in self.results.items() if not result["ok"]]
+
+
+warmup = Warmup()
+
+ready_router = APIRouter()
+
+
+@ready_router.get("/ready")
+async def ready():
+    """200 once this process has warmed up its templates, 503 until then."""
+    return JSONResponse(warmup.status(), status_code=200 if warmup.ready else 503)
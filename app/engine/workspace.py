@@ -0,0 +1,62 @@
+import asyncio
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+
+def _default_build_root() -> str:
+    # RAM-backed when available, so the .tex/.aux/.log churn never touches disk
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return os.path.join("/dev/shm", "writer2-builds")
+    return os.path.join(tempfile.gettempdir(), "writer2-builds")
+
+
+BUILD_ROOT = os.environ.get("LATEX_BUILD_ROOT", _default_build_root())
+
+
+class BuildWorkspace:
+    """
+    A private scratch directory for one compile. Concurrent requests never
+    share .tex/.aux/.log files, even when they use the same output filename.
+    """
+
+    def __init__(self, root: str = BUILD_ROOT, path: Optional[str] = None):
+        if path is not None:
+            # Reopen an existing workspace (e.g. one kept by an editing session)
+            self.path = path
+            return
+        os.makedirs(root, exist_ok=True)
+        # Absolute, since compiles run with this folder as their working directory
+        self.path = tempfile.mkdtemp(prefix="build-", dir=os.path.abspath(root))
+
+    def file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def discard(self):
+        """Deletes the workspace in a background thread so the request doesn't wait on it."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            shutil.rmtree(self.path, ignore_errors=True)
+            return
+        loop.run_in_executor(None, shutil.rmtree, self.path, True)
+
+
+def publish(source_path: str, destination_path: str) -> str:
+    """
+    Copies a finished PDF to its final location atomically: readers see either
+    the previous file or the complete new one, never a partial write.
+    """
+    folder = os.path.dirname(destination_path)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".publish-", suffix=".tmp")
+    os.close(fd)
+    try:
+        shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, destination_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return destination_path
@@ -1,19 +1,31 @@
 import os
-import subprocess
-from typing import Dict
-from fastapi import FastAPI, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
+import sys
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
-app = FastAPI()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from engine.artifacts import artifact_file, pdf_response
+from engine.batch import stream_zip
+from engine.cancellation import document_key, latest_wins
+from engine.compile_pool import compile_pool, engine_version
+from engine.escaping import check_input, escape_input
+from engine.formats import format_cache
+from engine.jobs import job_queue
+from engine.metrics import record_compile, stage, track
+from engine.pdf_cache import REPRODUCIBLE_ENV, pdf_cache
+from engine.preview import PREVIEW_DPI, preview_response, with_draft
+from engine.services import create_app
+from engine.sessions import EditSession, session_store
+from engine.store import DEFAULT_OWNER, request_owner, store_for
+from engine.templates import group_placeholders, registry_for
+from engine.texlog import SourceMap, compile_failure
+from engine.warm import warm_pool
+from engine.warmup import warmup
+from engine.workspace import BuildWorkspace
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000", "http://127.0.0.1:3000"],  # Added 127.0.0.1
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 # Paths
 TEMPLATE_FOLDER = r"C:\Users\DELL\OneDrive\Desktop\writer2\Tempelates"
 OUTPUT_FOLDER = r"C:\Users\DELL\OneDrive\Desktop\writer2\outputs"
@@ -39,100 +51,251 @@ class CoverLetterData(BaseModel):
     template_name: str
     cover_letter_data: Dict[str, str]
     output_filename: str
+    raw_latex: List[str] = []  # fields kept as LaTeX (not escaped), e.g. ["cover_letter_data.PlaceHolderBody"]
 
-@app.get("/")
+template_registry = registry_for(TEMPLATE_FOLDER)
+template_registry.add_listener(format_cache.build_in_background)
+warm_pool.watch(template_registry)
+artifact_store = store_for(OUTPUT_FOLDER)
+
+@asynccontextmanager
+async def lifespan(app):
+    """Loads the templates into memory and keeps watching the folder for changes."""
+    template_registry.refresh()
+    template_registry.start_watching()
+    artifact_store.start_sweeping()
+    # Throwaway compiles in the background; /ready answers once they're done
+    warmup.start(template_registry)
+    yield
+
+router = APIRouter(lifespan=lifespan)
+
+@router.get("/")
 async def root():
     """Root endpoint to verify API is running."""
     return {"message": "Cover Letter Generator API is running"}
 
-@app.get("/templates")
+@router.get("/templates")
 async def list_templates():
     """Lists all available LaTeX templates."""
-    if not os.path.isdir(TEMPLATE_FOLDER):
+    if not template_registry.folder_exists:
         raise HTTPException(status_code=404, detail="Template folder not found")
     
-    text_files = [f for f in os.listdir(TEMPLATE_FOLDER) if f.endswith(".txt")]
+    text_files = template_registry.names((".txt",))
     
     if not text_files:
         raise HTTPException(status_code=404, detail="No templates found")
     
     return {i + 1: file for i, file in enumerate(text_files)}
 
-@app.get("/placeholders")
-async def get_placeholders():
-    """Returns all available placeholders for cover letters."""
-    return {
-        "cover_letter": COVER_LETTER_PLACEHOLDERS
-    }
-
-@app.post("/generate-cover-letter")
-async def generate_cover_letter(cover_letter_data: CoverLetterData):
-    """Generates a cover letter PDF from a template with provided data."""
-    template_path = os.path.join(TEMPLATE_FOLDER, cover_letter_data.template_name)
-    if not os.path.exists(template_path):
+@router.get("/placeholders")
+async def get_placeholders(template_name: Optional[str] = None):
+    """
+    Returns the cover letter placeholders found in the templates.
+    Pass template_name to list only the ones a single template uses.
+    """
+    labels = {"cover_letter": COVER_LETTER_PLACEHOLDERS}
+    if template_name is None:
+        return group_placeholders([template_registry.get(name) for name in template_registry.names()], labels)
+    template = template_registry.get(template_name)
+    if template is None:
+        raise HTTPException(status_code=404, detail="Template not found")
+    return group_placeholders([template], labels, include_unlabelled=True)
+
+def letter_source_map(template, values: Dict[str, str]) -> SourceMap:
+    """Where each cover letter field ended up in the rendered letter."""
+    latex_code, spans = template.compiled().render_spans(values)
+    return SourceMap(latex_code, [(start, end, f"cover_letter_data.{slot}") for start, end, slot in spans])
+
+
+async def build_cover_letter(cover_letter_data: CoverLetterData, session: Optional[EditSession] = None,
+                             draft: bool = False, publish_output: bool = True,
+                             owner: str = DEFAULT_OWNER) -> Dict:
+    """
+    Renders and compiles one cover letter. Returns the response body plus the
+    "etag" (cache key) of the PDF; raises HTTPException on failure.
+    With an editing session the compile reuses the session's folder (and .aux).
+    A draft build (for previews) skips images and links and isn't published;
+    otherwise the PDF is published to the owner's folder of the output store
+    (unless publish_output is False, e.g. for a full-quality preview).
+    User text is escaped (except the fields in raw_latex, which are checked)
+    and a LaTeX error is reported with the field it came from.
+    """
+    track("cover_letter")
+    with stage("template"):
+        template = template_registry.get(cover_letter_data.template_name)
+    if template is None:
         raise HTTPException(status_code=404, detail="Template not found")
+    with stage("escape"):
+        cover_letter_data = escape_input(cover_letter_data)
     
     try:
-        # Read the template
-        with open(template_path, "r", encoding="utf-8") as f:
-            latex_code = f.read()
-        
-        modified_code = latex_code
+        latex_code = template.code
         
-        # Replace all cover letter placeholders
-        for placeholder, value in cover_letter_data.cover_letter_data.items():
-            if placeholder in modified_code:
-                modified_code = modified_code.replace(placeholder, value)
-        
-        # Ensure output directory exists
-        os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+        # Fill all cover letter placeholders in one pass
+        with stage("render"):
+            modified_code = template.compiled().render(cover_letter_data.cover_letter_data)
         
         # Create output filename
         output_filename = cover_letter_data.output_filename
         if not output_filename.endswith('.pdf'):
             output_filename += '.pdf'
-        
-        # Create temporary tex file
-        tex_file_path = os.path.join(OUTPUT_FOLDER, output_filename.replace(".pdf", ".tex"))
-        with open(tex_file_path, "w", encoding="utf-8") as f:
-            f.write(modified_code)
-        
-        # Generate PDF using pdflatex
-        process = subprocess.run(
-            ["pdflatex", "-output-directory", OUTPUT_FOLDER, tex_file_path],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        
-        # Verify PDF was created
-        pdf_path = os.path.join(OUTPUT_FOLDER, output_filename)
-        if not os.path.exists(pdf_path):
-            raise HTTPException(status_code=500, detail="Failed to generate PDF")
-        
-        # Clean up auxiliary files
-        for ext in ['.aux', '.log']:
-            aux_file = os.path.join(OUTPUT_FOLDER, output_filename.replace('.pdf', ext))
-            if os.path.exists(aux_file):
-                os.remove(aux_file)
-        
+
+        async def compile_pdf(workspace: BuildWorkspace) -> str:
+            # Create tex file in a private scratch folder (plus a body-only copy if the template has a format)
+            tex_file_path = workspace.file("document.tex")
+            with stage("write"):
+                prepared = await format_cache.prepare_compile(
+                    cover_letter_data.template_name, latex_code, modified_code, tex_file_path, workspace.path
+                )
+
+            # Generate PDF using pdflatex (runs in the shared pool, off the event loop),
+            # on an already-started process that has the template's format loaded if one is ready
+            env = {**REPRODUCIBLE_ENV, **prepared.env}
+            result = await warm_pool.compile(prepared, env, workspace, check=False)
+            if result is None:
+                result = await compile_pool.run(prepared.args, cwd=workspace.path, env=env, check=False)
+            record_compile(result)
+
+            # Verify PDF was created; if not, report the first error and the field it came from
+            built_pdf = workspace.file("document.pdf")
+            if result.returncode != 0 or not os.path.exists(built_pdf):
+                raise compile_failure(workspace.file("document.log"), modified_code, prepared.line_offset,
+                                      lambda: letter_source_map(template, cover_letter_data.cover_letter_data))
+            return built_pdf
+
+        if draft:
+            # Preview build: images and links off, and the output file is left alone
+            modified_code = with_draft(modified_code)
+
+        # Identical letters are served from the PDF cache instead of recompiling
+        with stage("cache_key"):
+            cache_key = pdf_cache.key_for(modified_code, cover_letter_data.template_name,
+                                          await engine_version(template.engine.command))
+        workspace = session.workspace if session is not None else BuildWorkspace()
+        try:
+            cached_path, cache_hit = await pdf_cache.get_or_compile(cache_key, lambda: compile_pdf(workspace))
+        finally:
+            # Auxiliary files go with the workspace, off the request path (a session keeps its own)
+            if session is None:
+                with stage("cleanup"):
+                    workspace.discard()
+        if draft or not publish_output:
+            pdf_path = cached_path
+        else:
+            with stage("publish"):
+                pdf_path = await artifact_store.publish_pdf(cached_path, output_filename, cache_key, owner,
+                                                            cover_letter_data.template_name, "cover_letter")
+
         return {
             "message": "Cover letter PDF generated successfully",
             "path": pdf_path,
-            "filename": output_filename
+            "filename": output_filename,
+            "cached": cache_hit,
+            "etag": f'"{cache_key}"',
+            "artifact_id": cache_key
         }
         
-    except subprocess.CalledProcessError as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"LaTeX compilation failed: {e.stderr}"
-        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error generating cover letter PDF: {str(e)}"
         )
 
+@router.post("/generate-cover-letter")
+async def generate_cover_letter(cover_letter_data: CoverLetterData, request: Request, response: Response,
+                                download: bool = False):
+    """
+    Generates a cover letter PDF from a template with provided data.
+    With ?download=true the PDF itself is returned instead of its server path.
+    """
+    result = await latest_wins.run(request, build_cover_letter(cover_letter_data, owner=request_owner(request)),
+                                   key=document_key(request, "cover_letter"))
+    etag = result.pop("etag")
+    if download:
+        # The content-addressed copy; a build with the same output name may replace the published one
+        return pdf_response(request, artifact_file(result["artifact_id"]), etag, os.path.basename(result["path"]))
+    response.headers["ETag"] = etag
+    return result
+
+@router.post("/preview")
+async def preview_cover_letter(cover_letter_data: CoverLetterData, request: Request, page: int = 1,
+                               dpi: int = PREVIEW_DPI, format: str = "png", draft: bool = True):
+    """
+    Compiles the cover letter (a quick draft by default) and returns one page
+    as a low-resolution PNG or WebP. The X-Artifact-Id header names the PDF.
+    """
+    # Previews only need the cached PDF, never a published copy
+    build = build_cover_letter(cover_letter_data, draft=draft, publish_output=False, owner=request_owner(request))
+    result = await latest_wins.run(request, build, key=document_key(request, "cover_letter"))
+    return await preview_response(request, result["artifact_id"], page, dpi, format)
+
+@router.post("/generate-cover-letter-batch")
+async def generate_cover_letter_batch(items: List[CoverLetterData], request: Request):
+    """
+    Generates many cover letters at once. Compiles run in parallel through the
+    shared compile pool and the response is a ZIP streamed as each PDF finishes,
+    ending with a manifest.json that reports the status of every item.
+    """
+    if not items:
+        raise HTTPException(status_code=400, detail="No items to generate")
+    owner = request_owner(request)
+    jobs = [(item.output_filename, build_cover_letter(item, owner=owner)) for item in items]
+    return StreamingResponse(
+        stream_zip(jobs),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="cover_letters.zip"'}
+    )
+
+@router.post("/jobs/generate-cover-letter")
+async def submit_cover_letter_job(cover_letter_data: CoverLetterData, priority: int = 0):
+    """
+    Queues the document for a worker (worker.py) instead of compiling it in
+    this process. Poll GET /jobs/{job_id} and download GET /jobs/{job_id}/result.
+    Higher priority jobs run first.
+    """
+    check_input(cover_letter_data)  # turns bad raw LaTeX away now rather than in the worker
+    job_id = await job_queue.submit("cover_letter", cover_letter_data.model_dump(), priority=priority)
+    return {"job_id": job_id, "status": "queued"}
+
+@router.post("/sessions")
+async def open_cover_letter_session(cover_letter_data: CoverLetterData, request: Request, response: Response):
+    """
+    Starts an editing session and builds the first version. Afterwards send
+    PATCH /sessions/{session_id} with only the fields that changed.
+    """
+    session_id = session_store.create("cover_letter", cover_letter_data.model_dump(mode="json"))
+    return await patch_cover_letter_session(session_id, {}, request, response)
+
+@router.patch("/sessions/{session_id}")
+async def patch_cover_letter_session(session_id: str, patch: Dict[str, Any], request: Request,
+                                     response: Response):
+    """
+    Applies a JSON merge patch (e.g. {"cover_letter_data": {"PlaceHolderBody": "..."}})
+    to the session's letter and rebuilds it.
+    """
+    # Claimed before waiting for the session, so an older build is killed right away
+    generation = latest_wins.claim(session_id)
+    async with session_store.open(session_id, "cover_letter") as session:
+        # The patch is applied even if this build gets superseded, so no edit is lost
+        cover_letter_data = session.apply(patch, CoverLetterData)
+        result = await latest_wins.run(request, build_cover_letter(cover_letter_data, session, owner=request_owner(request)),
+                                       session_id, generation)
+        response.headers["ETag"] = result.pop("etag")
+        return {**result, "session_id": session_id}
+
+@router.delete("/sessions/{session_id}")
+async def close_cover_letter_session(session_id: str):
+    """Ends an editing session and deletes its files."""
+    if not session_store.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"session_id": session_id, "status": "closed"}
+
+# Standalone app for this service alone; server.py serves all of them together
+app = create_app([(router, "")])
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="127.0.0.1", port=8001, reload=True)
\ No newline at end of file
@@ -70,7 +70,7 @@ const CoverLetterForm: React.FC = () => {
   useEffect(() => {
     const fetchTemplates = async () => {
       try {
-        const response = await fetch('http://127.0.0.1:8001/templates');
+        const response = await fetch('http://127.0.0.1:8000/letter/templates');
         const data = await response.json();
         setTemplates(data);
       } catch (error) {
@@ -124,7 +124,7 @@ const CoverLetterForm: React.FC = () => {
     };
 
     try {
-      const response = await fetch('http://127.0.0.1:8001/generate-cover-letter', {
+      const response = await fetch('http://127.0.0.1:8000/letter/generate-cover-letter', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
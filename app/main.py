@@ -1,19 +1,34 @@
+import logging
 import os
-import subprocess
-from typing import Dict, List
-from fastapi import FastAPI, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
+import sys
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
-app = FastAPI()
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from engine.artifacts import artifact_file, pdf_response
+from engine.autofit import Layout, autofit
+from engine.batch import stream_zip
+from engine.cancellation import document_key, latest_wins
+from engine.compile_pool import compile_pool, engine_version
+from engine.escaping import check_input, escape_input
+from engine.formats import format_cache
+from engine.jobs import job_queue
+from engine.metrics import record_compile, stage, track
+from engine.pdf_cache import REPRODUCIBLE_ENV, pdf_cache
+from engine.preview import PREVIEW_DPI, preview_response, with_draft
+from engine.services import create_app
+from engine.sessions import EditSession, session_store
+from engine.store import DEFAULT_OWNER, request_owner, store_for
+from engine.templates import group_placeholders, registry_for
+from engine.texlog import SourceMap, compile_failure
+from engine.warm import warm_pool
+from engine.warmup import warmup
+from engine.workspace import BuildWorkspace
+
+logger = logging.getLogger(__name__)
 
 # Original paths
 TEMPLATE_FOLDER = r"C:\Users\DELL\OneDrive\Desktop\writer2\Tempelates"
@@ -47,7 +62,7 @@ EXPERIENCE_PLACEHOLDERS = {
     "PlaceHolderExperiencePositionStartYear": "Start Year",
     "PlaceHolderExperiencePositionEndMonth": "End Month",
     "PlaceHolderExperiencePositionEndYear": "End Year",
-    "PlaceHolderExpeienceItem1": "Experience Description"
+    "PlaceHolderExperienceItem1": "Experience Description"
 }
 
 
@@ -66,6 +81,55 @@ SKILLS_PLACEHOLDERS = {
     "PlaceHolderSkillItem1": "Skills List"
 }
 
+# Blocks in the template that get replaced wholesale by the generated sections.
+# Matching ignores differences in whitespace between the pieces.
+SECTION_PATTERNS = {
+    "education": (
+        "\\resumeSubHeadingListStart\n"
+        "    \\resumeEducation\n"
+        "      {PlaceHolderEducation}\n"
+        "      {PlaceHolderLocation1}\n"
+        "      {PlaceHolderCourse}\n"
+        "      {PlaceHolderStartMonth PlaceHolderStartYear -- PlaceHolderEndMonth PlaceHolderEndYear}\n"
+        "      {PlaceHolderScore}\n"
+        "\\resumeSubHeadingListEnd"
+    ),
+    "experience": (
+        "  \\resumeSubHeadingListStart\n"
+        "    \\resumeSubheading\n"
+        "      {PlaceHolderExperiencePosition1}{PlaceHolderExperiencePositionStartMonth PlaceHolderExperiencePositionStartYear -- PlaceHolderExperiencePositionEndMonth PlaceHolderExperiencePositionStartYear}\n"
+        "      {PlaceHolderExperiencePositionCompany}{PlaceHolderExperiencePositionLocation}\n"
+        "      \\resumeItemListStart\n"
+        "        \\resumeItem{PlaceHolderExperienceItem1}\n"
+        "      \\resumeItemListEnd\n"
+        "  \\resumeSubHeadingListEnd"
+    ),
+    "project": (
+        "    \\resumeSubHeadingListStart\n"
+        "      \\resumeProjectHeading\n"
+        "          {\\textbf{PlaceHolderProjectTitle} $|$ \\emph{PlaceHolderProjectTool1}}{PlaceHolderProjectStartMonth PlaceHolderProjectStartYear -- PlaceHolderProjectEndMonth PlaceHolderProjectEndYear}\n"
+        "          \\resumeItemListStart\n"
+        "            \\resumeItem{PlaceHolderProjectItem1}\n"
+        "          \\resumeItemListEnd\n"
+        "    \\resumeSubHeadingListEnd"
+    ),
+    "skills": (
+        "\\begin{itemize}[leftmargin=0.15in, label={}]\n"
+        "    \\small{\\item{\n"
+        "     \\textbf{PlaceHolderSkillType1}{: PlaceHolderSkillItem1} \n"
+        "    }}\n"
+        " \\end{itemize}"
+    ),
+}
+
+# The lines that start an entry and an item in each generated section
+SECTION_MARKERS = {
+    "education": ("\\resumeEducation", None),
+    "experience": ("\\resumeSubheading", "\\resumeItem{"),
+    "project": ("\\resumeProjectHeading", "\\resumeItem{"),
+    "skills": ("\\small{\\item{", None),
+}
+
 class EducationEntry(BaseModel):
     education: str
     course: str
@@ -120,35 +184,72 @@ class TemplateData(BaseModel):
     project_entries: List[ProjectEntry]
     skill_entries: List[SkillType]  # Add this line
     output_filename: str
+    raw_latex: List[str] = []  # fields kept as LaTeX (not escaped), e.g. ["project_entries"]
 
-@app.get("/")
+def check_sections(template):
+    """
+    Splits a newly loaded template into its sections now rather than on the
+    first request, and warns if it looks like a resume with some missing.
+    """
+    missing = template.compiled(SECTION_PATTERNS).missing
+    if missing and len(missing) < len(SECTION_PATTERNS):
+        logger.warning("Resume template %s has no %s section; it can't be used", template.name, ", ".join(missing))
+
+template_registry = registry_for(TEMPLATE_FOLDER)
+template_registry.add_listener(format_cache.build_in_background)
+warm_pool.watch(template_registry)
+template_registry.add_listener(check_sections)
+artifact_store = store_for(OUTPUT_FOLDER)
+
+@asynccontextmanager
+async def lifespan(app):
+    """Loads the templates into memory and keeps watching the folder for changes."""
+    template_registry.refresh()
+    template_registry.start_watching()
+    artifact_store.start_sweeping()
+    # Throwaway compiles in the background; /ready answers once they're done
+    warmup.start(template_registry)
+    yield
+
+router = APIRouter(lifespan=lifespan)
+
+@router.get("/")
 async def root():
     """Root endpoint to verify API is running."""
     return {"message": "LaTeX Template Processing API is running"}
 
-@app.get("/templates")
+@router.get("/templates")
 async def list_templates():
     """Lists all available LaTeX templates."""
-    if not os.path.isdir(TEMPLATE_FOLDER):
+    if not template_registry.folder_exists:
         raise HTTPException(status_code=404, detail="Template folder not found")
     
-    text_files = [f for f in os.listdir(TEMPLATE_FOLDER) if f.endswith(".txt")]
+    text_files = template_registry.names((".txt",))
     
     if not text_files:
         raise HTTPException(status_code=404, detail="No templates found")
     
     return {i + 1: file for i, file in enumerate(text_files)}
 
-@app.get("/placeholders")
-async def get_placeholders():
-    """Returns all available placeholders."""
-    return {
+@router.get("/placeholders")
+async def get_placeholders(template_name: Optional[str] = None):
+    """
+    Returns the placeholders found in the templates, grouped by section.
+    Pass template_name to list only the ones a single template uses.
+    """
+    labels = {
         "basic_info": BASIC_PLACEHOLDERS,
         "education": EDUCATION_PLACEHOLDERS,
         "experience": EXPERIENCE_PLACEHOLDERS,
         "project": PROJECT_PLACEHOLDERS,
-        "skill":SKILLS_PLACEHOLDERS
+        "skill": SKILLS_PLACEHOLDERS
     }
+    if template_name is None:
+        return group_placeholders([template_registry.get(name) for name in template_registry.names()], labels)
+    template = template_registry.get(template_name)
+    if template is None:
+        raise HTTPException(status_code=404, detail="Template not found")
+    return group_placeholders([template], labels, include_unlabelled=True)
 
 def generate_education_latex(entries: List[EducationEntry]) -> str:
     """
@@ -232,123 +333,255 @@ def generate_skills_latex(entries: List[SkillType]) -> str:
     
     return " \\begin{itemize}[leftmargin=0.15in, label={}]\n" + "\n".join(skill_lines) + "\n \\end{itemize}"
 
-@app.post("/generate-pdf")
-async def generate_pdf(template_data: TemplateData):
-    """Generates a PDF from a template with provided data."""
+def resume_source_map(template, values: Dict[str, str]) -> SourceMap:
+    """Where each basic info field, section, entry and item ended up in the rendered resume."""
+    latex_code, spans = template.compiled(SECTION_PATTERNS).render_spans(values)
+    source_map = SourceMap(latex_code)
+    for start, end, slot in spans:
+        if slot in SECTION_MARKERS:
+            source_map.add(start, end, slot)
+            source_map.add_entries(start, end, slot, *SECTION_MARKERS[slot])
+        else:
+            source_map.add(start, end, f"basic_info.{slot}")
+    return source_map
+
+
+async def build_pdf(template_data: TemplateData, session: Optional[EditSession] = None,
+                    draft: bool = False, layout: Optional[Layout] = None, publish_output: bool = True,
+                    owner: str = DEFAULT_OWNER) -> Dict:
+    """
+    Renders and compiles one resume. Returns the response body plus the
+    "etag" (cache key) of the PDF; raises HTTPException on failure.
+    With an editing session, only the sections whose entries changed are
+    regenerated and the compile reuses the session's folder (and .aux).
+    A draft build (for previews) skips images and links and isn't published;
+    otherwise the PDF is published to the owner's folder of the output store.
+    A layout adjusts fonts, margins and spacing (see engine.autofit).
+    User text is escaped (except the fields in raw_latex, which are checked)
+    and a LaTeX error is reported with the section, entry and item it came from.
+    """
+    track("resume")
     # Validate template exists
-    template_path = os.path.join(TEMPLATE_FOLDER, template_data.template_name)
-    if not os.path.exists(template_path):
+    with stage("template"):
+        template = template_registry.get(template_data.template_name)
+    if template is None:
         raise HTTPException(status_code=404, detail="Template not found")
+    compiled = template.compiled(SECTION_PATTERNS)
+    if compiled.missing:
+        # Never compile a template the sections can't go into
+        raise HTTPException(status_code=422, detail=f"Template {template.name} has no "
+                                                    f"{', '.join(compiled.missing)} section to fill")
+    with stage("escape"):
+        template_data = escape_input(template_data)
     try:
-        # Read template
-        with open(template_path, "r", encoding="utf-8") as f:
-            latex_code = f.read()
-        
-        # Replace basic info placeholders
-        modified_code = latex_code
-        for placeholder, value in template_data.basic_info.items():
-            if placeholder in BASIC_PLACEHOLDERS:
-                modified_code = modified_code.replace(placeholder, value)
-        
-        # Replace education section
-        education_pattern = (
-            "\\resumeSubHeadingListStart\n"
-            "    \\resumeEducation\n"
-            "      {PlaceHolderEducation}\n"
-            "      {PlaceHolderLocation1}\n"
-            "      {PlaceHolderCourse}\n"
-            "      {PlaceHolderStartMonth PlaceHolderStartYear -- PlaceHolderEndMonth PlaceHolderEndYear}\n"
-            "      {PlaceHolderScore}\n"
-            "\\resumeSubHeadingListEnd"
-        )
-        education_section = generate_education_latex(template_data.education_entries)
-        modified_code = modified_code.replace(education_pattern, education_section)
+        latex_code = template.code
         
-        # Replace experience section
-        experience_pattern = (
-            "  \\resumeSubHeadingListStart\n"
-            "    \\resumeSubheading\n"
-            "      {PlaceHolderExperiencePosition1}{PlaceHolderExperiencePositionStartMonth PlaceHolderExperiencePositionStartYear -- PlaceHolderExperiencePositionEndMonth PlaceHolderExperiencePositionStartYear}\n"
-            "      {PlaceHolderExperiencePositionCompany}{PlaceHolderExperiencePositionLocation}\n"
-            "      \\resumeItemListStart\n"
-            "        \\resumeItem{PlaceHolderExperienceItem1}\n"
-            "      \\resumeItemListEnd\n"
-            "  \\resumeSubHeadingListEnd"
-        )
-        experience_section = generate_experience_latex(template_data.experience_entries)
-        modified_code = modified_code.replace(experience_pattern, experience_section)
-
-        project_pattern = (
-            "    \\resumeSubHeadingListStart\n"
-            "      \\resumeProjectHeading\n"
-            "          {\\textbf{PlaceHolderProjectTitle} $|$ \\emph{PlaceHolderProjectTool1}}{PlaceHolderProjectStartMonth PlaceHolderProjectStartYear -- PlaceHolderProjectEndMonth PlaceHolderProjectEndYear}\n"
-            "          \\resumeItemListStart\n"
-            "            \\resumeItem{PlaceHolderProjectItem1}\n"
-            "          \\resumeItemListEnd\n"
-            "    \\resumeSubHeadingListEnd"
-        )
-        project_section = generate_project_latex(template_data.project_entries)
-        print(project_section)
-        modified_code = modified_code.replace(project_pattern, project_section)
-
-        skills_pattern = (
-            "\\begin{itemize}[leftmargin=0.15in, label={}]\n"
-            "    \\small{\\item{\n"
-            "     \\textbf{PlaceHolderSkillType1}{: PlaceHolderSkillItem1} \n"
-            "    }}\n"
-            " \\end{itemize}"
-        )
-        skills_section = generate_skills_latex(template_data.skill_entries)
-        modified_code = modified_code.replace(skills_pattern, skills_section)
+        # Fill basic info placeholders and the four sections in one pass
+        values = {
+            placeholder: value
+            for placeholder, value in template_data.basic_info.items()
+            if placeholder in BASIC_PLACEHOLDERS
+        }
+        section = session.section if session is not None else (lambda name, inputs, render: render())
+        with stage("sections"):
+            values["education"] = section("education", template_data.education_entries,
+                                          lambda: generate_education_latex(template_data.education_entries))
+            values["experience"] = section("experience", template_data.experience_entries,
+                                           lambda: generate_experience_latex(template_data.experience_entries))
+            values["project"] = section("project", template_data.project_entries,
+                                        lambda: generate_project_latex(template_data.project_entries))
+            values["skills"] = section("skills", template_data.skill_entries,
+                                       lambda: generate_skills_latex(template_data.skill_entries))
+        with stage("render"):
+            modified_code = compiled.render(values)
 
-        # Ensure output directory exists
-        os.makedirs(OUTPUT_FOLDER, exist_ok=True)
-        
         # Create output filename
         output_filename = template_data.output_filename
         if not output_filename.endswith('.pdf'):
             output_filename += '.pdf'
-        
-        # Create temporary tex file
-        tex_file_path = os.path.join(OUTPUT_FOLDER, output_filename.replace(".pdf", ".tex"))
-        with open(tex_file_path, "w", encoding="utf-8") as f:
-            f.write(modified_code)
-        
-        # Generate PDF using pdflatex
-        process = subprocess.run(
-            ["pdflatex", "-output-directory", OUTPUT_FOLDER, tex_file_path],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        
-        # Verify PDF was created
-        pdf_path = os.path.join(OUTPUT_FOLDER, output_filename)
-        if not os.path.exists(pdf_path):
-            raise HTTPException(status_code=500, detail="Failed to generate PDF")
-        
-        # Clean up auxiliary files
-        for ext in ['.aux', '.log']:
-            aux_file = os.path.join(OUTPUT_FOLDER, output_filename.replace('.pdf', ext))
-            if os.path.exists(aux_file):
-                os.remove(aux_file)
-        
+
+        async def compile_pdf(workspace: BuildWorkspace) -> str:
+            # Create tex file in a private scratch folder (plus a body-only copy if the template has a format)
+            tex_file_path = workspace.file("document.tex")
+            with stage("write"):
+                prepared = await format_cache.prepare_compile(
+                    template_data.template_name, latex_code, modified_code, tex_file_path, workspace.path
+                )
+
+            # Generate PDF using pdflatex (runs in the shared pool, off the event loop),
+            # on an already-started process that has the template's format loaded if one is ready
+            env = {**REPRODUCIBLE_ENV, **prepared.env}
+            result = await warm_pool.compile(prepared, env, workspace, check=False)
+            if result is None:
+                result = await compile_pool.run(prepared.args, cwd=workspace.path, env=env, check=False)
+            record_compile(result)
+
+            # Verify PDF was created; if not, report the first error and the entry it came from
+            built_pdf = workspace.file("document.pdf")
+            if result.returncode != 0 or not os.path.exists(built_pdf):
+                raise compile_failure(workspace.file("document.log"), modified_code, prepared.line_offset,
+                                      lambda: resume_source_map(template, values))
+            return built_pdf
+
+        if layout is not None:
+            modified_code = layout.apply(modified_code)
+        if draft:
+            # Preview build: images and links off, and the output file is left alone
+            modified_code = with_draft(modified_code)
+
+        # Identical documents are served from the PDF cache instead of recompiling
+        with stage("cache_key"):
+            cache_key = pdf_cache.key_for(modified_code, template_data.template_name,
+                                          await engine_version(template.engine.command))
+        workspace = session.workspace if session is not None else BuildWorkspace()
+        try:
+            cached_path, cache_hit = await pdf_cache.get_or_compile(cache_key, lambda: compile_pdf(workspace))
+        finally:
+            # Auxiliary files go with the workspace, off the request path (a session keeps its own)
+            if session is None:
+                with stage("cleanup"):
+                    workspace.discard()
+        if draft or not publish_output:
+            pdf_path = cached_path
+        else:
+            with stage("publish"):
+                pdf_path = await artifact_store.publish_pdf(cached_path, output_filename, cache_key, owner,
+                                                            template_data.template_name, "resume")
+
         return {
             "message": "PDF generated successfully",
-            "path": pdf_path
+            "path": pdf_path,
+            "cached": cache_hit,
+            "etag": f'"{cache_key}"',
+            "artifact_id": cache_key
         }
         
-    except subprocess.CalledProcessError as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"LaTeX compilation failed: {e.stderr}"
-        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error generating PDF: {str(e)}"
         )
 
+@router.post("/generate-pdf")
+async def generate_pdf(template_data: TemplateData, request: Request, response: Response,
+                       download: bool = False):
+    """
+    Generates a PDF from a template with provided data.
+    With ?download=true the PDF itself is returned instead of its server path.
+    """
+    result = await latest_wins.run(request, build_pdf(template_data, owner=request_owner(request)),
+                                   key=document_key(request, "resume"))
+    etag = result.pop("etag")
+    if download:
+        # The content-addressed copy; a build with the same output name may replace the published one
+        return pdf_response(request, artifact_file(result["artifact_id"]), etag, os.path.basename(result["path"]))
+    response.headers["ETag"] = etag
+    return result
+
+@router.post("/generate-pdf-autofit")
+async def generate_pdf_autofit(template_data: TemplateData, request: Request, response: Response,
+                               max_pages: int = 1, download: bool = False):
+    """
+    Like /generate-pdf, but compiles a few layouts (font size, margins, spacing)
+    in parallel and keeps the loosest one that fits in max_pages pages. The
+    result includes its page count, whether it fits and the layout used.
+    """
+    if max_pages < 1:
+        raise HTTPException(status_code=400, detail="max_pages must be at least 1")
+
+    async def fit() -> Dict:
+        best = await autofit(lambda layout: build_pdf(template_data, layout=layout, publish_output=False),
+                             max_pages)
+        # Publish the chosen layout like a normal build (the PDF is cached by now)
+        result = await build_pdf(template_data, layout=Layout(**best["layout"]), owner=request_owner(request))
+        return {**result, **{key: best[key] for key in ("cached", "pages", "fits", "layout", "candidates")}}
+
+    result = await latest_wins.run(request, fit(), key=document_key(request, "resume"))
+    etag = result.pop("etag")
+    if download:
+        # The content-addressed copy; a build with the same output name may replace the published one
+        return pdf_response(request, artifact_file(result["artifact_id"]), etag, os.path.basename(result["path"]))
+    response.headers["ETag"] = etag
+    return result
+
+@router.post("/preview")
+async def preview_pdf(template_data: TemplateData, request: Request, page: int = 1, dpi: int = PREVIEW_DPI,
+                      format: str = "png", draft: bool = True):
+    """
+    Compiles the resume (a quick draft by default) and returns one page as a
+    low-resolution PNG or WebP. The X-Artifact-Id header names the PDF.
+    """
+    # Previews only need the cached PDF, never a published copy
+    build = build_pdf(template_data, draft=draft, publish_output=False, owner=request_owner(request))
+    result = await latest_wins.run(request, build, key=document_key(request, "resume"))
+    return await preview_response(request, result["artifact_id"], page, dpi, format)
+
+@router.post("/generate-pdf-batch")
+async def generate_pdf_batch(items: List[TemplateData], request: Request):
+    """
+    Generates many resumes at once. Compiles run in parallel through the shared
+    compile pool and the response is a ZIP streamed as each PDF finishes, ending
+    with a manifest.json that reports the status of every item.
+    """
+    if not items:
+        raise HTTPException(status_code=400, detail="No items to generate")
+    owner = request_owner(request)
+    jobs = [(item.output_filename, build_pdf(item, owner=owner)) for item in items]
+    return StreamingResponse(
+        stream_zip(jobs),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="resumes.zip"'}
+    )
+
+@router.post("/jobs/generate-pdf")
+async def submit_resume_job(template_data: TemplateData, priority: int = 0):
+    """
+    Queues the document for a worker (worker.py) instead of compiling it in
+    this process. Poll GET /jobs/{job_id} and download GET /jobs/{job_id}/result.
+    Higher priority jobs run first.
+    """
+    check_input(template_data)  # turns bad raw LaTeX away now rather than in the worker
+    job_id = await job_queue.submit("resume", template_data.model_dump(), priority=priority)
+    return {"job_id": job_id, "status": "queued"}
+
+@router.post("/sessions")
+async def open_resume_session(template_data: TemplateData, request: Request, response: Response):
+    """
+    Starts an editing session and builds the first version. Afterwards send
+    PATCH /sessions/{session_id} with only the fields that changed.
+    """
+    session_id = session_store.create("resume", template_data.model_dump(mode="json"))
+    return await patch_resume_session(session_id, {}, request, response)
+
+@router.patch("/sessions/{session_id}")
+async def patch_resume_session(session_id: str, patch: Dict[str, Any], request: Request,
+                               response: Response):
+    """
+    Applies a JSON merge patch (e.g. {"skill_entries": [...]}) to the session's
+    document and rebuilds it, regenerating only the sections that changed.
+    """
+    # Claimed before waiting for the session, so an older build is killed right away
+    generation = latest_wins.claim(session_id)
+    async with session_store.open(session_id, "resume") as session:
+        # The patch is applied even if this build gets superseded, so no edit is lost
+        template_data = session.apply(patch, TemplateData)
+        result = await latest_wins.run(request, build_pdf(template_data, session, owner=request_owner(request)),
+                                       session_id, generation)
+        response.headers["ETag"] = result.pop("etag")
+        return {**result, "session_id": session_id, "rerendered": session.rerendered}
+
+@router.delete("/sessions/{session_id}")
+async def close_resume_session(session_id: str):
+    """Ends an editing session and deletes its files."""
+    if not session_store.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"session_id": session_id, "status": "closed"}
+
+# Standalone app for this service alone; server.py serves all of them together
+app = create_app([(router, "")])
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
\ No newline at end of file
@@ -128,10 +128,10 @@ const TemplateForm: React.FC = () => {
     if (entry.scoreType === 'cgpa') {
       return `CGPA: ${sanitizedScore}`;
     } else {
-      // Ensure the percentage has the % symbol
+      // Ensure the percentage has the % symbol (the server escapes it for LaTeX)
       const scoreWithSymbol = sanitizedScore.includes('%') 
         ? sanitizedScore 
-        : `${sanitizedScore}\\%`;
+        : `${sanitizedScore}%`;
       return `Percentage: ${scoreWithSymbol}`;
     }
   };
@@ -139,7 +139,7 @@ const TemplateForm: React.FC = () => {
   useEffect(() => {
     const fetchTemplates = async () => {
       try {
-        const response = await fetch('http://127.0.0.1:8000/templates');
+        const response = await fetch('http://127.0.0.1:8000/resume/templates');
         const data = await response.json();
         setTemplates(data);
       } catch (error) {
@@ -384,7 +384,7 @@ const TemplateForm: React.FC = () => {
     }));
   
     try {
-      const response = await fetch('http://127.0.0.1:8000/generate-pdf', {
+      const response = await fetch('http://127.0.0.1:8000/resume/generate-pdf', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
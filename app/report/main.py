@@ -1,19 +1,33 @@
+import logging
 import os
-import subprocess
-from typing import List
-from fastapi import FastAPI, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
+import sys
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
-app = FastAPI()
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from engine.artifacts import artifact_file, pdf_response
+from engine.batch import stream_zip
+from engine.cancellation import document_key, latest_wins
+from engine.compile_pool import compile_pool, engine_version
+from engine.escaping import check_input, escape_input
+from engine.formats import format_cache
+from engine.jobs import job_queue
+from engine.metrics import record_compile, stage, track
+from engine.passes import another_pass, file_digest, starts_with_draft
+from engine.pdf_cache import REPRODUCIBLE_ENV, pdf_cache
+from engine.preview import PREVIEW_DPI, preview_response, with_draft
+from engine.services import create_app
+from engine.sessions import EditSession, session_store
+from engine.store import DEFAULT_OWNER, request_owner, store_for
+from engine.templates import group_placeholders, registry_for
+from engine.texlog import SourceMap, compile_failure
+from engine.warmup import warmup
+from engine.workspace import BuildWorkspace
+
+logger = logging.getLogger(__name__)
 
 # Paths
 TEMPLATE_FOLDER = r"C:\Users\DELL\OneDrive\Desktop\writer2\Tempelates"
@@ -48,29 +62,65 @@ class ReportTemplateData(BaseModel):
     introduction: str
     authors: List[AuthorInfo]
     output_filename: str
+    raw_latex: List[str] = []  # fields kept as LaTeX (not escaped), e.g. ["introduction"]
+
+
+# Template placeholder -> the ReportTemplateData field that fills it
+REPORT_FIELDS = {
+    "PlaceHolderTitle": "title",
+    "PlaceHolderAbstract": "abstract",
+    "PlaceHolderIndexTerms": "index_terms",
+    "PlaceHolderIntroduction": "introduction",
+}
+
+template_registry = registry_for(TEMPLATE_FOLDER)
+template_registry.add_listener(format_cache.build_in_background)
+artifact_store = store_for(OUTPUT_FOLDER)
+
 
+@asynccontextmanager
+async def lifespan(app):
+    """Loads the templates into memory and keeps watching the folder for changes."""
+    template_registry.refresh()
+    template_registry.start_watching()
+    artifact_store.start_sweeping()
+    # Throwaway compiles in the background; /ready answers once they're done. Reports
+    # compile pass by pass, never through the warm pool
+    warmup.start(template_registry, warm_processes=False)
+    yield
 
-@app.get("/")
+
+router = APIRouter(lifespan=lifespan)
+
+
+@router.get("/")
 async def root():
     return {"message": "LaTeX Report Template Processing API is running on port 8002"}
 
 
-@app.get("/report-templates")
+@router.get("/report-templates")
 async def list_templates():
     """List available templates"""
-    if not os.path.isdir(TEMPLATE_FOLDER):
+    if not template_registry.folder_exists:
         raise HTTPException(status_code=404, detail="Template folder not found")
 
-    files = [f for f in os.listdir(TEMPLATE_FOLDER) if f.endswith((".tex", ".txt"))]
+    files = template_registry.names((".tex", ".txt"))
     if not files:
         raise HTTPException(status_code=404, detail="No templates found")
 
     return {i + 1: f for i, f in enumerate(files)}
 
 
-@app.get("/report-placeholders")
-async def get_placeholders():
-    return {"report_info": REPORT_PLACEHOLDERS}
+@router.get("/report-placeholders")
+async def get_placeholders(template_name: Optional[str] = None):
+    """Placeholders found in the templates (or in one template, if given)"""
+    labels = {"report_info": REPORT_PLACEHOLDERS}
+    if template_name is None:
+        return group_placeholders([template_registry.get(name) for name in template_registry.names()], labels)
+    template = template_registry.get(template_name)
+    if template is None:
+        raise HTTPException(status_code=404, detail="Template not found")
+    return group_placeholders([template], labels, include_unlabelled=True)
 
 def generate_authors_latex(authors):
     """
@@ -115,143 +165,271 @@ def generate_authors_latex(authors):
     final_authors_block = r"\author{" + "\n\\\\[1em]\n".join(author_blocks) + "\n}"
     return final_authors_block
 
-def find_author_block_bounds(latex_code: str) -> tuple:
-    """Find the start and end positions of the \\author{...} block"""
-    # Look for \author{ (with actual backslash)
-    search_str = "\\author{"
-    author_start = latex_code.find(search_str)
-    
-    if author_start == -1:
-        return None, None
-    
-    # Find matching closing brace
-    brace_count = 0
-    i = author_start + len(search_str) - 1  # Start at the opening brace
-    
-    while i < len(latex_code):
-        if latex_code[i] == '{':
-            brace_count += 1
-        elif latex_code[i] == '}':
-            brace_count -= 1
-            if brace_count == 0:
-                return author_start, i + 1
-        i += 1
-    
-    return None, None
-
-
-@app.post("/generate-report-pdf")
-async def generate_report_pdf(template_data: ReportTemplateData):
-    """Generate PDF using a LaTeX template"""
-    template_path = os.path.join(TEMPLATE_FOLDER, template_data.template_name)
-    if not os.path.exists(template_path):
+def compiled_report(template):
+    """
+    The template with a slot for each report field and an "authors" slot: its
+    \\author{...} block, or else the spot right before \\maketitle. Both are
+    found by the template's analysis, so a request only splices them in.
+    """
+    authors = template.analysis.block("author")
+    if authors is None:
+        maketitle = template.analysis.position("maketitle")
+        authors = (maketitle, maketitle) if maketitle is not None else None
+    return template.compiled(blocks={"authors": authors})
+
+
+# Splits each new template up right away rather than on the first request
+template_registry.add_listener(compiled_report)
+
+
+def report_values(template, template_data: ReportTemplateData, authors_section: str) -> Dict[str, str]:
+    """The text for every slot of compiled_report(template)."""
+    values = {placeholder: getattr(template_data, field) for placeholder, field in REPORT_FIELDS.items()}
+    if template.analysis.block("author") is None:
+        # Inserted before \maketitle rather than replacing a block
+        authors_section += "\n\n"
+    values["authors"] = authors_section
+    return values
+
+
+def report_source_map(template, template_data: ReportTemplateData, authors_section: str) -> SourceMap:
+    """Where each report field and the author block ended up in the rendered report."""
+    values = report_values(template, template_data, authors_section)
+    latex_code, spans = compiled_report(template).render_spans(values)
+    return SourceMap(latex_code, [(start, end, REPORT_FIELDS.get(slot, slot)) for start, end, slot in spans])
+
+
+async def build_report_pdf(template_data: ReportTemplateData, session: Optional[EditSession] = None,
+                           draft: bool = False, publish_output: bool = True,
+                           owner: str = DEFAULT_OWNER) -> Dict:
+    """
+    Render and compile one report; returns the response body plus its "etag" (cache key).
+    With an editing session the author block is only regenerated when the authors
+    change, and the compile starts from the session's previous .aux.
+    A draft build (for previews) skips images and links and isn't published;
+    otherwise the PDF is published to the owner's folder of the output store
+    (unless publish_output is False, e.g. for a full-quality preview).
+    User text is escaped, except the fields in raw_latex (which are checked).
+    A LaTeX error stops the compile at once and is reported with the field it came from.
+    """
+    track("report")
+    with stage("template"):
+        template = template_registry.get(template_data.template_name)
+    if template is None:
         raise HTTPException(status_code=404, detail="Template not found")
 
     if not template_data.authors:
         raise HTTPException(status_code=400, detail="At least one author is required")
-
-    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+    compiled = compiled_report(template)
+    if compiled.missing:
+        # Never compile a template the authors can't go into
+        raise HTTPException(status_code=422, detail=f"Template {template.name} has no \\author{{...}} block "
+                                                    f"or \\maketitle to put the authors in")
+    with stage("escape"):
+        template_data = escape_input(template_data)
 
     try:
-        # Read LaTeX template with explicit encoding
-        with open(template_path, "r", encoding="utf-8") as f:
-            latex_code = f.read()
-
-        # Replace title
-        modified_code = latex_code.replace("PlaceHolderTitle", template_data.title)
-        
-        # Replace abstract
-        modified_code = modified_code.replace("PlaceHolderAbstract", template_data.abstract)
-        
-        # Replace index terms
-        modified_code = modified_code.replace("PlaceHolderIndexTerms", template_data.index_terms)
-        
-        # Replace introduction
-        modified_code = modified_code.replace("PlaceHolderIntroduction", template_data.introduction)
+        latex_code = template.code
 
         # Generate author section dynamically
-        authors_section = generate_authors_latex(template_data.authors)
-        
-        print("=" * 50)
-        print("Generated authors section:")
-        print(authors_section)
-        print("=" * 50)
-
-        # Find and replace the author block
-        start_pos, end_pos = find_author_block_bounds(modified_code)
-        
-        if start_pos is not None and end_pos is not None:
-            print(f"Found author block at positions {start_pos} to {end_pos}")
-            # Replace the author block
-            modified_code = modified_code[:start_pos] + authors_section + modified_code[end_pos:]
-        else:
-            print("No author block found, inserting before \\maketitle")
-            # If no author block found, insert before \maketitle
-            maketitle_pos = modified_code.find("\\maketitle")
-            if maketitle_pos != -1:
-                modified_code = modified_code[:maketitle_pos] + authors_section + "\n\n" + modified_code[maketitle_pos:]
+        with stage("authors"):
+            if session is not None:
+                authors_section = session.section("authors", template_data.authors,
+                                                  lambda: generate_authors_latex(template_data.authors))
             else:
-                raise HTTPException(status_code=500, detail="Could not find insertion point for authors")
+                authors_section = generate_authors_latex(template_data.authors)
+
+        # Fill title, abstract, index terms, introduction and the author block in one pass
+        with stage("render"):
+            modified_code = compiled.render(report_values(template, template_data, authors_section))
 
-        # Write temporary .tex file
+        # Create output filename
         output_filename = template_data.output_filename
         if not output_filename.endswith(".pdf"):
             output_filename += ".pdf"
 
-        tex_path = os.path.join(OUTPUT_FOLDER, output_filename.replace(".pdf", ".tex"))
-        
-        # Write with explicit UTF-8 encoding
-        with open(tex_path, "w", encoding="utf-8", newline='\n') as f:
-            f.write(modified_code)
-        
-        print(f"Wrote .tex file to: {tex_path}")
-
-        # Compile PDF twice for references
-        for run in range(2):
-            print(f"Running pdflatex (pass {run + 1})...")
-            result = subprocess.run(
-                ["pdflatex", "-interaction=nonstopmode", "-output-directory", OUTPUT_FOLDER, tex_path],
-                capture_output=True,
-                text=True,
-                check=False
-            )
-            
-            if result.returncode != 0:
-                # Log the error for debugging
-                log_path = tex_path.replace(".tex", "_error.log")
-                with open(log_path, "w", encoding="utf-8") as log_file:
-                    log_file.write("STDOUT:\n")
-                    log_file.write(result.stdout)
-                    log_file.write("\n\nSTDERR:\n")
-                    log_file.write(result.stderr)
-                print(f"LaTeX compilation error. Log saved to: {log_path}")
-
-        pdf_path = os.path.join(OUTPUT_FOLDER, output_filename)
-        if not os.path.exists(pdf_path):
-            raise HTTPException(
-                status_code=500, 
-                detail="PDF not generated. Check LaTeX errors in the error log file in the outputs folder."
-            )
-
-        # Clean up auxiliary files
-        for ext in [".aux", ".log", ".out"]:
-            file = tex_path.replace(".tex", ext)
-            if os.path.exists(file):
-                try:
-                    os.remove(file)
-                except:
-                    pass
-
-        print(f"PDF generated successfully: {pdf_path}")
-        return {"message": "Report PDF generated successfully", "path": pdf_path}
+        async def compile_pdf(workspace: BuildWorkspace) -> str:
+            # Write into a private scratch folder (plus a body-only copy if the template has a format)
+            tex_path = workspace.file("document.tex")
+            with stage("write"):
+                prepared = await format_cache.prepare_compile(
+                    template_data.template_name, latex_code, modified_code, tex_path, workspace.path
+                )
+
+            # Run only as many passes as the document needs. If it uses cross-references,
+            # the first pass just collects them in draft mode (no PDF written), unless an
+            # earlier build in this session left its .aux; after that, rerun only while
+            # the log asks for it or the .aux keeps changing. Engines that rerun by
+            # themselves (tectonic) are called once.
+            engine = prepared.engine
+            aux_path = workspace.file("document.aux")
+            draft_pass = starts_with_draft(modified_code, aux_path, engine)
+            run = 0
+            while True:
+                run += 1
+                aux_before = file_digest(aux_path)
+                result = await compile_pool.run(
+                    engine.draft(prepared.args) if draft_pass else prepared.args, cwd=workspace.path, check=False,
+                    env={**REPRODUCIBLE_ENV, **prepared.env}
+                )
+                logger.debug("%s pass %d%s queued %.2fs, ran %.2fs", engine.name, run,
+                             " (draft)" if draft_pass else "", result.queue_wait, result.run_time)
+                record_compile(result)
+
+                if result.returncode != 0:
+                    # The engine stopped at the first error. Keep its log for debugging (in the
+                    # output store, unlike the workspace) and report the error and its field.
+                    log_path = workspace.file("document.log")
+                    if os.path.exists(log_path):
+                        saved_log = await artifact_store.publish_file(
+                            log_path, output_filename.replace(".pdf", "_error.log"), owner,
+                            template_data.template_name
+                        )
+                        logger.debug("LaTeX compilation error, log saved to %s", saved_log)
+                    raise compile_failure(log_path, modified_code, prepared.line_offset,
+                                          lambda: report_source_map(template, template_data, authors_section))
+
+                if draft_pass:
+                    # A draft pass never produces the PDF, so it is never the last one
+                    draft_pass = False
+                    continue
+                if not another_pass(engine, run, workspace.file("document.log"), aux_path, aux_before):
+                    break
+
+            built_pdf = workspace.file("document.pdf")
+            if not os.path.exists(built_pdf):
+                raise HTTPException(
+                    status_code=500,
+                    detail="PDF not generated. Check LaTeX errors in the error log file in the outputs folder."
+                )
+            return built_pdf
+
+        if draft:
+            # Preview build: images and links off, and the output file is left alone
+            modified_code = with_draft(modified_code)
+
+        # Identical reports are served from the PDF cache instead of recompiling
+        with stage("cache_key"):
+            cache_key = pdf_cache.key_for(modified_code, template_data.template_name,
+                                          await engine_version(template.engine.command))
+        workspace = session.workspace if session is not None else BuildWorkspace()
+        try:
+            cached_path, cache_hit = await pdf_cache.get_or_compile(cache_key, lambda: compile_pdf(workspace))
+        finally:
+            # Auxiliary files go with the workspace, off the request path (a session keeps its own)
+            if session is None:
+                with stage("cleanup"):
+                    workspace.discard()
+        if draft or not publish_output:
+            pdf_path = cached_path
+        else:
+            with stage("publish"):
+                pdf_path = await artifact_store.publish_pdf(cached_path, output_filename, cache_key, owner,
+                                                            template_data.template_name, "report")
+
+        return {"message": "Report PDF generated successfully", "path": pdf_path, "cached": cache_hit,
+                "etag": f'"{cache_key}"', "artifact_id": cache_key}
 
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in generate_report_pdf: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Report generation failed")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/generate-report-pdf")
+async def generate_report_pdf(template_data: ReportTemplateData, request: Request, response: Response,
+                              download: bool = False):
+    """Generate PDF using a LaTeX template (?download=true returns the PDF itself)"""
+    result = await latest_wins.run(request, build_report_pdf(template_data, owner=request_owner(request)),
+                                   key=document_key(request, "report"))
+    etag = result.pop("etag")
+    if download:
+        # The content-addressed copy; a build with the same output name may replace the published one
+        return pdf_response(request, artifact_file(result["artifact_id"]), etag, os.path.basename(result["path"]))
+    response.headers["ETag"] = etag
+    return result
+
+
+@router.post("/report-preview")
+async def preview_report_pdf(template_data: ReportTemplateData, request: Request, page: int = 1,
+                             dpi: int = PREVIEW_DPI, format: str = "png", draft: bool = True):
+    """
+    Compile the report (a quick draft by default) and return one page as a
+    low-resolution PNG or WebP. The X-Artifact-Id header names the PDF.
+    """
+    # Previews only need the cached PDF, never a published copy
+    build = build_report_pdf(template_data, draft=draft, publish_output=False, owner=request_owner(request))
+    result = await latest_wins.run(request, build, key=document_key(request, "report"))
+    return await preview_response(request, result["artifact_id"], page, dpi, format)
+
+
+@router.post("/generate-report-pdf-batch")
+async def generate_report_pdf_batch(items: List[ReportTemplateData], request: Request):
+    """
+    Generate many reports at once. Compiles run in parallel through the shared
+    compile pool; the response is a ZIP streamed as each PDF finishes, ending
+    with a manifest.json that reports the status of every item.
+    """
+    if not items:
+        raise HTTPException(status_code=400, detail="No items to generate")
+    owner = request_owner(request)
+    jobs = [(item.output_filename, build_report_pdf(item, owner=owner)) for item in items]
+    return StreamingResponse(
+        stream_zip(jobs),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="reports.zip"'}
+    )
+
+
+@router.post("/jobs/generate-report-pdf")
+async def submit_report_job(template_data: ReportTemplateData, priority: int = 0):
+    """
+    Queues the document for a worker (worker.py) instead of compiling it in
+    this process. Poll GET /jobs/{job_id} and download GET /jobs/{job_id}/result.
+    Higher priority jobs run first.
+    """
+    check_input(template_data)  # turns bad raw LaTeX away now rather than in the worker
+    job_id = await job_queue.submit("report", template_data.model_dump(), priority=priority)
+    return {"job_id": job_id, "status": "queued"}
+
+
+@router.post("/report-sessions")
+async def open_report_session(template_data: ReportTemplateData, request: Request, response: Response):
+    """
+    Starts an editing session and builds the first version. Afterwards send
+    PATCH /report-sessions/{session_id} with only the fields that changed.
+    """
+    session_id = session_store.create("report", template_data.model_dump(mode="json"))
+    return await patch_report_session(session_id, {}, request, response)
+
+
+@router.patch("/report-sessions/{session_id}")
+async def patch_report_session(session_id: str, patch: Dict[str, Any], request: Request,
+                               response: Response):
+    """Applies a JSON merge patch (e.g. {"abstract": "..."}) to the session's report and rebuilds it."""
+    # Claimed before waiting for the session, so an older build is killed right away
+    generation = latest_wins.claim(session_id)
+    async with session_store.open(session_id, "report") as session:
+        # The patch is applied even if this build gets superseded, so no edit is lost
+        template_data = session.apply(patch, ReportTemplateData)
+        result = await latest_wins.run(request, build_report_pdf(template_data, session, owner=request_owner(request)),
+                                       session_id, generation)
+        response.headers["ETag"] = result.pop("etag")
+        return {**result, "session_id": session_id, "rerendered": session.rerendered}
+
+
+@router.delete("/report-sessions/{session_id}")
+async def close_report_session(session_id: str):
+    """Ends an editing session and deletes its files."""
+    if not session_store.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"session_id": session_id, "status": "closed"}
+
+
+# Standalone app for this service alone; server.py serves all of them together
+app = create_app([(router, "")])
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="127.0.0.1", port=8002, reload=True)
\ No newline at end of file
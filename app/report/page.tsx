@@ -38,7 +38,7 @@ const ReportTemplateForm: React.FC = () => {
     setMounted(true);
     const fetchTemplates = async () => {
       try {
-        const response = await fetch('http://127.0.0.1:8002/report-templates');
+        const response = await fetch('http://127.0.0.1:8000/report/report-templates');
         const data: Templates = await response.json();
         setTemplates(data);
       } catch (error) {
@@ -103,7 +103,7 @@ const ReportTemplateForm: React.FC = () => {
     try {
       const indexTermsStr = indexTerms.filter(term => term.trim()).join(', ');
 
-      const response = await fetch('http://127.0.0.1:8002/generate-report-pdf', {
+      const response = await fetch('http://127.0.0.1:8000/report/generate-report-pdf', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
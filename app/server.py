@@ -0,0 +1,144 @@
+"""
+All document services in one app. The resume, cover letter and report
+routers share one compile pool, PDF cache, format cache and template
+registry instead of each service running its own process:
+
+    /resume/...     resume API        (standalone: main.py, port 8000)
+    /letter/...     cover letter API  (standalone: letter/main.py, port 8001)
+    /report/...     report API        (standalone: report/main.py, port 8002)
+    /artifacts/..., /jobs/...         shared by all of them
+
+Development (single process, reloads on code changes):
+
+    python server.py --reload
+
+Production (loads the templates and builds their formats once, then forks
+the workers so they share that memory copy-on-write and start ready):
+
+    python server.py --workers 4
+
+Each worker has its own compile pool, so the CPUs are split between them:
+with 4 workers on 8 cores each runs at most 2 compiles at once. Setting
+LATEX_MAX_CONCURRENCY overrides that; it is then the limit of every worker.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from engine.compile_pool import compile_pool
+from engine.formats import format_cache
+from engine.services import SERVICES, create_app, load_service
+
+logger = logging.getLogger(__name__)
+
+services = {kind: load_service(kind) for kind in SERVICES}
+
+app = create_app([(services[kind].router, SERVICES[kind][3]) for kind in SERVICES])
+
+
+@app.get("/")
+async def root():
+    return {
+        "message": "Writer API is running",
+        "services": {kind: SERVICES[kind][3] for kind in SERVICES},
+    }
+
+
+def preload():
+    """Parses every template and builds its format in this process, before any worker exists."""
+    registries = {id(module.template_registry): module.template_registry for module in services.values()}
+    templates = []
+    for registry in registries.values():
+        registry.refresh()
+        templates.extend(registry.get(name) for name in registry.names())
+    for module in services.values():
+        for template in templates:
+            template.compiled(getattr(module, "SECTION_PATTERNS", None))
+
+    async def build_formats():
+        await asyncio.gather(*(format_cache.ensure(t.name, t.code) for t in templates))
+
+    asyncio.run(build_formats())
+    logger.info("Preloaded %d templates", len(templates))
+
+
+def serve_forked(host: str, port: int, workers: int):
+    """Pre-fork server: workers inherit the preloaded app and accept on one shared socket."""
+    import uvicorn
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    if "LATEX_MAX_CONCURRENCY" not in os.environ:
+        # One pool per worker; together they shouldn't run more compiles than there are CPUs
+        compile_pool.max_concurrency = max(1, (os.cpu_count() or 1) // workers)
+    logger.info("Listening on http://%s:%d with %d workers (%d compiles each)", host, port, workers,
+                compile_pool.max_concurrency)
+
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                uvicorn.Server(uvicorn.Config(app, log_level="info")).run(sockets=[sock])
+            finally:
+                os._exit(0)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for _ in range(workers):
+        spawn()
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            # Keep the worker count up if one dies
+            logger.warning("Worker %d exited (%d); starting a new one", pid, status)
+            spawn()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run all document services in one app")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes to fork after preloading (needs os.fork)")
+    parser.add_argument("--reload", action="store_true", help="restart on code changes (development)")
+    args = parser.parse_args()
+    # The engine modules log through `logging`; show their warnings and startup notes
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(name)s: %(message)s")
+
+    import uvicorn
+    if args.reload:
+        uvicorn.run("server:app", host=args.host, port=args.port, reload=True)
+    elif args.workers > 1 and hasattr(os, "fork"):
+        preload()
+        serve_forked(args.host, args.port, args.workers)
+    else:
+        preload()
+        uvicorn.run(app, host=args.host, port=args.port)
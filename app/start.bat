@@ -9,24 +9,12 @@ cd /d "C:\Users\DELL\OneDrive\Desktop\writer2"
 start cmd /k "npm run dev"
 timeout /t 5
 
-REM Start Resume API (port 8000)
-echo Starting Resume API on port 8000...
+REM Start the API (resume, cover letter and report in one app, port 8000)
+echo Starting API on port 8000...
 cd /d "C:\Users\DELL\OneDrive\Desktop\writer2\app"
-start cmd /k "python main.py"
+start cmd /k "python server.py --reload"
 timeout /t 3
 
-REM Start Cover Letter API (port 8001)
-echo Starting Cover Letter API on port 8001...
-cd /d "C:\Users\DELL\OneDrive\Desktop\writer2\app\letter"
-start cmd /k "python main.py"
-timeout /t 2
-
-REM Start Report API (port 8002)
-echo Starting Report API on port 8002...
-cd /d "C:\Users\DELL\OneDrive\Desktop\writer2\app\report"
-start cmd /k "python main.py"
-timeout /t 2
-
 REM Open VS Code
 echo Opening VS Code...
 cd /d "C:\Users\DELL\OneDrive\Desktop\writer2"
@@ -34,9 +22,9 @@ start code .
 
 echo ========================================
 echo All services started!
-echo Resume API: http://127.0.0.1:8000
-echo Cover Letter API: http://127.0.0.1:8001
-echo Report API: http://127.0.0.1:8001
+echo Resume API: http://127.0.0.1:8000/resume
+echo Cover Letter API: http://127.0.0.1:8000/letter
+echo Report API: http://127.0.0.1:8000/report
 echo Frontend: http://localhost:3000
 echo ========================================
 pause
\ No newline at end of file
@@ -0,0 +1,76 @@
+"""
+Standalone compile worker for the job queue.
+
+Submit jobs through the POST /jobs/... endpoints of any service, then run as
+many workers as you like, on any machine that shares the job database, the
+template folder and the output folder:
+
+    python worker.py --concurrency 4
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import HTTPException
+from engine.compile_pool import MAX_CONCURRENT_COMPILES
+from engine.jobs import JOB_LEASE_SECONDS, job_queue
+from engine.services import SERVICES, load_service
+
+logger = logging.getLogger(__name__)
+
+
+async def heartbeat(job_id: str, worker_id: str):
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+        await job_queue.heartbeat(job_id, worker_id)
+
+
+async def run_job(job, worker_id: str):
+    logger.info("[%s] job %s (%s, attempt %d)", worker_id, job["id"], job["kind"], job["attempts"])
+    beat = asyncio.ensure_future(heartbeat(job["id"], worker_id))
+    try:
+        module = load_service(job["kind"])
+        _, build_name, model_name, _ = SERVICES[job["kind"]]
+        build, model = getattr(module, build_name), getattr(module, model_name)
+        # Cheap when nothing changed; picks up template edits between jobs
+        module.template_registry.refresh()
+        result = await build(model(**job["payload"]))
+        await job_queue.complete(job["id"], worker_id, result)
+    except HTTPException as e:
+        await job_queue.fail(job["id"], worker_id, str(e.detail))
+    except Exception as e:
+        logger.exception("Job %s failed", job["id"])
+        await job_queue.fail(job["id"], worker_id, str(e))
+    finally:
+        beat.cancel()
+
+
+async def work(concurrency: int, poll_interval: float):
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    slots = asyncio.Semaphore(concurrency)
+    logger.info("Worker %s polling %s with %d slots", worker_id, job_queue.path, concurrency)
+    while True:
+        await slots.acquire()
+        job = await job_queue.claim(worker_id)
+        if job is None:
+            slots.release()
+            await asyncio.sleep(poll_interval)
+            continue
+        task = asyncio.ensure_future(run_job(job, worker_id))
+        task.add_done_callback(lambda _: slots.release())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run queued LaTeX compile jobs")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENT_COMPILES,
+                        help="jobs to run at once (default: LATEX_MAX_CONCURRENCY)")
+    parser.add_argument("--poll-interval", type=float, default=0.5,
+                        help="seconds to wait when the queue is empty")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(name)s: %(message)s")
+    asyncio.run(work(args.concurrency, args.poll_interval))
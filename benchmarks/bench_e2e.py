@@ -0,0 +1,122 @@
+"""
+End-to-end latency of the three services, run in-process through their
+FastAPI apps (request validation, rendering, the compile pool, the PDF cache).
+By default pdflatex is replaced by benchmarks/fake_pdflatex.py with a fixed
+latency, so the numbers measure the service around the compiler; --real-tex
+uses the installed TeX instead.
+
+    python benchmarks/bench_e2e.py [--requests 50] [--concurrency 4] [--latency 0.05]
+                                   [--cached] [--real-tex] [--save] [--compare results/e2e-....json]
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import httpx
+
+import common
+from common import letter_payload, report_payload, resume_payload
+
+common.isolate_caches()
+
+# Service -> (endpoint, payload for request number i)
+ENDPOINTS: Dict[str, tuple] = {
+    "resume": ("/generate-pdf", lambda i, tag: resume_payload(5, tag=f"{tag}{i}")),
+    "cover_letter": ("/generate-cover-letter", lambda i, tag: letter_payload(f"{tag}{i}")),
+    "report": ("/generate-report-pdf", lambda i, tag: report_payload(3, tag=f"{tag}{i}")),
+}
+
+
+def load_app(kind: str, template_folder: str = common.TEMPLATE_FOLDER):
+    """The service's standalone app, pointed at the repo's templates and a temporary output folder."""
+    from engine.services import load_service
+    from engine.store import store_for
+
+    module = load_service(kind)
+    module.OUTPUT_FOLDER = tempfile.mkdtemp(prefix=f"writer2-bench-{kind}-")
+    module.artifact_store = store_for(module.OUTPUT_FOLDER)
+    # Re-point the service's own registry, which carries its listeners (format builds, section checks)
+    module.template_registry.folder = template_folder
+    module.template_registry.refresh()
+    return module.app
+
+
+async def run_service(kind: str, requests: int, concurrency: int, cached: bool) -> Dict:
+    endpoint, payload = ENDPOINTS[kind]
+    app = load_app(kind)
+    # Unique payloads miss the PDF cache, so every request compiles
+    tag = "cached" if cached else f"{time.time_ns()}-"
+    make_payload: Callable[[int], Dict] = (lambda i: payload(0, tag)) if cached else (lambda i: payload(i, tag))
+    latencies: List[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        if cached:
+            await client.post(endpoint, json=make_payload(0))  # warm the cache
+
+        async def one(i: int):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(endpoint, json=make_payload(i))
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+                    if errors == 1:
+                        print(f"  {kind}: HTTP {response.status_code} {response.text[:200]}", file=sys.stderr)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - started
+
+    return {**common.summarize(latencies), "errors": errors, "throughput_rps": requests / elapsed}
+
+
+async def run(args) -> Dict:
+    results = {}
+    for kind in args.services.split(","):
+        results[kind] = await run_service(kind, args.requests, args.concurrency, args.cached)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--services", default="resume,cover_letter,report")
+    parser.add_argument("--requests", type=int, default=50, help="requests per service")
+    parser.add_argument("--concurrency", type=int, default=4, help="requests in flight at once")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds the pdflatex stub takes per run")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random stub latency, up to this many seconds")
+    parser.add_argument("--cached", action="store_true", help="repeat one payload to measure PDF cache hits")
+    parser.add_argument("--real-tex", action="store_true", help="compile with the installed pdflatex")
+    parser.add_argument("--verbose", action="store_true", help="show the services' log output")
+    parser.add_argument("--save", action="store_true", help="save results under benchmarks/results/")
+    parser.add_argument("--compare", help="a saved result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="slowdown counted as a regression")
+    args = parser.parse_args()
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(name)s: %(message)s")
+
+    if not args.real_tex:
+        common.install_fake_pdflatex(args.latency, args.jitter)
+    results = asyncio.run(run(args))
+
+    print(f"{'service':<14} {'n':>5} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'req/s':>8}")
+    for kind, result in results.items():
+        print(f"{kind:<14} {result['n']:>5} {result['errors']:>4} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} "
+              f"{result['p99_ms']:>9.1f} {result['max_ms']:>9.1f} {result['throughput_rps']:>8.1f}")
+
+    settings = {key: value for key, value in vars(args).items() if key not in ("save", "compare", "verbose")}
+    name = "e2e-real" if args.real_tex else "e2e"
+    if args.save:
+        print(f"\nSaved {common.save_results(name, results, settings)}")
+    if args.compare and common.compare(results, args.compare, args.threshold, settings):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Compiles every template under every installed TeX engine and recommends,
+for each, the fastest engine whose PDF has as many pages as the one the
+template uses now. Documents go through the services with sample payloads,
+like bench_e2e.py, so formats and warm processes count where an engine has
+them; the first compile per template and engine is a warm-up and not timed.
+
+    python benchmarks/bench_engines.py [--runs 5] [--engines pdflatex,lualatex,xelatex,tectonic]
+                                       [--fake] [--save] [--compare results/engines-....json]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+import httpx
+
+import common
+from bench_e2e import ENDPOINTS, load_app
+
+common.isolate_caches()
+
+from engine.autofit import page_count  # noqa: E402
+from engine.engines import ENGINES, MAGIC_COMMENT_RE, requested_engine  # noqa: E402
+from engine.templates import TEMPLATE_EXTENSIONS  # noqa: E402
+
+
+def sample_kinds() -> Dict[str, str]:
+    """Template name -> the service whose sample payload fills it."""
+    return {payload(0, "")["template_name"]: kind for kind, (_, payload) in ENDPOINTS.items()}
+
+
+def templates_for(engine: str) -> str:
+    """A copy of the template folder with every template switched to `engine`; returns the folder."""
+    folder = tempfile.mkdtemp(prefix=f"writer2-engine-{engine}-")
+    for name in os.listdir(common.TEMPLATE_FOLDER):
+        if not name.endswith(TEMPLATE_EXTENSIONS):
+            continue
+        with open(os.path.join(common.TEMPLATE_FOLDER, name), "r", encoding="utf-8") as f:
+            code = MAGIC_COMMENT_RE.sub("", f.read())
+        with open(os.path.join(folder, name), "w", encoding="utf-8") as f:
+            f.write(f"% !TEX program = {engine}\n" + code)
+    return folder
+
+
+async def run_template(kind: str, template: str, engine: str, folder: str, runs: int) -> Dict:
+    endpoint, payload = ENDPOINTS[kind]
+    app = load_app(kind, folder)
+    latencies: List[float] = []
+    pages: Optional[int] = None
+    errors = 0
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                 timeout=None) as client:
+        for i in range(runs + 1):
+            # A fresh payload each time, so every request compiles
+            body = {**payload(i, f"{engine}-{time.time_ns()}-"), "template_name": template}
+            started = time.perf_counter()
+            response = await client.post(endpoint, json=body)
+            elapsed = time.perf_counter() - started
+            if response.status_code != 200:
+                errors += 1
+                if errors == 1:
+                    print(f"  {template} on {engine}: HTTP {response.status_code} {response.text[:200]}",
+                          file=sys.stderr)
+                continue
+            pages = page_count(response.json()["path"])
+            if i > 0:
+                latencies.append(elapsed)
+    return {**common.summarize(latencies), "errors": errors, "pages": pages}
+
+
+async def run(args) -> Dict:
+    kinds = sample_kinds()
+    results = {}
+    for engine in args.engines:
+        folder = templates_for(engine)
+        for template, kind in kinds.items():
+            results[f"{template}[{engine}]"] = await run_template(kind, template, engine, folder, args.runs)
+    return results
+
+
+def recommend(template: str, engines: List[str], results: Dict) -> Optional[str]:
+    """The fastest engine that compiled the template to the same page count as its current engine."""
+    with open(os.path.join(common.TEMPLATE_FOLDER, template), "r", encoding="utf-8") as f:
+        current = requested_engine(f.read())
+    compiled = {engine: results[f"{template}[{engine}]"] for engine in engines
+                if results[f"{template}[{engine}]"]["pages"] is not None and results[f"{template}[{engine}]"]["n"]}
+    if not compiled:
+        return None
+    if current in compiled:
+        pages = compiled[current]["pages"]
+    else:
+        pages = Counter(result["pages"] for result in compiled.values()).most_common(1)[0][0]
+    equivalent = [engine for engine, result in compiled.items() if result["pages"] == pages]
+    return min(equivalent, key=lambda engine: compiled[engine]["p50_ms"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="timed compiles per template and engine")
+    parser.add_argument("--engines", help="comma separated (default: every installed engine)")
+    parser.add_argument("--fake", action="store_true", help="use the pdflatex stub for every engine")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds the stub takes per run (--fake)")
+    parser.add_argument("--verbose", action="store_true", help="show the services' log output")
+    parser.add_argument("--save", action="store_true", help="save results under benchmarks/results/")
+    parser.add_argument("--compare", help="a saved result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="slowdown counted as a regression")
+    args = parser.parse_args()
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(name)s: %(message)s")
+
+    if args.engines:
+        args.engines = args.engines.split(",")
+        unknown = [engine for engine in args.engines if engine not in ENGINES]
+        if unknown:
+            raise SystemExit(f"Unknown engines: {', '.join(unknown)} (known: {', '.join(ENGINES)})")
+    if args.fake:
+        args.engines = args.engines or list(ENGINES)
+        common.install_fake_pdflatex(args.latency, commands=[ENGINES[engine].command for engine in args.engines])
+    elif args.engines:
+        missing = [engine for engine in args.engines if not ENGINES[engine].installed]
+        if missing:
+            raise SystemExit(f"Not installed: {', '.join(missing)}")
+    else:
+        args.engines = [engine.name for engine in ENGINES.values() if engine.installed]
+        if not args.engines:
+            raise SystemExit("No TeX engine installed; use --fake to try the benchmark with the stub")
+    results = asyncio.run(run(args))
+
+    print(f"{'template':<14} {'engine':<10} {'n':>4} {'err':>4} {'pages':>6} {'p50 ms':>9} {'p95 ms':>9}")
+    for case, result in results.items():
+        template, engine = case[:-1].split("[")
+        p50 = f"{result['p50_ms']:>9.1f}" if result["n"] else f"{'-':>9}"
+        p95 = f"{result['p95_ms']:>9.1f}" if result["n"] else f"{'-':>9}"
+        print(f"{template:<14} {engine:<10} {result['n']:>4} {result['errors']:>4} "
+              f"{str(result['pages'] or '-'):>6} {p50} {p95}")
+
+    print()
+    for template in sample_kinds():
+        best = recommend(template, args.engines, results)
+        if best is None:
+            print(f"{template}: no engine compiled it")
+        else:
+            print(f"{template}: fastest with the same page count is {best} (% !TEX program = {best})")
+
+    settings = {key: value for key, value in vars(args).items() if key not in ("save", "compare", "verbose")}
+    name = "engines-fake" if args.fake else "engines"
+    if args.save:
+        print(f"\nSaved {common.save_results(name, results, settings)}")
+    if args.compare and common.compare(results, args.compare, args.threshold, settings):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
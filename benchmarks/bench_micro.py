@@ -0,0 +1,101 @@
+"""
+Micro-benchmarks of the pure-Python rendering steps: input escaping, the
+resume section generators, the report author block, placeholder substitution
+and template analysis, on
+synthetic payloads from a one-entry CV up to a very large one.
+
+    python benchmarks/bench_micro.py [--sizes 1,10,100,1000] [--save] [--compare results/micro-....json]
+"""
+import argparse
+import sys
+import timeit
+
+import common
+from common import letter_payload, report_payload, resume_payload
+
+common.isolate_caches()
+
+from engine.escaping import escape_input  # noqa: E402
+from engine.services import load_service  # noqa: E402
+from engine.templates import registry_for  # noqa: E402
+from engine.texscan import TemplateAnalysis  # noqa: E402
+
+resume = load_service("resume")
+letter = load_service("cover_letter")
+report = load_service("report")
+templates = registry_for(common.TEMPLATE_FOLDER)
+templates.refresh()
+
+
+def time_call(func, target: float = 0.2) -> float:
+    """Best per-call time in microseconds, with enough calls per round to take ~target seconds."""
+    number, _ = timeit.Timer(func).autorange()
+    number = max(1, int(number * target / 0.2))
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def cases(size: int):
+    """(name, callable) pairs for one payload size."""
+    data = resume.TemplateData(**resume_payload(size, tag=str(size)))
+    resume_template = templates.get("resume.txt")
+    compiled_resume = resume_template.compiled(resume.SECTION_PATTERNS)
+    values = {placeholder: value for placeholder, value in data.basic_info.items()}
+    values["education"] = resume.generate_education_latex(data.education_entries)
+    values["experience"] = resume.generate_experience_latex(data.experience_entries)
+    values["project"] = resume.generate_project_latex(data.project_entries)
+    values["skills"] = resume.generate_skills_latex(data.skill_entries)
+
+    letter_data = letter.CoverLetterData(**letter_payload(str(size), paragraphs=size))
+    compiled_letter = templates.get("cv.txt").compiled()
+
+    # The IEEE template takes at most six authors
+    report_data = report.ReportTemplateData(**report_payload(min(size, 6), str(size), paragraphs=size))
+    report_template = templates.get("report.txt")
+    authors = report.generate_authors_latex(report_data.authors)
+    report_code = report.compiled_report(report_template).render(
+        report.report_values(report_template, report_data, authors)
+    )
+
+    return [
+        ("escape_input", lambda: escape_input(data)),
+        ("education", lambda: resume.generate_education_latex(data.education_entries)),
+        ("experience", lambda: resume.generate_experience_latex(data.experience_entries)),
+        ("project", lambda: resume.generate_project_latex(data.project_entries)),
+        ("skills", lambda: resume.generate_skills_latex(data.skill_entries)),
+        ("resume_substitution", lambda: compiled_resume.render(values)),
+        ("letter_substitution", lambda: compiled_letter.render(letter_data.cover_letter_data)),
+        ("report_authors", lambda: report.generate_authors_latex(report_data.authors)),
+        ("report_substitution", lambda: report.compiled_report(report_template).render(
+            report.report_values(report_template, report_data, authors))),
+        ("template_analysis", lambda: TemplateAnalysis(report_code)),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1,10,100,1000", help="entries per section, comma separated")
+    parser.add_argument("--save", action="store_true", help="save results under benchmarks/results/")
+    parser.add_argument("--compare", help="a saved result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="slowdown counted as a regression")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    results = {}
+    print(f"{'case':<22}" + "".join(f"{f'n={size} us':>14}" for size in sizes))
+    rows = {}
+    for size in sizes:
+        for name, func in cases(size):
+            per_call = time_call(func)
+            rows.setdefault(name, []).append(per_call)
+            results[f"{name}[{size}]"] = {"per_call_us": per_call}
+    for name, timings in rows.items():
+        print(f"{name:<22}" + "".join(f"{timing:>14.1f}" for timing in timings))
+
+    if args.save:
+        print(f"\nSaved {common.save_results('micro', results, {'sizes': sizes})}")
+    if args.compare and common.compare(results, args.compare, args.threshold, {'sizes': sizes}):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
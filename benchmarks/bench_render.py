@@ -0,0 +1,62 @@
+"""
+Compares the old chain of full-document str.replace calls against the
+compiled single-pass renderer on increasingly large CV-style templates.
+
+    python benchmarks/bench_render.py
+"""
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "app"))
+
+from engine.render import compile_template  # noqa: E402
+from main import BASIC_PLACEHOLDERS, SECTION_PATTERNS  # noqa: E402
+
+
+def build_template(copies: int) -> str:
+    """resume.txt with its body repeated `copies` times, like a long multi-section CV."""
+    with open(os.path.join(ROOT, "Tempelates", "resume.txt"), "r", encoding="utf-8") as f:
+        code = f.read()
+    start = code.index("\\begin{document}") + len("\\begin{document}")
+    end = code.index("\\end{document}")
+    body = code[start:end]
+    # Only the first copy keeps the section blocks, the rest are plain text the
+    # renderer has to copy through, which is where rescanning hurts the most.
+    filler = body
+    for pattern in SECTION_PATTERNS.values():
+        filler = filler.replace(pattern, "")
+    return code[:end] + filler * (copies - 1) + code[end:]
+
+
+def legacy_render(code: str, values: dict) -> str:
+    for placeholder, value in values.items():
+        if placeholder in BASIC_PLACEHOLDERS:
+            code = code.replace(placeholder, value)
+    for name, pattern in SECTION_PATTERNS.items():
+        code = code.replace(pattern, values[name])
+    return code
+
+
+def main():
+    values = {placeholder: label for placeholder, label in BASIC_PLACEHOLDERS.items()}
+    for name in SECTION_PATTERNS:
+        values[name] = f"% generated {name} section\n"
+
+    print(f"{'copies':>7} {'size KB':>8} {'replace us':>11} {'compiled us':>12} {'speedup':>8} {'compile ms':>11}")
+    for copies in (1, 10, 100, 1000):
+        code = build_template(copies)
+        compiled = compile_template(code, SECTION_PATTERNS)
+        assert compiled.render(values) == legacy_render(code, values)
+
+        number = max(1, 2000 // copies)
+        legacy = min(timeit.repeat(lambda: legacy_render(code, values), number=number, repeat=5)) / number
+        single = min(timeit.repeat(lambda: compiled.render(values), number=number, repeat=5)) / number
+        compile_time = min(timeit.repeat(lambda: compile_template(code, SECTION_PATTERNS), number=1, repeat=3))
+        print(f"{copies:>7} {len(code) / 1024:>8.0f} {legacy * 1e6:>11.1f} {single * 1e6:>12.1f} "
+              f"{legacy / single:>7.1f}x {compile_time * 1e3:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Shared pieces of the benchmark scripts: synthetic payloads, the pdflatex
+stub, percentiles, and saving/comparing result files.
+"""
+import datetime
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from typing import Dict, Iterable, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_FOLDER = os.path.join(ROOT, "app")
+TEMPLATE_FOLDER = os.path.join(ROOT, "Tempelates")
+RESULTS_FOLDER = os.path.join(ROOT, "benchmarks", "results")
+
+sys.path.insert(0, APP_FOLDER)
+
+
+def isolate_caches():
+    """Points the PDF/format/preview caches and the job DB at a fresh temp folder (call before importing the apps)."""
+    folder = tempfile.mkdtemp(prefix="writer2-bench-")
+    os.environ.setdefault("LATEX_PDF_CACHE_DIR", os.path.join(folder, "pdf-cache"))
+    os.environ.setdefault("LATEX_FORMAT_DIR", os.path.join(folder, "formats"))
+    os.environ.setdefault("LATEX_PREVIEW_CACHE_DIR", os.path.join(folder, "previews"))
+    os.environ.setdefault("LATEX_SESSION_ROOT", os.path.join(folder, "sessions"))
+    os.environ.setdefault("LATEX_JOB_DB", os.path.join(folder, "jobs.sqlite3"))
+    return folder
+
+
+def install_fake_pdflatex(latency: float, jitter: float = 0.0, commands: Iterable[str] = ("pdflatex",)) -> str:
+    """Puts benchmarks/fake_pdflatex.py on PATH as pdflatex (or each of `commands`); returns its folder."""
+    if os.name != "posix":
+        raise SystemExit("The pdflatex stub needs a POSIX shell; use --real-tex on this machine")
+    folder = tempfile.mkdtemp(prefix="writer2-fake-tex-")
+    script = os.path.join(ROOT, "benchmarks", "fake_pdflatex.py")
+    for command in commands:
+        shim = os.path.join(folder, command)
+        with open(shim, "w") as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n')
+        os.chmod(shim, 0o755)
+    os.environ["PATH"] = folder + os.pathsep + os.environ.get("PATH", "")
+    os.environ["FAKE_PDFLATEX_LATENCY"] = str(latency)
+    os.environ["FAKE_PDFLATEX_JITTER"] = str(jitter)
+    return folder
+
+
+# ---------- synthetic payloads ----------
+
+def resume_payload(entries: int, tag: str = "", items: int = 4) -> Dict:
+    """A resume with `entries` education/experience/project/skill entries each."""
+    dates = {"startMonth": "Jan", "startYear": "2020", "endMonth": "Dec", "endYear": "2023"}
+    return {
+        "template_name": "resume.txt",
+        "basic_info": {
+            "Place_Holder_Name": f"Benchmark User {tag}",
+            "Place_Holder_contact": "+1 555 0100",
+            "Place_Holder_Mail": "bench@example.com",
+            "Place_Holder_linkedin": "linkedin.com/in/bench",
+            "Place_Holder_github": "github.com/bench",
+        },
+        "education_entries": [
+            {"education": f"University {i}", "course": "B.Sc. Computer Science", "location": "City",
+             "score": "GPA 3.9", **dates}
+            for i in range(entries)
+        ],
+        "experience_entries": [
+            {"position": f"Engineer {i}", "company": "Company", "location": "City", **dates,
+             "items": [{"description": f"Shipped feature {i}.{j} that improved things by {j}0%"}
+                       for j in range(items)]}
+            for i in range(entries)
+        ],
+        "project_entries": [
+            {"title": f"Project {i}", "tools": "Python, FastAPI", **dates,
+             "items": [{"description": f"Built part {i}.{j}"} for j in range(items)]}
+            for i in range(entries)
+        ],
+        "skill_entries": [
+            {"category": f"Category {i}", "items": [{"name": f"Skill {i}.{j}"} for j in range(items)]}
+            for i in range(entries)
+        ],
+        "output_filename": f"bench_resume_{tag}",
+    }
+
+
+def letter_payload(tag: str = "", paragraphs: int = 4) -> Dict:
+    body = "\n\n".join(f"Paragraph {i} of the letter for {tag}." for i in range(paragraphs))
+    return {
+        "template_name": "cv.txt",
+        "cover_letter_data": {
+            "PlaceHolderName": f"Benchmark User {tag}",
+            "PlaceHolderEmail": "bench@example.com",
+            "PlaceHolderCompanyName": "Company",
+            "PlaceHolderPositionTitle": "Engineer",
+            "PlaceHolderBody": body,
+        },
+        "output_filename": f"bench_letter_{tag}",
+    }
+
+
+def report_payload(authors: int = 3, tag: str = "", paragraphs: int = 4) -> Dict:
+    return {
+        "template_name": "report.txt",
+        "title": f"Benchmark Report {tag}",
+        "abstract": "An abstract. " * 20,
+        "index_terms": "benchmarks, latex",
+        "introduction": "\n\n".join(f"Paragraph {i} of the introduction." for i in range(paragraphs)),
+        "authors": [
+            {"name": f"Author {i}", "department": "Dept", "organization": "Org", "city": "City",
+             "country": "Country", "email": f"a{i}@example.com"}
+            for i in range(authors)
+        ],
+        "output_filename": f"bench_report_{tag}",
+    }
+
+
+# ---------- statistics and result files ----------
+
+def percentile(samples: List[float], p: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds for samples given in seconds."""
+    if not samples:
+        return {"n": 0}
+    return {
+        "n": len(samples),
+        "mean_ms": sum(samples) / len(samples) * 1e3,
+        "min_ms": min(samples) * 1e3,
+        "p50_ms": percentile(samples, 50) * 1e3,
+        "p95_ms": percentile(samples, 95) * 1e3,
+        "p99_ms": percentile(samples, 99) * 1e3,
+        "max_ms": max(samples) * 1e3,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(name: str, results: Dict, settings: Dict) -> str:
+    """Writes benchmarks/results/<name>-<timestamp>.json and returns its path."""
+    os.makedirs(RESULTS_FOLDER, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(RESULTS_FOLDER, f"{name}-{stamp}.json")
+    document = {
+        "benchmark": name,
+        "created": stamp,
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": settings,
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+    return path
+
+
+def compare(results: Dict, baseline_path: str, threshold: float = 0.10, settings: Optional[Dict] = None) -> int:
+    """
+    Prints how each timing changed against a saved run and returns the number
+    of regressions (timings that got slower by more than `threshold`).
+    """
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        document = json.load(f)
+    baseline = document["results"]
+    regressions = 0
+    print(f"\nCompared with {os.path.basename(baseline_path)} (commit {document.get('commit')}):")
+    if settings is not None and settings != document.get("settings"):
+        print(f"  note: that run used different settings: {document.get('settings')}")
+    for case, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get(case, {}).get(metric)
+            if not metric.endswith(("_ms", "_us")) or not old:
+                continue
+            change = value / old - 1
+            flag = ""
+            if change > threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(f"  {case:<32} {metric:<8} {old:>10.2f} -> {value:>10.2f} ({change:+.1%}){flag}")
+    return regressions
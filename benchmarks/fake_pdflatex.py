@@ -0,0 +1,83 @@
+"""
+Stand-in for pdflatex so the benchmarks run on machines without TeX.
+It understands the command lines the services use (-ini format builds,
+-fmt/-jobname/-output-directory, -draftmode/-no-pdf, the warm stdin mode
+and tectonic's "-X compile --outdir"),
+sleeps for FAKE_PDFLATEX_LATENCY seconds (plus up to FAKE_PDFLATEX_JITTER)
+and writes a small one-page PDF with matching .log and .aux files.
+
+bench_e2e.py puts it on PATH as "pdflatex" (bench_engines.py --fake as every
+engine); it is not meant to be run by hand.
+"""
+import os
+import random
+import re
+import sys
+import time
+
+PDF = (
+    b"%PDF-1.4\n"
+    b"1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n"
+    b"2 0 obj << /Type /Pages /Kids [3 0 R] /Count 1 >> endobj\n"
+    b"3 0 obj << /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] >> endobj\n"
+    b"trailer << /Root 1 0 R >>\n"
+    b"%%EOF\n"
+)
+
+
+def main(args):
+    if args == ["--version"]:
+        print("pdfTeX 3.141592653-2.6-1.40.25 (benchmark stub)")
+        return 0
+
+    output_folder = "."
+    source = None
+    jobname = None
+    index = 0
+    if args[:2] == ["-X", "compile"]:
+        args = args[2:]
+    while index < len(args):
+        arg = args[index]
+        if arg in ("-output-directory", "--outdir"):
+            output_folder = args[index + 1]
+            index += 2
+            continue
+        if arg.startswith("-output-directory="):
+            output_folder = arg.split("=", 1)[1]
+        elif arg.startswith("-jobname="):
+            jobname = arg.split("=", 1)[1]
+        elif not arg.startswith(("-", "&")):
+            source = arg
+        index += 1
+
+    if "-ini" not in args and source is None:
+        # Warm mode: a line to load the format, then \input{...} of the body
+        sys.stdin.readline()
+        match = re.search(r"\\input\{([^}]*)\}", sys.stdin.readline())
+        if match is None:
+            return 1
+        source = match.group(1)
+
+    latency = float(os.environ.get("FAKE_PDFLATEX_LATENCY", "0.05"))
+    jitter = float(os.environ.get("FAKE_PDFLATEX_JITTER", "0"))
+    time.sleep(latency + random.uniform(0, jitter))
+
+    base = jobname or os.path.splitext(os.path.basename(source or "texput"))[0]
+    if "-ini" in args:
+        with open(os.path.join(output_folder, base + ".fmt"), "wb") as f:
+            f.write(b"benchmark stub format\n")
+        return 0
+
+    with open(os.path.join(output_folder, base + ".log"), "w") as f:
+        f.write("This is pdfTeX (benchmark stub)\nOutput written on %s.pdf (1 page).\n" % base)
+    with open(os.path.join(output_folder, base + ".aux"), "w") as f:
+        f.write("\\relax\n")
+    if "-draftmode" not in args and "-no-pdf" not in args:
+        with open(os.path.join(output_folder, base + ".pdf"), "wb") as f:
+            f.write(PDF)
+    print("Output written on %s.pdf (1 page)." % base)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
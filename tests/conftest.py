@@ -0,0 +1,16 @@
+"""
+Puts app/ on sys.path, as the services see it, and points every cache and
+database the engine opens at a throwaway folder before anything imports it.
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "app"))
+
+_folder = tempfile.mkdtemp(prefix="writer2-tests-")
+for name, subfolder in (("LATEX_BUILD_ROOT", "builds"), ("LATEX_PDF_CACHE_DIR", "pdf-cache"),
+                        ("LATEX_FORMAT_DIR", "formats"), ("LATEX_PREVIEW_CACHE_DIR", "previews"),
+                        ("LATEX_SESSION_ROOT", "sessions"), ("LATEX_JOB_DB", "jobs.sqlite3")):
+    os.environ.setdefault(name, os.path.join(_folder, subfolder))
@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException, Request
+
+from engine.artifacts import artifact_file, pdf_response
+from engine.pdf_cache import pdf_cache
+from engine.store import store_for
+
+
+def test_artifact_file_falls_back_to_the_store_blob(tmp_path):
+    artifact_id = "ab" * 32
+    pdf = tmp_path / "document.pdf"
+    pdf.write_bytes(b"%PDF-1.5 stored")
+    with pytest.raises(HTTPException) as info:
+        artifact_file(artifact_id)
+    assert info.value.status_code == 404
+
+    store = store_for(str(tmp_path / "outputs"))
+    published = asyncio.run(store.publish_pdf(str(pdf), "cv.pdf", artifact_id, "ada"))
+    assert pdf_cache.get(artifact_id) is None
+    path = artifact_file(artifact_id)
+    assert path != published
+    assert open(path, "rb").read() == b"%PDF-1.5 stored"
+
+    cached = pdf_cache.put(artifact_id, str(pdf))
+    assert artifact_file(artifact_id) == cached
+
+
+def request(method, headers=None):
+    scope = {"type": "http", "method": method, "headers": [(k.lower().encode(), v.encode())
+                                                           for k, v in (headers or {}).items()]}
+    return Request(scope)
+
+
+def test_matching_etag_is_304_for_get_and_412_for_post(tmp_path):
+    pdf = tmp_path / "document.pdf"
+    pdf.write_bytes(b"%PDF-1.5")
+    matching = {"If-None-Match": 'W/"abc", "other"'}
+    assert pdf_response(request("GET", matching), str(pdf), '"abc"', "cv.pdf").status_code == 304
+    assert pdf_response(request("HEAD", matching), str(pdf), '"abc"', "cv.pdf").status_code == 304
+    assert pdf_response(request("POST", matching), str(pdf), '"abc"', "cv.pdf").status_code == 412
+    assert pdf_response(request("POST", {"If-None-Match": '"other"'}), str(pdf), '"abc"', "cv.pdf").status_code == 200
+    assert pdf_response(request("POST"), str(pdf), '"abc"', "cv.pdf").headers["ETag"] == '"abc"'
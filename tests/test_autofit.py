@@ -0,0 +1,88 @@
+import asyncio
+import zlib
+
+from engine.autofit import Layout, autofit, page_count
+
+
+def write_pdf(path, pages, compressed=False):
+    tree = b"<< /Type /Pages /Kids [3 0 R] /Count %d >>" % pages
+    if compressed:
+        objects = zlib.compress(b"2 0 " + tree)
+        body = (b"2 0 obj\n<< /Type /ObjStm /N 1 /First 4 /Length %d /Filter /FlateDecode >>\nstream\n"
+                % len(objects)) + objects + b"\nendstream\nendobj\n"
+    else:
+        body = b"2 0 obj\n" + tree + b"\nendobj\n"
+    content = zlib.compress(b"BT /F1 12 Tf (/Count 99) Tj ET")
+    body += b"4 0 obj\n<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(content) + content + b"\nendstream\nendobj\n"
+    path.write_bytes(b"%PDF-1.5\n1 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj\n" + body + b"%%EOF\n")
+    return str(path)
+
+
+def test_page_count_reads_the_page_tree(tmp_path):
+    assert page_count(write_pdf(tmp_path / "plain.pdf", 3)) == 3
+
+
+def test_page_count_inflates_object_streams_only(tmp_path):
+    # The page contents mention /Count too but are never inflated
+    assert page_count(write_pdf(tmp_path / "objstm.pdf", 2, compressed=True)) == 2
+
+
+def test_page_count_without_a_page_tree(tmp_path):
+    path = tmp_path / "broken.pdf"
+    path.write_bytes(b"%PDF-1.5\n%%EOF\n")
+    assert page_count(str(path)) == 0
+
+
+def fake_builds(tmp_path, layouts, pages, delays, log):
+    """build(layout) writing a PDF with pages[i] pages after delays[i] seconds."""
+    async def build(layout):
+        index = layouts.index(layout)
+        log.append(index)
+        try:
+            await asyncio.sleep(delays[index])
+        except asyncio.CancelledError:
+            log.append(f"{index} cancelled")
+            raise
+        path = write_pdf(tmp_path / f"{index}.pdf", pages[index])
+        return {"artifact_id": f"candidate-{index}", "path": path}
+    return build
+
+
+def test_autofit_picks_the_loosest_layout_that_fits(tmp_path):
+    layouts = [Layout(), Layout(vspace_scale=1.5), Layout(margin=0.2), Layout(font_size=10)]
+    log = []
+    build = fake_builds(tmp_path, layouts, [3, 2, 1, 1], [0, 0, 0, 0], log)
+    result = asyncio.run(autofit(build, max_pages=1, parallel=4, layouts=layouts))
+    assert result["artifact_id"] == "candidate-2"
+    assert result["fits"] and result["pages"] == 1
+    assert result["layout"] == layouts[2].as_dict()
+
+
+def test_autofit_cancels_tighter_candidates(tmp_path):
+    layouts = [Layout(), Layout(vspace_scale=1.5), Layout(margin=0.2), Layout(font_size=10)]
+    log = []
+    # The second layout fits while the tighter ones are still compiling
+    build = fake_builds(tmp_path, layouts, [2, 1, 1, 1], [0.05, 0, 1, 1], log)
+    result = asyncio.run(autofit(build, max_pages=1, parallel=4, layouts=layouts))
+    assert result["artifact_id"] == "candidate-1"
+    assert result["candidates"] == 2
+    assert "2 cancelled" in log and "3 cancelled" in log
+
+
+def test_autofit_never_starts_a_candidate_tighter_than_a_fit(tmp_path):
+    layouts = [Layout(), Layout(vspace_scale=1.5), Layout(margin=0.2)]
+    log = []
+    build = fake_builds(tmp_path, layouts, [1, 1, 1], [0, 0, 0], log)
+    result = asyncio.run(autofit(build, max_pages=1, parallel=1, layouts=layouts))
+    assert result["artifact_id"] == "candidate-0"
+    assert log == [0]
+
+
+def test_autofit_returns_the_tightest_when_nothing_fits(tmp_path):
+    layouts = [Layout(), Layout(vspace_scale=1.5)]
+    log = []
+    build = fake_builds(tmp_path, layouts, [3, 2], [0, 0], log)
+    result = asyncio.run(autofit(build, max_pages=1, parallel=2, layouts=layouts))
+    assert result["artifact_id"] == "candidate-1"
+    assert not result["fits"] and result["pages"] == 2
+    assert result["candidates"] == 2
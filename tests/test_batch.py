@@ -0,0 +1,56 @@
+import asyncio
+import io
+import json
+import zipfile
+
+from fastapi import HTTPException
+
+from engine.batch import _unique_name, stream_zip
+from engine.pdf_cache import pdf_cache
+
+
+def test_unique_name():
+    used = set()
+    assert [_unique_name(name, used) for name in ("cv.pdf", "cv.pdf", "cv.pdf", "cv-2.pdf", "notes", "notes")] == [
+        "cv.pdf", "cv-2.pdf", "cv-3.pdf", "cv-2-2.pdf", "notes", "notes-2"
+    ]
+
+
+def build(tmp_path, name, content, delay):
+    async def run():
+        await asyncio.sleep(delay)
+        pdf = tmp_path / f"{content}.pdf"
+        pdf.write_bytes(content.encode())
+        artifact_id = pdf_cache.key_for(content, "plain", "pdflatex")
+        pdf_cache.put(artifact_id, str(pdf))
+        # The published copy is never read; another build may have replaced it
+        return {"path": f"/outputs/anonymous/{name}", "artifact_id": artifact_id, "cached": False}
+    return run()
+
+
+async def failing():
+    raise HTTPException(status_code=422, detail="LaTeX compilation failed")
+
+
+def collect(jobs):
+    async def run():
+        return b"".join([chunk async for chunk in stream_zip(jobs)])
+    return zipfile.ZipFile(io.BytesIO(asyncio.run(run())))
+
+
+def test_zip_names_are_de_duplicated_and_reported(tmp_path):
+    archive = collect([
+        ("cv", build(tmp_path, "cv.pdf", "first", 0.02)),
+        ("cv", build(tmp_path, "cv.pdf", "second", 0)),
+        ("broken", failing()),
+        ("letter", build(tmp_path, "letter.pdf", "third", 0.01)),
+    ])
+    # In completion order
+    assert archive.namelist() == ["cv.pdf", "letter.pdf", "cv-2.pdf", "manifest.json"]
+    assert archive.read("cv.pdf") == b"second"
+    assert archive.read("cv-2.pdf") == b"first"
+    manifest = json.loads(archive.read("manifest.json"))
+    assert (manifest["total"], manifest["succeeded"]) == (4, 3)
+    assert [item.get("file") for item in manifest["items"]] == ["cv-2.pdf", "cv.pdf", None, "letter.pdf"]
+    assert manifest["items"][2] == {"index": 2, "output_filename": "broken", "status": "error",
+                                    "detail": "LaTeX compilation failed"}
@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException, Request
+
+from engine.cancellation import LatestWins, document_key
+
+
+def request(disconnect=None, headers=None):
+    """A request whose client disconnects once `disconnect` is set (never, without one)."""
+    async def receive():
+        await (disconnect.wait() if disconnect is not None else asyncio.Event().wait())
+        return {"type": "http.disconnect"}
+    scope = {"type": "http", "method": "POST",
+             "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]}
+    return Request(scope, receive)
+
+
+async def build(started, release, value):
+    started.append(value)
+    try:
+        await release.wait()
+    except asyncio.CancelledError:
+        started.append(f"{value} cancelled")
+        raise
+    return value
+
+
+def test_document_key():
+    assert document_key(request(headers={"X-Document-Key": "cv-1"}), "resume") == "resume:cv-1"
+    assert document_key(request(), "resume") is None
+
+
+def test_a_newer_request_supersedes_the_running_build():
+    latest = LatestWins()
+    started = []
+
+    async def run():
+        release = asyncio.Event()
+        first = asyncio.ensure_future(latest.run(request(), build(started, release, "first"), "doc"))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(latest.run(request(), build(started, release, "second"), "doc"))
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(first, second, return_exceptions=True)
+
+    first, second = asyncio.run(run())
+    assert isinstance(first, HTTPException) and first.status_code == 409
+    assert second == "second"
+    # The older build is cancelled before the newer one starts
+    assert started == ["first", "first cancelled", "second"]
+    assert latest.stats() == {"in_flight": 0, "superseded": 1, "disconnected": 0}
+
+
+def test_different_keys_do_not_interfere():
+    latest = LatestWins()
+    started = []
+
+    async def run():
+        release = asyncio.Event()
+        builds = [latest.run(request(), build(started, release, name), name) for name in ("a", "b")]
+        builds.append(latest.run(request(), build(started, release, "no key")))
+        tasks = [asyncio.ensure_future(b) for b in builds]
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(*tasks)
+
+    assert asyncio.run(run()) == ["a", "b", "no key"]
+    assert latest.superseded == 0
+
+
+def test_a_build_claimed_earlier_is_refused_once_overtaken():
+    latest = LatestWins()
+
+    async def run():
+        generation = latest.claim("session")
+        latest.claim("session")
+        coroutine = build([], asyncio.Event(), "stale")
+        with pytest.raises(HTTPException) as info:
+            await latest.run(request(), coroutine, "session", generation)
+        return info.value
+
+    assert asyncio.run(run()).status_code == 409
+
+
+def test_the_build_is_cancelled_when_the_client_leaves():
+    latest = LatestWins()
+    started = []
+
+    async def run():
+        gone = asyncio.Event()
+        task = asyncio.ensure_future(latest.run(request(gone), build(started, asyncio.Event(), "left"), "doc"))
+        await asyncio.sleep(0)
+        gone.set()
+        with pytest.raises(HTTPException) as info:
+            await task
+        await asyncio.sleep(0)
+        return info.value
+
+    assert asyncio.run(run()).status_code == 499
+    assert started == ["left", "left cancelled"]
+    assert latest.stats() == {"in_flight": 0, "superseded": 0, "disconnected": 1}
@@ -0,0 +1,120 @@
+from typing import Dict, List
+
+import pytest
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+from engine.escaping import check_input, check_latex, escape_input, escape_latex
+
+
+class Entry(BaseModel):
+    title: str
+    items: List[str] = []
+
+
+class Request(BaseModel):
+    template_name: str = "plain"
+    output_filename: str = "out_50%"
+    basic_info: Dict[str, str] = {}
+    entries: List[Entry] = []
+    raw_latex: List[str] = []
+
+
+def test_escape_latex_plain_text_is_unchanged():
+    text = "Senior engineer, 2019-2024"
+    assert escape_latex(text) is text
+
+
+def test_escape_latex_special_characters():
+    assert escape_latex("R&D 100% #1 a_b {x} ~ ^ $") == (
+        r"R\&D 100\% \#1 a\_b \{x\} \textasciitilde{} \textasciicircum{} \$"
+    )
+    assert escape_latex("C:\\temp") == r"C:\textbackslash{}temp"
+
+
+def test_escape_latex_drops_control_characters():
+    assert escape_latex("a\x00b\x1bc\x7fd\te\nf") == "abcd\te\nf"
+
+
+@pytest.mark.parametrize("text", [
+    r"\textbf{bold}",
+    r"50\% of $x^2$ % a comment with { in it",
+    r"\{ escaped braces \}",
+    "",
+])
+def test_check_latex_accepts(text):
+    assert check_latex(text) is None
+
+
+@pytest.mark.parametrize("text, problem", [
+    (r"\input{/etc/passwd}", r"\input is not allowed"),
+    (r"\immediate\write18{ls}", r"\immediate is not allowed"),
+    (r"\catcode`\@=11", r"\catcode is not allowed"),
+    (r"\end {document}", r"\end {document} is not allowed"),
+    ("^^5cinput", "^^ is not allowed"),
+    (r"\csname input\endcsname{/etc/passwd}", r"\csname is not allowed"),
+    (r"\expandafter\x\y", r"\expandafter is not allowed"),
+    (r"\scantokens{\in put}", r"\scantokens is not allowed"),
+    (r"\textbf{bold", "1 { is never closed"),
+    (r"{{x}", "1 { is never closed"),
+    (r"{{{", "3 { are never closed"),
+    (r"x}{", "a } has no matching {"),
+    (r"$x", "a $ (math mode) is never closed"),
+])
+def test_check_latex_rejects(text, problem):
+    assert check_latex(text) == problem
+
+
+def test_check_latex_allows_commands_that_merely_start_like_forbidden_ones():
+    assert check_latex(r"\inputfield \readme \specialchar") is None
+
+
+def test_escape_input_escapes_every_text_field():
+    request = Request(basic_info={"Place_Holder_Name": "A&B"}, entries=[Entry(title="50%", items=["x_y"])])
+    escaped = escape_input(request)
+    assert escaped.basic_info == {"Place_Holder_Name": r"A\&B"}
+    assert escaped.entries[0].title == r"50\%"
+    assert escaped.entries[0].items == [r"x\_y"]
+    # Not document text
+    assert escaped.output_filename == "out_50%"
+    # The request itself is left alone
+    assert request.entries[0].title == "50%"
+
+
+def test_escape_input_passes_raw_fields_through():
+    request = Request(
+        basic_info={"Place_Holder_Name": r"\textbf{Ada}", "Place_Holder_Role": "R&D"},
+        entries=[Entry(title=r"\emph{Lead}", items=[r"$O(n)$"])],
+        raw_latex=["basic_info.Place_Holder_Name", "entries"],
+    )
+    escaped = escape_input(request)
+    assert escaped.basic_info == {"Place_Holder_Name": r"\textbf{Ada}", "Place_Holder_Role": r"R\&D"}
+    assert escaped.entries[0].title == r"\emph{Lead}"
+    assert escaped.entries[0].items == [r"$O(n)$"]
+
+
+def test_escape_input_names_the_bad_raw_field():
+    request = Request(entries=[Entry(title="ok"), Entry(title="ok", items=["fine", r"\input{x}"])],
+                      raw_latex=["entries"])
+    with pytest.raises(HTTPException) as info:
+        escape_input(request)
+    assert info.value.status_code == 422
+    assert info.value.detail == r"Invalid LaTeX in entries.1.items.1: \input is not allowed"
+
+
+def test_check_input_matches_escape_input_without_escaping():
+    request = Request(basic_info={"Place_Holder_Name": r"\textbf{Ada", "Place_Holder_Role": "{"},
+                      raw_latex=["basic_info.Place_Holder_Name"])
+    with pytest.raises(HTTPException) as checked:
+        check_input(request)
+    with pytest.raises(HTTPException) as escaped:
+        escape_input(request)
+    assert checked.value.detail == escaped.value.detail == (
+        "Invalid LaTeX in basic_info.Place_Holder_Name: 1 { is never closed"
+    )
+
+
+def test_check_input_ignores_escaped_fields():
+    check_input(Request(basic_info={"Place_Holder_Name": r"\input{x} {"}))
+    check_input(Request(basic_info={"Place_Holder_Name": r"\textbf{Ada}"},
+                        raw_latex=["basic_info.Place_Holder_Name"]))
@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+import pytest
+
+from engine.jobs import JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite3"))
+
+
+def test_claim_takes_the_highest_priority_first(queue):
+    async def run():
+        low = await queue.submit("resume", {"n": 1})
+        high = await queue.submit("letter", {"n": 2}, priority=5)
+        assert await queue.depth() == 2
+        job = await queue.claim("w1")
+        assert (job["id"], job["kind"], job["payload"]) == (high, "letter", {"n": 2})
+        assert job["attempts"] == 1
+        assert (await queue.get(high))["status"] == "running"
+        assert (await queue.claim("w2"))["id"] == low
+        assert await queue.claim("w3") is None
+        assert await queue.depth() == 0
+
+    asyncio.run(run())
+
+
+def test_a_leased_job_is_not_claimed_twice(queue):
+    async def run():
+        await queue.submit("resume", {})
+        assert await queue.claim("w1", lease_seconds=60) is not None
+        assert await queue.claim("w2") is None
+
+    asyncio.run(run())
+
+
+def test_an_expired_lease_is_retried_by_another_worker(queue):
+    async def run():
+        job_id = await queue.submit("resume", {})
+        await queue.claim("w1", lease_seconds=-1)
+        job = await queue.claim("w2")
+        assert (job["id"], job["attempts"]) == (job_id, 2)
+        assert (await queue.get(job_id))["worker"] == "w2"
+        # The first worker's late result no longer counts
+        await queue.complete(job_id, "w1", {"path": "stale"})
+        assert (await queue.get(job_id))["status"] == "running"
+        await queue.complete(job_id, "w2", {"path": "out.pdf"})
+        job = await queue.get(job_id)
+        assert (job["status"], job["result"], job["lease_until"]) == ("done", {"path": "out.pdf"}, None)
+
+    asyncio.run(run())
+
+
+def test_heartbeat_keeps_the_lease(queue):
+    async def run():
+        job_id = await queue.submit("resume", {})
+        await queue.claim("w1", lease_seconds=-1)
+        await queue.heartbeat(job_id, "w1", lease_seconds=60)
+        assert (await queue.get(job_id))["lease_until"] > time.time()
+        assert await queue.claim("w2") is None
+        # Only the worker holding the job can extend it
+        await queue.heartbeat(job_id, "w2", lease_seconds=3600)
+        assert (await queue.get(job_id))["lease_until"] < time.time() + 120
+
+    asyncio.run(run())
+
+
+def test_a_job_that_keeps_crashing_its_worker_fails(queue):
+    async def run():
+        job_id = await queue.submit("resume", {}, max_attempts=2)
+        assert (await queue.claim("w1", lease_seconds=-1))["attempts"] == 1
+        assert (await queue.claim("w2", lease_seconds=-1))["attempts"] == 2
+        assert await queue.claim("w3") is None
+        job = await queue.get(job_id)
+        assert (job["status"], job["error"], job["attempts"]) == ("failed", "Worker crashed too many times", 2)
+
+    asyncio.run(run())
+
+
+def test_fail(queue):
+    async def run():
+        job_id = await queue.submit("resume", {})
+        await queue.claim("w1")
+        await queue.fail(job_id, "w1", "LaTeX compilation failed")
+        job = await queue.get(job_id)
+        assert (job["status"], job["error"]) == ("failed", "LaTeX compilation failed")
+        assert await queue.claim("w2") is None
+        assert await queue.get("missing") is None
+
+    asyncio.run(run())
+
@@ -0,0 +1,51 @@
+from engine.engines import ENGINES
+from engine.passes import MAX_PASSES, another_pass, file_digest, needs_rerun, starts_with_draft
+
+WITH_REFERENCES = "\\begin{document}\\tableofcontents\\section{A}\\label{a} see \\ref{a}\\end{document}"
+WITHOUT_REFERENCES = "\\begin{document}Hello\\end{document}"
+
+
+def test_log_asking_for_a_rerun(tmp_path):
+    log, aux = tmp_path / "document.log", tmp_path / "document.aux"
+    log.write_text("LaTeX Warning: Label(s) may have changed. Rerun to get cross-references right.\n")
+    assert needs_rerun(str(log), str(aux), None)
+    log.write_text("Package rerunfilecheck Warning: File `document.out' has changed.\n")
+    assert needs_rerun(str(log), str(aux), None)
+
+
+def test_aux_that_changed_during_the_pass(tmp_path):
+    log, aux = tmp_path / "document.log", tmp_path / "document.aux"
+    log.write_text("Output written on document.pdf (1 page).\n")
+    aux.write_text("\\newlabel{a}{{1}{1}}\n")
+    before = file_digest(str(aux))
+    assert not needs_rerun(str(log), str(aux), before)
+    aux.write_text("\\newlabel{a}{{2}{1}}\n")
+    assert needs_rerun(str(log), str(aux), before)
+
+
+def test_first_pass_only_reruns_when_asked(tmp_path):
+    aux = tmp_path / "document.aux"
+    aux.write_text("\\relax\n")
+    assert file_digest(str(tmp_path / "missing.aux")) is None
+    assert not needs_rerun(str(tmp_path / "missing.log"), str(aux), None)
+
+
+def test_draft_first_pass_only_for_cross_references_without_an_aux(tmp_path):
+    aux = str(tmp_path / "document.aux")
+    assert starts_with_draft(WITH_REFERENCES, aux, ENGINES["pdflatex"])
+    assert not starts_with_draft(WITHOUT_REFERENCES, aux, ENGINES["pdflatex"])
+    # Tectonic reruns by itself
+    assert not starts_with_draft(WITH_REFERENCES, aux, ENGINES["tectonic"])
+    # An earlier build in the session already collected them
+    (tmp_path / "document.aux").write_text("\\relax\n")
+    assert not starts_with_draft(WITH_REFERENCES, aux, ENGINES["pdflatex"])
+
+
+def test_another_pass_is_bounded(tmp_path):
+    log, aux = tmp_path / "document.log", str(tmp_path / "document.aux")
+    log.write_text("Rerun to get cross-references right.\n")
+    assert another_pass(ENGINES["pdflatex"], 1, str(log), aux, None)
+    assert not another_pass(ENGINES["pdflatex"], MAX_PASSES, str(log), aux, None)
+    assert not another_pass(ENGINES["tectonic"], 1, str(log), aux, None)
+    log.write_text("Output written on document.pdf (1 page).\n")
+    assert not another_pass(ENGINES["pdflatex"], 1, str(log), aux, None)
@@ -0,0 +1,109 @@
+import asyncio
+import os
+
+import pytest
+
+from engine.pdf_cache import PdfCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return PdfCache(str(tmp_path / "cache"), max_bytes=1 << 20)
+
+
+def compiler(tmp_path, started, release=None, content=b"%PDF-1.5"):
+    """A compile_pdf that counts its runs and, if given an event, waits for it."""
+    async def compile_pdf():
+        started.append(1)
+        if release is not None:
+            await release.wait()
+        path = tmp_path / f"build-{len(started)}.pdf"
+        path.write_bytes(content)
+        return str(path)
+    return compile_pdf
+
+
+def test_key_depends_on_code_template_and_engine():
+    key = PdfCache.key_for("x", "plain", "pdflatex")
+    assert key == PdfCache.key_for("x", "plain", "pdflatex")
+    assert len({key, PdfCache.key_for("y", "plain", "pdflatex"), PdfCache.key_for("x", "other", "pdflatex"),
+                PdfCache.key_for("x", "plain", "lualatex")}) == 4
+
+
+def test_miss_then_hit(cache, tmp_path):
+    started = []
+
+    async def run():
+        first = await cache.get_or_compile("k", compiler(tmp_path, started))
+        second = await cache.get_or_compile("k", compiler(tmp_path, started))
+        return first, second
+
+    (path, hit), (again, hit_again) = asyncio.run(run())
+    assert (hit, hit_again, path == again, len(started)) == (False, True, True, 1)
+    assert open(path, "rb").read() == b"%PDF-1.5"
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_ratio": 0.5}
+
+
+def test_concurrent_misses_share_one_compile(cache, tmp_path):
+    started = []
+
+    async def run():
+        release = asyncio.Event()
+        tasks = [asyncio.ensure_future(cache.get_or_compile("k", compiler(tmp_path, started, release)))
+                 for _ in range(5)]
+        await asyncio.sleep(0.01)
+        release.set()
+        return await asyncio.gather(*tasks)
+
+    results = asyncio.run(run())
+    assert len(started) == 1
+    assert len({path for path, _ in results}) == 1
+    assert sorted(hit for _, hit in results) == [False, True, True, True, True]
+    assert not cache._inflight
+
+
+def test_waiters_see_the_compile_error(cache, tmp_path):
+    async def broken():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("LaTeX compilation failed")
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_compile("k", broken) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert [str(result) for result in results] == ["LaTeX compilation failed"] * 3
+    assert not cache._inflight
+    assert cache.get("k") is None
+
+
+def test_a_waiter_compiles_itself_if_the_first_request_is_cancelled(cache, tmp_path):
+    started = []
+
+    async def run():
+        release = asyncio.Event()
+        first = asyncio.ensure_future(cache.get_or_compile("k", compiler(tmp_path, started, release)))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(cache.get_or_compile("k", compiler(tmp_path, started)))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        result = await second
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return result
+
+    path, hit = asyncio.run(run())
+    assert (hit, len(started)) == (False, 2)
+    assert os.path.exists(path)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = PdfCache(str(tmp_path / "cache"), max_bytes=25)
+    pdf = tmp_path / "in.pdf"
+    pdf.write_bytes(b"x" * 10)
+    for key in ("a", "b"):
+        cache.put(key, str(pdf))
+    os.utime(cache.get("a"), (0, 0))
+    os.utime(cache.get("b"), (1, 1))
+    cache.get("a")
+    cache.put("c", str(pdf))
+    assert (cache.get("a") is None, cache.get("b") is None, cache.get("c") is None) == (False, True, False)
@@ -0,0 +1,77 @@
+from engine.render import compile_template, insert_before_document, pattern_to_regex
+
+TEMPLATE = """\\documentclass{article}
+\\begin{document}
+\\name{PlaceHolderName}
+    \\begin{itemize}
+        \\item Place_Holder_Skill
+    \\end{itemize}
+\\end{document}
+"""
+
+SKILLS = """    \\begin{itemize}
+        \\item Place_Holder_Skill
+    \\end{itemize}"""
+
+
+def test_pattern_ignores_how_much_whitespace_there_is():
+    regex = pattern_to_regex("\\item   Place_Holder_Skill\n\\end{itemize}")
+    assert regex.search("\\item Place_Holder_Skill\r\n\t\\end{itemize}")
+    assert regex.search("\\item\n    Place_Holder_Skill \\end{itemize}")
+
+
+def test_pattern_still_needs_whitespace_where_it_had_some():
+    regex = pattern_to_regex("\\item X")
+    assert regex.search("\\item X")
+    assert not regex.search("\\itemX")
+
+
+def test_pattern_pieces_are_literal():
+    regex = pattern_to_regex("a.b (c)")
+    assert regex.search("a.b (c)")
+    assert not regex.search("axb (c)")
+
+
+def test_indented_pattern_swallows_the_indentation():
+    match = pattern_to_regex(SKILLS).search(TEMPLATE)
+    assert match.group(0) == SKILLS
+
+
+def test_placeholders_become_slots():
+    template = compile_template(TEMPLATE)
+    assert template.slot_names == ["PlaceHolderName", "Place_Holder_Skill"]
+    assert template.render({}) == TEMPLATE
+    assert "\\name{Ada}" in template.render({"PlaceHolderName": "Ada"})
+
+
+def test_sections_replace_their_whole_block():
+    template = compile_template(TEMPLATE, sections={"skills": SKILLS.replace("        ", " "), "awards": "\\awards"})
+    assert template.slot_names == ["PlaceHolderName", "skills"]
+    assert template.missing == ["awards"]
+    rendered = template.render({"skills": "SKILLS"})
+    assert "SKILLS\n\\end{document}" in rendered
+    assert "itemize" not in rendered
+
+
+def test_render_spans_point_at_the_filled_in_values():
+    template = compile_template(TEMPLATE, sections={"skills": SKILLS})
+    values = {"PlaceHolderName": "Ada Lovelace", "skills": "\\textbf{Maths}"}
+    rendered, spans = template.render_spans(values)
+    assert rendered == template.render(values)
+    assert [name for _, _, name in spans] == ["PlaceHolderName", "skills"]
+    for start, end, name in spans:
+        assert rendered[start:end] == values[name]
+
+
+def test_render_spans_skip_slots_left_as_they_were():
+    template = compile_template(TEMPLATE)
+    rendered, spans = template.render_spans({"Place_Holder_Skill": "Python"})
+    assert rendered == template.render({"Place_Holder_Skill": "Python"})
+    assert len(spans) == 1
+    start, end, name = spans[0]
+    assert (rendered[start:end], name) == ("Python", "Place_Holder_Skill")
+
+
+def test_insert_before_document():
+    assert insert_before_document(TEMPLATE, "\\draft\n").startswith("\\documentclass{article}\n\\draft\n\\begin{document}")
+    assert insert_before_document("no body", "\\draft") == "no body"
@@ -0,0 +1,114 @@
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+from engine.compile_pool import CompilePool
+from engine.sandbox import CompileTerminated, job_log, log_tail, termination_reason
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="process groups and signals need POSIX")
+
+CAPACITY_LINE = "! TeX capacity exceeded, sorry [main memory size=5000000]."
+
+
+def test_an_ordinary_error_is_not_a_termination():
+    assert termination_reason(1, "", "! Undefined control sequence.\nl.12 \\textbff") is None
+    assert termination_reason(0) is None
+
+
+def test_memory_from_tex_or_kpathsea():
+    assert termination_reason(1, "", f"(./document.tex\n{CAPACITY_LINE}\nl.3 \\loop") == "memory"
+    assert termination_reason(1, "pdflatex: fatal: memory exhausted (xmalloc of 4096 bytes).\n") == "memory"
+    assert termination_reason(-signal.SIGSEGV) == "memory"
+
+
+def test_document_text_echoed_in_the_log_is_not_a_memory_kill():
+    # Error context repeats the user's text, but never at the start of a line after "! "
+    assert termination_reason(1, "", f"! Undefined control sequence.\nl.7 \\foo {CAPACITY_LINE}") is None
+    assert termination_reason(1, "", "! Undefined control sequence.\nl.7 memory exhausted") is None
+    # Other capacity limits are the document's own loops, not the memory limit
+    assert termination_reason(1, "", "! TeX capacity exceeded, sorry [input stack size=10000].") is None
+
+
+def test_signals():
+    assert termination_reason(-signal.SIGXCPU) == "cpu"
+    assert termination_reason(-signal.SIGXFSZ) == "file_size"
+    assert termination_reason(-signal.SIGKILL) == "killed"
+    assert termination_reason(-signal.SIGTERM) is None
+
+
+def test_job_log_is_the_commands_own_log():
+    assert job_log(["pdflatex", "-fmt=f", "-jobname=document", "-output-directory", "/w", "/w/document.body.tex"],
+                   "/elsewhere") == "/w/document.log"
+    assert job_log(["pdflatex", "-output-directory", "/w", "/w/letter.tex"], None) == "/w/letter.log"
+    assert job_log(["pdflatex", "-ini", "-jobname=resume-1", "&pdflatex", "/f/resume.tex"], "/f") == "/f/resume-1.log"
+    assert job_log(["pdftoppm", "-png", "document.pdf", "page"], "/w") is None
+
+
+def test_log_tail(tmp_path):
+    path = tmp_path / "document.log"
+    path.write_text("x" * 10000 + CAPACITY_LINE)
+    assert log_tail(str(path), 100).endswith(CAPACITY_LINE)
+    assert len(log_tail(str(path), 100)) == 100
+    assert log_tail(str(tmp_path / "missing.log")) == ""
+    assert log_tail(None) == ""
+
+
+def run(pool, code, cwd, *extra):
+    return asyncio.run(pool.run([sys.executable, "-c", code, *extra], cwd=str(cwd), check=False))
+
+
+def test_timeout_kills_the_whole_process_group(tmp_path):
+    pool = CompilePool(max_concurrency=1, timeout=0.5)
+    child = tmp_path / "child.pid"
+    code = ("import subprocess, sys, time\n"
+            f"p = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])\n"
+            f"open({str(child)!r}, 'w').write(str(p.pid))\n"
+            "time.sleep(30)\n")
+    started = time.perf_counter()
+    with pytest.raises(CompileTerminated) as info:
+        run(pool, code, tmp_path)
+    assert time.perf_counter() - started < 10
+    assert info.value.reason == "timeout"
+    assert pool.terminations["timeout"] == 1
+    # The grandchild went with it
+    pid = int(child.read_text())
+    for _ in range(50):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            break
+        time.sleep(0.05)
+    else:
+        pytest.fail("the compile's child process survived the timeout")
+
+
+def test_a_failed_run_is_just_a_failure(tmp_path):
+    pool = CompilePool(max_concurrency=1)
+    # Another build's log in the same folder is none of this run's business
+    (tmp_path / "other.log").write_text(CAPACITY_LINE)
+    result = run(pool, "import sys; print('memory exhausted'); sys.exit(1)", tmp_path, "-jobname=document")
+    assert result.returncode == 1
+    assert pool.terminations == dict.fromkeys(pool.terminations, 0)
+    with pytest.raises(subprocess.CalledProcessError):
+        asyncio.run(pool.run([sys.executable, "-c", "import sys; sys.exit(1)"], cwd=str(tmp_path)))
+
+
+def test_memory_kill_is_read_from_the_jobs_own_log(tmp_path):
+    pool = CompilePool(max_concurrency=1)
+    code = f"import sys; open('document.log', 'w').write('(./document.tex\\n{CAPACITY_LINE}\\n'); sys.exit(1)"
+    with pytest.raises(CompileTerminated) as info:
+        run(pool, code, tmp_path, "-jobname=document")
+    assert info.value.reason == "memory"
+    assert pool.terminations["memory"] == 1
+
+
+def test_a_killed_process_is_reported(tmp_path):
+    pool = CompilePool(max_concurrency=1)
+    with pytest.raises(CompileTerminated) as info:
+        run(pool, "import os, signal; os.kill(os.getpid(), signal.SIGKILL)", tmp_path)
+    assert info.value.reason == "killed"
@@ -0,0 +1,123 @@
+import asyncio
+import os
+from typing import Dict, List
+
+import pytest
+from fastapi import HTTPException
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel
+
+from engine.sessions import SESSION_ROOT, EditSession, SessionStore, merge_patch
+
+
+class Request(BaseModel):
+    basic_info: Dict[str, str]
+    skills: List[str] = []
+
+
+def test_merge_patch_merges_objects_key_by_key():
+    target = {"basic_info": {"name": "Ada", "role": "Lead"}, "skills": ["a"]}
+    patched = merge_patch(target, {"basic_info": {"role": "CTO"}})
+    assert patched == {"basic_info": {"name": "Ada", "role": "CTO"}, "skills": ["a"]}
+    assert target["basic_info"]["role"] == "Lead"
+
+
+def test_merge_patch_null_deletes_and_lists_replace():
+    target = {"basic_info": {"name": "Ada", "role": "Lead"}, "skills": ["a", "b"]}
+    patched = merge_patch(target, {"basic_info": {"role": None, "missing": None}, "skills": ["c"]})
+    assert patched == {"basic_info": {"name": "Ada"}, "skills": ["c"]}
+
+
+def test_merge_patch_non_objects_replace_the_target():
+    assert merge_patch({"a": 1}, ["x"]) == ["x"]
+    assert merge_patch("old", {"a": {"b": 1}}) == {"a": {"b": 1}}
+
+
+def test_apply_validates_the_merged_payload():
+    session = EditSession("0" * 32, "resume", {"basic_info": {"name": "Ada"}})
+    data = session.apply({"skills": ["maths"]}, Request)
+    assert data.skills == ["maths"]
+    assert session.payload == {"basic_info": {"name": "Ada"}, "skills": ["maths"]}
+    with pytest.raises(RequestValidationError):
+        session.apply({"basic_info": None}, Request)
+    assert session.payload["basic_info"] == {"name": "Ada"}
+
+
+def test_section_is_rendered_again_only_when_its_inputs_change():
+    session = EditSession("0" * 32, "resume", {})
+    calls = []
+
+    def render(text):
+        def run():
+            calls.append(text)
+            return text.upper()
+        return run
+
+    assert session.section("skills", ["a", "b"], render("skills")) == "SKILLS"
+    assert session.section("skills", ["a", "b"], render("again")) == "SKILLS"
+    assert session.section("header", Request(basic_info={"name": "Ada"}), render("header")) == "HEADER"
+    assert session.section("header", Request(basic_info={"name": "Ada"}), render("again")) == "HEADER"
+    assert session.section("skills", ["a"], render("changed")) == "CHANGED"
+    assert calls == ["skills", "header", "changed"]
+    assert session.rerendered == ["skills", "header", "skills"]
+
+
+def test_section_cache_survives_a_reload():
+    store = SessionStore()
+    session_id = store.create("resume", {"skills": ["a"]})
+
+    async def build(text):
+        async with store.open(session_id, "resume") as session:
+            return session.section("skills", ["a"], lambda: text), session.rerendered
+
+    assert asyncio.run(build("first")) == ("first", ["skills"])
+    assert asyncio.run(build("second")) == ("first", [])
+    store.delete(session_id)
+
+
+def test_failed_build_drops_the_aux_file_but_keeps_the_session():
+    store = SessionStore()
+    session_id = store.create("resume", {})
+
+    async def fail():
+        async with store.open(session_id, "resume") as session:
+            session.section("skills", [], lambda: "x")
+            with open(session.workspace.file("document.aux"), "w") as f:
+                f.write("half")
+            raise RuntimeError("compile failed")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(fail())
+    session = store.load(session_id, "resume")
+    assert not os.path.exists(session.workspace.file("document.aux"))
+    assert session._sections["skills"][1] == "x"
+    store.delete(session_id)
+
+
+def test_load_checks_the_id_and_kind():
+    store = SessionStore()
+    session_id = store.create("letter", {"a": 1})
+    assert store.load(session_id, "letter").payload == {"a": 1}
+    assert store.load(session_id, "resume") is None
+    assert store.load("../" + session_id, "letter") is None
+    assert store.delete(session_id)
+    assert store.load(session_id, "letter") is None
+    assert not store.delete(session_id)
+
+    async def missing():
+        async with store.open(session_id, "letter"):
+            pass
+
+    with pytest.raises(HTTPException) as info:
+        asyncio.run(missing())
+    assert info.value.status_code == 404
+
+
+def test_sweep_deletes_expired_sessions():
+    store = SessionStore()
+    old, new = store.create("resume", {}), store.create("resume", {})
+    os.utime(os.path.join(SESSION_ROOT, old, "state.json"), (0, 0))
+    store.sweep()
+    assert store.load(old, "resume") is None
+    assert store.load(new, "resume") is not None
+    store.delete(new)
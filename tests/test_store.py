@@ -0,0 +1,106 @@
+import asyncio
+import os
+import sqlite3
+import time
+
+import pytest
+
+from engine.store import BLOB_FOLDER, INDEX_NAME, ArtifactStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ArtifactStore(str(tmp_path / "outputs"))
+
+
+def pdf(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(b"%" * size)
+    return str(path)
+
+
+def publish(store, source, filename, artifact_id, owner="ada"):
+    return asyncio.run(store.publish_pdf(source, filename, artifact_id, owner))
+
+
+def blobs(store):
+    return sorted(name for _, _, names in os.walk(os.path.join(store.root, BLOB_FOLDER)) for name in names)
+
+
+def aggregate(store):
+    """What the running total should be: each blob once, plus every plain file."""
+    with sqlite3.connect(os.path.join(store.root, INDEX_NAME)) as connection:
+        return connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM"
+            " (SELECT MAX(size) AS size FROM artifacts GROUP BY COALESCE(artifact_id, path))"
+        ).fetchone()[0]
+
+
+def test_identical_pdfs_are_stored_once(store, tmp_path):
+    first = publish(store, pdf(tmp_path, "a.pdf", 100), "cv.pdf", "a" * 64, "ada")
+    second = publish(store, pdf(tmp_path, "a.pdf", 100), "copy.pdf", "a" * 64, "bob")
+    assert os.path.samefile(first, second)
+    assert os.path.dirname(first) != os.path.dirname(second)
+    assert store.usage() == aggregate(store) == 100
+    assert len(blobs(store)) == 1
+
+
+def test_owner_and_filename_cannot_leave_the_store(store, tmp_path):
+    path = publish(store, pdf(tmp_path, "a.pdf", 10), "../../escape.pdf", "a" * 64, "../..")
+    assert os.path.dirname(os.path.dirname(path)) == store.root
+    assert os.path.basename(path) == "escape.pdf"
+
+
+def test_replacing_a_published_name_frees_its_old_blob(store, tmp_path):
+    publish(store, pdf(tmp_path, "a.pdf", 100), "cv.pdf", "a" * 64)
+    publish(store, pdf(tmp_path, "b.pdf", 40), "cv.pdf", "b" * 64)
+    assert blobs(store) == ["b" * 64 + ".pdf"]
+    assert store.usage() == aggregate(store) == 40
+    # Still linked from another name: kept
+    publish(store, pdf(tmp_path, "b.pdf", 40), "other.pdf", "b" * 64)
+    publish(store, pdf(tmp_path, "c.pdf", 7), "cv.pdf", "c" * 64)
+    assert blobs(store) == ["b" * 64 + ".pdf", "c" * 64 + ".pdf"]
+    assert store.usage() == aggregate(store) == 47
+
+
+def test_plain_files_are_counted_and_replaced(store, tmp_path):
+    log = pdf(tmp_path, "error.log", 30)
+    asyncio.run(store.publish_file(log, "cv_error.log", "ada"))
+    asyncio.run(store.publish_file(pdf(tmp_path, "error2.log", 12), "cv_error.log", "ada"))
+    assert store.usage() == aggregate(store) == 12
+
+
+def test_cap_evicts_least_recently_used(store, tmp_path):
+    store.max_bytes = 250
+    paths = [publish(store, pdf(tmp_path, f"{n}.pdf", 100), f"{n}.pdf", str(n) * 64) for n in range(2)]
+    store.touch(path=paths[0])
+    time.sleep(0.01)
+    store.touch(artifact_id="0" * 64)
+    publish(store, pdf(tmp_path, "2.pdf", 100), "2.pdf", "2" * 64)
+    assert [os.path.basename(row["path"]) for row in store.list()] == ["2.pdf", "0.pdf"]
+    assert not os.path.exists(paths[1])
+    assert store.evicted == 1
+    assert store.usage() == aggregate(store) == 200
+    assert sorted(blobs(store)) == ["0" * 64 + ".pdf", "2" * 64 + ".pdf"]
+
+
+def test_sweep_expires_unused_files(store, tmp_path):
+    old = publish(store, pdf(tmp_path, "a.pdf", 100), "old.pdf", "a" * 64)
+    publish(store, pdf(tmp_path, "b.pdf", 50), "new.pdf", "b" * 64)
+    with sqlite3.connect(os.path.join(store.root, INDEX_NAME)) as connection:
+        connection.execute("UPDATE artifacts SET last_access = 0 WHERE path = ?", (old,))
+    store.ttl = 3600
+    store.sweep()
+    assert [os.path.basename(row["path"]) for row in store.list()] == ["new.pdf"]
+    assert not os.path.exists(old)
+    assert blobs(store) == ["b" * 64 + ".pdf"]
+    assert store.usage() == 50
+    assert store.stats() == {"bytes": 50, "evicted": 0, "expired": 1}
+
+
+def test_list_by_owner(store, tmp_path):
+    publish(store, pdf(tmp_path, "a.pdf", 10), "a.pdf", "a" * 64, "ada")
+    publish(store, pdf(tmp_path, "b.pdf", 10), "b.pdf", "b" * 64, "bob")
+    assert [row["owner"] for row in store.list("ada")] == ["ada"]
+    assert sorted(row["owner"] for row in store.list()) == ["ada", "bob"]
+    assert store.list("nobody") == []
@@ -0,0 +1,115 @@
+from engine.texlog import LogParser, SourceMap, parse_log
+
+LOG = """This is pdfTeX, Version 3.141592653-2.6-1.40.25 (TeX Live 2023) (preloaded format=pdflatex)
+(./document.tex
+LaTeX2e <2022-11-01>
+./document.tex:12: Undefined control sequence.
+l.12 \\textbff
+              {Ada}
+Here is how much of TeX's memory you used:
+"""
+
+
+def feed_in_pieces(parser, text, size):
+    for start in range(0, len(text), size):
+        parser.feed(text[start:start + size])
+    parser.close()
+    return parser.error
+
+
+def test_file_line_error():
+    error = feed_in_pieces(LogParser(), LOG, len(LOG))
+    assert (error.file, error.line, error.message) == ("./document.tex", 12, "Undefined control sequence.")
+    assert error.context == "\\textbff"
+
+
+def test_result_does_not_depend_on_how_the_log_is_split():
+    for size in (1, 3, 17, 64):
+        error = feed_in_pieces(LogParser(), LOG, size)
+        assert (error.file, error.line, error.message, error.context) == (
+            "./document.tex", 12, "Undefined control sequence.", "\\textbff"
+        )
+
+
+def test_plain_error_takes_its_line_from_the_context():
+    error = feed_in_pieces(LogParser(), "! Missing $ inserted.\n<inserted text>\n$\nl.7 a_b\n", 5)
+    assert (error.file, error.line, error.message, error.context) == (None, 7, "Missing $ inserted.", "a_b")
+
+
+def test_only_the_first_error_is_kept():
+    parser = LogParser()
+    parser.feed(LOG + "./document.tex:20: Another error.\n")
+    assert parser.done
+    assert parser.error.line == 12
+
+
+def test_stops_looking_for_context_after_a_while():
+    parser = LogParser()
+    parser.feed("! Emergency stop.\n" + "noise\n" * 30)
+    assert parser.done
+    assert parser.error.line is None
+
+
+def test_clean_log_has_no_error():
+    assert feed_in_pieces(LogParser(), "Output written on document.pdf (1 page).\n", 8) is None
+
+
+def test_long_lines_are_cut():
+    parser = LogParser()
+    parser.feed("x" * 100000)
+    assert len(parser._partial) <= 4096
+
+
+def test_parse_log(tmp_path):
+    path = tmp_path / "document.log"
+    path.write_bytes(LOG.encode("utf-8") + b"\xff\xfe trailing bytes\n")
+    assert parse_log(str(path)).line == 12
+    assert parse_log(str(tmp_path / "missing.log")) is None
+
+
+def source_map():
+    code = ("\\documentclass{article}\n"
+            "\\begin{document}\n"
+            "\\name{Ada}\n"
+            "\\section{Experience}\n"
+            "\\entry{Lead}\n"
+            "\\item one\n"
+            "\\item two\n"
+            "  continued\n"
+            "\\entry{Engineer}\n"
+            "\\end{document}\n")
+    source = SourceMap(code)
+    name = code.index("\\name")
+    source.add(name, code.index("\n", name), "name")
+    start, end = code.index("\\entry"), code.index("\\end{document}")
+    source.add(start, end, "experience")
+    source.add_entries(start, end, "experience", "\\entry", "\\item")
+    return code, source
+
+
+def test_locate_picks_the_most_specific_label():
+    code, source = source_map()
+    assert source.locate(code, 3) == "name"
+    assert source.locate(code, 5) == "experience entry 1"
+    assert source.locate(code, 6) == "experience entry 1, item 1"
+    assert source.locate(code, 8) == "experience entry 1, item 2"
+    assert source.locate(code, 9) == "experience entry 2"
+    assert source.locate(code, 1) is None
+    assert source.locate(code, 4) is None
+    assert source.locate(code, 99) is None
+
+
+def test_locate_allows_setup_code_before_the_document():
+    code, source = source_map()
+    compiled = code.replace("\\begin{document}", "\\usepackage{draft}\n\\geometry{a4paper}\n\\begin{document}")
+    assert source.locate(compiled, 5) == "name"
+    assert source.locate(compiled, 8) == "experience entry 1, item 1"
+
+
+def test_replace_keeps_spans_in_step():
+    code, source = source_map()
+    start = code.index("\\section{Experience}")
+    source.replace(start, start + len("\\section{Experience}"), "\\section{Work}\n\\rule{1pt}", label="heading")
+    assert source.locate(source.latex_code, 3) == "name"
+    assert source.locate(source.latex_code, 5) == "heading"
+    assert source.locate(source.latex_code, 7) == "experience entry 1, item 1"
@@ -0,0 +1,58 @@
+from engine.texscan import TemplateAnalysis
+
+DOCUMENT = "\\documentclass{article}\n\\begin{document}\n%s\n\\end{document}\n"
+
+
+def test_well_formed_template_has_no_problems():
+    analysis = TemplateAnalysis(DOCUMENT % "\\section{Experience}\n\\begin{itemize}\\item x\\end{itemize}")
+    assert analysis.problems == []
+
+
+def test_escaped_and_commented_braces_are_ignored():
+    analysis = TemplateAnalysis(DOCUMENT % "\\{ 50\\% % an open { in a comment\n\\}")
+    assert analysis.problems == []
+
+
+def test_unmatched_closing_brace():
+    assert TemplateAnalysis(DOCUMENT % "x}").problems == ["unmatched } at line 3"]
+
+
+def test_brace_never_closed():
+    assert TemplateAnalysis(DOCUMENT % "\\textbf{x").problems == ["{ at line 3 is never closed"]
+
+
+def test_environment_closed_by_the_wrong_end():
+    analysis = TemplateAnalysis(DOCUMENT % "\\begin{itemize}\n\\end{enumerate}")
+    assert analysis.problems == ["\\end{enumerate} at line 4 closes \\begin{itemize} from line 3"]
+
+
+def test_end_without_begin():
+    analysis = TemplateAnalysis("\\begin{document}\n\\end{itemize}\n")
+    assert analysis.problems == [
+        "\\end{itemize} at line 2 closes \\begin{document} from line 1",
+    ]
+    analysis = TemplateAnalysis("\\end{itemize}\n\\begin{document}\\end{document}")
+    assert analysis.problems == ["\\end{itemize} at line 1 has no \\begin"]
+
+
+def test_environment_never_closed():
+    analysis = TemplateAnalysis("\\begin{document}\n\\begin{itemize}\n\\end{document}\n")
+    assert analysis.problems == [
+        "\\end{document} at line 3 closes \\begin{itemize} from line 2",
+        "\\begin{document} at line 1 is never closed",
+    ]
+
+
+def test_missing_document_environment():
+    assert TemplateAnalysis("\\documentclass{article}\n").problems == ["no \\begin{document}"]
+
+
+def test_commands_and_blocks():
+    code = DOCUMENT % "\\section{A}\n\\section {B {nested}}"
+    analysis = TemplateAnalysis(code)
+    assert len(analysis.commands["section"]) == 2
+    assert analysis.position("section") == code.index("\\section{A}")
+    start, end = analysis.block("section")
+    assert code[start:end] == "\\section{A}"
+    assert analysis.environment_start("document") == code.index("\\begin{document}")
+    assert analysis.position("subsection") is None
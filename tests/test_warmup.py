@@ -0,0 +1,89 @@
+import asyncio
+import subprocess
+
+from engine import warmup as warmup_module
+from engine.templates import TemplateRegistry
+from engine.warmup import Warmup
+
+
+class Prepared:
+    args = ["pdflatex", "document.tex"]
+    env = {}
+
+    class engine:
+        name = "pdflatex"
+
+
+class FakeFormatCache:
+    async def prepare_compile(self, name, code, document, tex_path, cwd):
+        return Prepared()
+
+
+class FakePool:
+    def __init__(self, calls, result=None):
+        self.calls = calls
+        self.result = result
+
+    async def compile(self, prepared, env, workspace, check=False):
+        self.calls.append("warm")
+        return self.result
+
+    async def run(self, args, cwd=None, env=None, check=False):
+        self.calls.append("cold")
+        return subprocess.CompletedProcess(args, 0)
+
+
+def registry(tmp_path):
+    (tmp_path / "a.tex").write_text("\\documentclass{article}\\begin{document}PlaceHolderName\\end{document}")
+    (tmp_path / "b.tex").write_text("\\documentclass{article}\\begin{document}PlaceHolderBody\\end{document}")
+    registry = TemplateRegistry(str(tmp_path))
+    registry.refresh()
+    return registry
+
+
+def patch(monkeypatch, calls):
+    monkeypatch.setattr(warmup_module, "format_cache", FakeFormatCache())
+    monkeypatch.setattr(warmup_module, "warm_pool", FakePool(calls))
+    monkeypatch.setattr(warmup_module, "compile_pool", FakePool(calls))
+
+
+async def warm_up(warmup, registry, **kwargs):
+    warmup.start(registry, **kwargs)
+    await asyncio.gather(*warmup._tasks.values())
+
+
+def test_warmup_primes_the_warm_pool(tmp_path, monkeypatch):
+    calls = []
+    patch(monkeypatch, calls)
+    warmup = Warmup(enabled=True)
+    asyncio.run(warm_up(warmup, registry(tmp_path)))
+    assert warmup.ready and not warmup.failed()
+    assert calls.count("warm") == 2
+
+
+def test_warmup_skips_the_warm_pool_when_the_service_does_not_use_it(tmp_path, monkeypatch):
+    calls = []
+    patch(monkeypatch, calls)
+    warmup = Warmup(enabled=True)
+    asyncio.run(warm_up(warmup, registry(tmp_path), warm_processes=False))
+    assert warmup.ready and not warmup.failed()
+    assert calls == ["cold", "cold"]
+
+
+def test_an_unexpected_error_is_recorded_against_its_template(tmp_path, monkeypatch):
+    calls = []
+    patch(monkeypatch, calls)
+
+    class BrokenFormatCache:
+        async def prepare_compile(self, name, code, document, tex_path, cwd):
+            if name.startswith("a"):
+                raise ValueError("bad template")
+            return Prepared()
+
+    monkeypatch.setattr(warmup_module, "format_cache", BrokenFormatCache())
+    warmup = Warmup(enabled=True)
+    asyncio.run(warm_up(warmup, registry(tmp_path)))
+    assert warmup.ready
+    assert warmup.failed() == ["a.tex"]
+    assert warmup.results["a.tex"]["error"] == "ValueError: bad template"
+    assert warmup.results["b.tex"]["ok"]